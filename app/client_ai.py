@@ -1,29 +1,144 @@
 import logging
-
-import openai
+from contextlib import asynccontextmanager
 
 from app.config import settings
+from app.services.metrics import OPENAI_REQUESTS, record_openai_usage, stage
+from app.services.rate_limit import openai_limiter
 
 logger = logging.getLogger(__name__)
 
-clientAI = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+SUMMARY_MODEL = "gpt-3.5-turbo"  # Используйте нужную модель
+SUMMARY_MAX_TOKENS = 2000  # Ограничение на выходные токены
+SUMMARY_TEMPERATURE = 0.7
+SYSTEM_PROMPT = "You are a helpful assistant that summarizes Telegram channel messages."
+SUMMARIZE_PROMPT = "Суммаризируй следующие сообщения:\n\n{text}"
+MERGE_PROMPT = ("Объедини следующие частичные суммаризации сообщений в одну связную суммаризацию "
+                "без повторов:\n\n{text}")
+# Текст для пользователя, если OpenAI так и не вернул суммаризацию
+SUMMARY_FAILED = "Не удалось получить суммаризацию."
+# Пауза после 429, если OpenAI не передал заголовок Retry-After
+DEFAULT_RETRY_AFTER = 1.0
+
+_client = None
+
+
+def get_openai_client():
+    """
+    Клиент OpenAI создается при первом обращении: импорт пакета openai занимает заметную часть
+    времени запуска, поэтому он выполняется при прогреве приложения, а не при импорте модуля
+    """
+    global _client
+    if _client is None:
+        import openai
+
+        # Повторы при 429 выполняет общий планировщик, встроенные повторы клиента отключены
+        _client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0)
+    return _client
+
+
+async def close_openai_client():
+    """Закрывает пул соединений клиента OpenAI"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+async def warm_openai_client():
+    """Открывает соединение с OpenAI заранее (TLS и пул соединений), не расходуя токены"""
+    client = get_openai_client()
+    await client.models.retrieve(SUMMARY_MODEL)
+
+
+def _retry_after(error) -> float:
+    try:
+        return float(error.response.headers.get("retry-after", DEFAULT_RETRY_AFTER))
+    except (AttributeError, TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """Ответ 429 после всех повторов в completion: повторять запрос выше по стеку не нужно"""
+    import openai
+
+    return isinstance(error, openai.RateLimitError)
+
+
+@asynccontextmanager
+async def completion(text: str, prompt: str, **kwargs):
+    """
+    Запрос к OpenAI через общий планировщик: учитываются лимиты запросов и токенов в минуту,
+    запросы разных пользователей обслуживаются по очереди. При 429 параллельность снижается,
+    запрос повторяется после паузы (до OPENAI_MAX_RETRIES раз). Слот планировщика и замер этапа
+    удерживаются до выхода из контекста: для потокового ответа — пока поток не прочитан или не закрыт.
+    """
+    import openai
+
+    client = get_openai_client()
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt.format(text=text)}
+    ]
+    # Приблизительная оценка токенов запроса: лимит TPM учитывает и max_tokens ответа
+    estimated_tokens = sum(len(message["content"]) for message in messages) // 3 + SUMMARY_MAX_TOKENS
+    for attempt in range(settings.OPENAI_MAX_RETRIES + 1):
+        async with openai_limiter.slot(tokens=estimated_tokens):
+            with stage("openai"):
+                try:
+                    response = await client.chat.completions.create(
+                        model=SUMMARY_MODEL,
+                        messages=messages,
+                        max_tokens=SUMMARY_MAX_TOKENS,
+                        temperature=SUMMARY_TEMPERATURE,
+                        **kwargs,
+                    )
+                except openai.RateLimitError as e:
+                    OPENAI_REQUESTS.labels("throttled").inc()
+                    openai_limiter.on_throttle(_retry_after(e))
+                    if attempt == settings.OPENAI_MAX_RETRIES:
+                        raise
+                    continue
+                except Exception:
+                    OPENAI_REQUESTS.labels("error").inc()
+                    raise
+                OPENAI_REQUESTS.labels("success").inc()
+                openai_limiter.on_success()
+                yield response
+                return
+
+
+async def create_completion(text: str, prompt: str, **kwargs):
+    """Непотоковый запрос к OpenAI, см. completion"""
+    async with completion(text, prompt, **kwargs) as response:
+        return response
+
+
+async def request_summary(text: str, prompt: str = SUMMARIZE_PROMPT) -> str:
+    """Передача запроса на OpenAI API. Ошибки API пробрасываются вызывающему коду"""
+    response = await create_completion(text, prompt)
+    record_openai_usage(response.usage)
+    return response.choices[0].message.content.strip()
 
 
 async def summarize_text(text: str) -> str:
     """Передача запроса на OpenAI API"""
     try:
-        response = await clientAI.chat.completions.create(
-            model="gpt-3.5-turbo",  # Используйте нужную модель
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that summarizes Telegram channel messages."},
-                {"role": "user", "content": f"Суммаризируй следующие сообщения:\n\n{text}"}
-            ],
-            max_tokens=2000,  # Ограничение на выходные токены
-            temperature=0.7,
-        )
-        summary = response.choices[0].message.content.strip()
-        return summary
+        return await request_summary(text)
     except Exception as e:
         logger.error(f"Ошибка при суммаризации: {e}")
-        return "Не удалось получить суммаризацию."
+        return SUMMARY_FAILED
+
 
+async def stream_summary(text: str, prompt: str = SUMMARIZE_PROMPT):
+    """Потоковый запрос на OpenAI API: по мере генерации возвращает фрагменты ответа"""
+    # Последний фрагмент потока содержит usage для учета токенов
+    async with completion(text, prompt, stream=True, stream_options={"include_usage": True}) as stream:
+        try:
+            async for chunk in stream:
+                if chunk.usage:
+                    record_openai_usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Если потребитель прервал поток, соединение закрывается до освобождения слота
+            await stream.close()
@@ -0,0 +1,298 @@
+"""
+Многопроцессный режим: несколько процессов-воркеров приложения на внутренних портах и диспетчер
+на общем порту. Диспетчер направляет все запросы одной сессии (по cookie) в один и тот же воркер,
+поэтому клиент Telegram пользователя, его кэши в памяти и фоновые задачи живут только в этом процессе.
+Общее состояние (сессии, кэш суммаризаций, архив сообщений, задачи, закрепленные источники)
+хранится в общей БД, для SQLite - в режиме WAL.
+
+Диспетчер может работать в нескольких процессах на одном порту (SO_REUSEPORT): ядро распределяет
+соединения между ними, а воркер сессии каждый процесс выбирает одинаково, по хэшу ID сессии.
+
+Запуск: python -m app.cluster --workers 4 --dispatchers 2 --port 8000
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import socket
+import subprocess
+import sys
+from typing import List, Optional
+
+import httpx
+import uvicorn
+from starlette.types import Receive, Scope, Send
+
+from app.config import settings
+from app.services.workers import session_owner
+
+logger = logging.getLogger(__name__)
+
+# Заголовки одного соединения, которые не передаются между диспетчером и воркером
+HOP_BY_HOP_HEADERS = {
+    b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization",
+    b"te", b"trailers", b"transfer-encoding", b"upgrade",
+}
+
+
+class WorkerProcess:
+    """Процесс-воркер: uvicorn с приложением на внутреннем порту"""
+
+    kind = "Воркер"
+
+    def __init__(self, index: int, count: int, port: int, app_path: str):
+        self.index = index
+        self.count = count
+        self.port = port
+        self.app_path = app_path
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self):
+        # Диспетчер перестает принимать соединения раньше воркеров, поэтому воркерам пауза draining не нужна
+        env = {**os.environ, "WORKER_ID": str(self.index), "WORKER_COUNT": str(self.count),
+               "SHUTDOWN_DRAIN_DELAY": "0"}
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "app.server", "--app", self.app_path, "--host", "127.0.0.1",
+             "--port", str(self.port), "--log-level", "warning"],
+            env=env,
+        )
+        logger.info(f"Запущен воркер {self.index} на порту {self.port} (pid {self.process.pid}).")
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def terminate(self):
+        """Сигнал плавной остановки: воркер дожидается начатых запросов и задач (SHUTDOWN_DRAIN_TIMEOUT)"""
+        if self.alive():
+            self.process.terminate()
+
+    def wait(self):
+        if self.process is None:
+            return
+        try:
+            # Два интервала: ожидание соединений uvicorn и остановка фоновых задач в lifespan
+            self.process.wait(timeout=2 * settings.SHUTDOWN_DRAIN_TIMEOUT + 10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class DispatcherProcess:
+    """Дополнительный процесс диспетчера на общем порту. Воркерами управляет только основной процесс"""
+
+    kind = "Диспетчер"
+
+    def __init__(self, index: int, argv: List[str]):
+        self.index = index
+        self.argv = argv
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self):
+        self.process = subprocess.Popen([sys.executable, "-m", "app.cluster", "--proxy-only", *self.argv])
+        logger.info(f"Запущен диспетчер {self.index} (pid {self.process.pid}).")
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def terminate(self):
+        if self.alive():
+            self.process.terminate()
+
+    def wait(self):
+        if self.process is None:
+            return
+        try:
+            self.process.wait(timeout=settings.SHUTDOWN_DRAIN_TIMEOUT + 10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class Dispatcher:
+    """
+    ASGI-приложение диспетчера. Запрос с cookie сессии передается воркеру-владельцу сессии,
+    запросы без сессии распределяются по кругу. Тела запросов и ответов передаются потоково (SSE, JSON).
+    Процессы из managed (воркеры и дополнительные диспетчеры) перезапускаются и останавливаются этим диспетчером.
+    """
+
+    def __init__(self, workers: List[WorkerProcess], session_cookie: str = "session",
+                 managed: Optional[list] = None):
+        self.workers = workers
+        self.managed = managed or []
+        self.session_cookie = session_cookie
+        self._round_robin = itertools.cycle(range(len(workers)))
+        self._client: Optional[httpx.AsyncClient] = None
+        self._monitor: Optional[asyncio.Task] = None
+
+    def _session_id(self, scope: Scope) -> Optional[str]:
+        """ID сессии из cookie без проверки подписи: подпись проверяет воркер, здесь нужен только ключ"""
+        for name, value in scope["headers"]:
+            if name != b"cookie":
+                continue
+            for part in value.decode("latin-1").split(";"):
+                key, _, cookie = part.strip().partition("=")
+                if key == self.session_cookie and cookie and cookie != "null":
+                    return cookie.rsplit(".", 2)[0]
+        return None
+
+    def worker_for(self, scope: Scope) -> WorkerProcess:
+        session_id = self._session_id(scope)
+        if session_id:
+            return self.workers[session_owner(session_id, len(self.workers))]
+        return self.workers[next(self._round_robin)]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._proxy(scope, receive, send)
+
+    async def _lifespan(self, receive: Receive, send: Send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._client = httpx.AsyncClient(timeout=None, limits=httpx.Limits(max_connections=None))
+                if self.managed:
+                    self._monitor = asyncio.create_task(self._restart_dead_workers())
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._monitor:
+                    self._monitor.cancel()
+                await self._client.aclose()
+                await asyncio.to_thread(self.stop_workers)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def stop_workers(self):
+        """
+        Останавливает воркеры и дополнительные диспетчеры при остановке основного диспетчера. Выполняется
+        в lifespan: после него uvicorn повторно поднимает перехваченный сигнал, и код после run может не выполниться
+        """
+        # Сигнал получают все процессы сразу, чтобы они останавливались одновременно
+        for process in self.managed:
+            process.terminate()
+        for process in self.managed:
+            process.wait()
+
+    async def _restart_dead_workers(self):
+        while True:
+            await asyncio.sleep(1)
+            for process in self.managed:
+                if not process.alive():
+                    logger.error(f"{process.kind} {process.index} завершился, перезапуск.")
+                    process.start()
+
+    async def _proxy(self, scope: Scope, receive: Receive, send: Send):
+        worker = self.worker_for(scope)
+
+        async def body():
+            while True:
+                message = await receive()
+                if message["type"] != "http.request":
+                    return
+                yield message.get("body", b"")
+                if not message.get("more_body"):
+                    return
+
+        # Без тела запрос передается без него, иначе httpx отправил бы пустое тело частями (chunked)
+        has_body = any(name in (b"content-length", b"transfer-encoding") for name, _ in scope["headers"])
+        headers = [(name, value) for name, value in scope["headers"] if name.lower() not in HOP_BY_HOP_HEADERS]
+        if scope.get("client"):
+            headers.append((b"x-forwarded-for", scope["client"][0].encode("latin-1")))
+        request = self._client.build_request(
+            scope["method"],
+            httpx.URL(scheme="http", host="127.0.0.1", port=worker.port,
+                      path=scope["raw_path"].decode("latin-1") if scope.get("raw_path") else scope["path"],
+                      query=scope["query_string"] or None),
+            headers=headers,
+            content=body() if has_body else None,
+        )
+        try:
+            response = await self._client.send(request, stream=True)
+        except httpx.TransportError as e:
+            logger.error(f"Воркер {worker.index} недоступен: {e}")
+            await send({"type": "http.response.start", "status": 503,
+                        "headers": [(b"content-type", b"text/plain; charset=utf-8")]})
+            await send({"type": "http.response.body", "body": "Сервис временно недоступен".encode("utf-8")})
+            return
+
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [(name, value) for name, value in response.headers.raw
+                            if name.lower() not in HOP_BY_HOP_HEADERS],
+            })
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
+
+
+async def create_tables():
+    """Таблицы создаются один раз до запуска воркеров, чтобы процессы не создавали их одновременно"""
+    from app import models  # noqa: F401 - регистрация моделей в метаданных
+    from app.database import Base, async_engine
+
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    # Соединения пула привязаны к циклу событий, который завершится вместе с asyncio.run
+    await async_engine.dispose()
+
+
+def bind_shared_socket(host: str, port: int) -> socket.socket:
+    """Сокет общего порта с SO_REUSEPORT: его открывает каждый процесс диспетчера"""
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    return sock
+
+
+def serve(dispatcher: Dispatcher, host: str, port: int, shared: bool):
+    config = uvicorn.Config(dispatcher, host=host, port=port, log_level="warning",
+                            timeout_graceful_shutdown=int(settings.SHUTDOWN_DRAIN_TIMEOUT))
+    server = uvicorn.Server(config)
+    server.run(sockets=[bind_shared_socket(host, port)] if shared else None)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Запуск приложения в нескольких процессах")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="количество процессов-воркеров")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--base-port", type=int, default=settings.WORKER_BASE_PORT,
+                        help="внутренний порт первого воркера, остальные занимают следующие порты")
+    parser.add_argument("--app", default="app.main:app", help="ASGI-приложение воркера")
+    parser.add_argument("--dispatchers", type=int, default=1,
+                        help="процессов диспетчера на общем порту (SO_REUSEPORT, только Linux и BSD)")
+    parser.add_argument("--proxy-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    # Каждый проксируемый запрос иначе попадал бы в лог
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    workers = [WorkerProcess(index, args.workers, args.base_port + index, args.app) for index in range(args.workers)]
+    shared = args.dispatchers > 1 or args.proxy_only
+    if args.proxy_only:
+        # Дополнительный диспетчер только проксирует запросы, процессами управляет основной
+        serve(Dispatcher(workers), args.host, args.port, shared)
+        return
+
+    asyncio.run(create_tables())
+    for worker in workers:
+        worker.start()
+    proxy_argv = ["--workers", str(args.workers), "--host", args.host, "--port", str(args.port),
+                  "--base-port", str(args.base_port)]
+    dispatchers = [DispatcherProcess(index, proxy_argv) for index in range(1, args.dispatchers)]
+    for process in dispatchers:
+        process.start()
+    dispatcher = Dispatcher(workers, managed=[*dispatchers, *workers])
+    try:
+        serve(dispatcher, args.host, args.port, shared)
+    finally:
+        dispatcher.stop_workers()
+
+
+if __name__ == "__main__":
+    main()
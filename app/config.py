@@ -1,3 +1,5 @@
+from typing import Optional
+
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -9,9 +11,75 @@ class Settings(BaseSettings):
     API_HASH: str
     SESSION_SECRET_KEY: str
     DATABASE_URL: str = "sqlite:///./telegram_summary.db"
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_CACHE_SIZE_KB: int = 65536
     OPENAI_API_KEY: str
     SECRET_KEY: str
     SESSION_NAME: str
+    CLIENT_POOL_SIZE: int = 100
+    CLIENT_POOL_IDLE_TTL: int = 900
+    CLIENT_POOL_MAX_CONNECTS: int = 10
+    DIALOG_CACHE_TTL: int = 600
+    DASHBOARD_FIRST_SCREEN: int = 20
+    SESSION_CACHE_SIZE: int = 1000
+    SESSION_MAX_AGE: int = 14 * 24 * 60 * 60
+    SESSION_REFRESH_INTERVAL: int = 24 * 60 * 60
+    SESSION_CLEANUP_INTERVAL: int = 60 * 60
+    SUMMARY_CONCURRENCY: int = 5
+    SUMMARY_MAX_RETRIES: int = 3
+    SUMMARY_RETRY_BACKOFF: float = 1.0
+    SUMMARY_CONTEXT_TOKENS: int = 16385
+    SUMMARY_CHUNK_TOKENS: Optional[int] = None
+    SUMMARY_CACHE_TTL: int = 7 * 24 * 60 * 60
+    SUMMARY_CACHE_MAX_ENTRIES: int = 10000
+    ROLLING_SUMMARY_INITIAL_LIMIT: int = 100
+    JOB_WORKERS: int = 4
+    FETCH_CONCURRENCY: int = 4
+    FETCH_RANGE_SIZE: int = 500
+    METRICS_TIMING_HEADER: bool = False
+    TELEGRAM_ACCOUNT_RATE: float = 10.0
+    TELEGRAM_ACCOUNT_BURST: float = 20.0
+    TELEGRAM_ACCOUNT_CONCURRENCY: int = 8
+    TELEGRAM_GLOBAL_RATE: float = 200.0
+    TELEGRAM_GLOBAL_BURST: float = 400.0
+    TELEGRAM_GLOBAL_CONCURRENCY: int = 64
+    OPENAI_RPM: int = 500
+    OPENAI_TPM: int = 200000
+    OPENAI_BURST_SECONDS: float = 10.0
+    OPENAI_CONCURRENCY: int = 16
+    OPENAI_MAX_RETRIES: int = 3
+    DIGEST_MAX_SOURCES: int = 50
+    MESSAGE_PAGE_SIZE: int = 50
+    MESSAGE_PAGE_MAX: int = 1000
+    MESSAGE_PAGE_CACHE_SIZE: int = 200
+    MESSAGE_PAGE_CACHE_TTL: int = 300
+    MESSAGE_PAGE_STREAM_THRESHOLD: int = 200
+    PIN_TIMEZONE: str = "UTC"
+    PIN_PRECOMPUTE_WINDOW: int = 60 * 60
+    PIN_POLL_INTERVAL: int = 30
+    PIN_CONCURRENCY: int = 2
+    PIN_RETRY_DELAY: int = 15 * 60
+    PIN_MAX_AGE: int = 24 * 60 * 60
+    PIN_MAX_PER_USER: int = 20
+    WORKER_ID: int = 0
+    WORKER_COUNT: int = 1
+    WORKER_BASE_PORT: int = 8100
+    DEDUP_ENABLED: bool = True
+    DEDUP_THRESHOLD: float = 0.8
+    EXTRACTIVE_BUDGET_TOKENS: int = 0
+    EXTRACTIVE_SUMMARY_SENTENCES: int = 10
+    SUMMARY_OFFLINE_FALLBACK: bool = True
+    WARMUP_OPENAI: bool = True
+    WARMUP_SESSIONS: int = 20
+    WARMUP_SESSION_WINDOW: int = 24 * 60 * 60
+    WARMUP_TIMEOUT: float = 30.0
+    SESSION_TOUCH_INTERVAL: int = 5 * 60
+    SHUTDOWN_DRAIN_TIMEOUT: float = 30.0
+    SHUTDOWN_DRAIN_DELAY: float = 5.0
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
@@ -1,30 +1,85 @@
+import time
+
+# Точка отсчета времени запуска: импорт зависимостей приложения входит в замер
+_import_started = time.perf_counter()
+
+import asyncio
 import logging
 import os
-import uvicorn
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from starlette.middleware.sessions import SessionMiddleware
 from fastapi.responses import HTMLResponse, RedirectResponse
 from starlette.staticfiles import StaticFiles
 from starlette.templating import Jinja2Templates
 from starlette.requests import Request
 
 
+from app.client_ai import close_openai_client
 from app.config import settings
-from app.database import Base, engine
+from app.database import Base, async_engine
 from app.routers import router
+from app.server import run
+from app.services.client_pool import ClientLeaseMiddleware, client_pool
 from app.services.dependencies import get_current_user
+from app.services.jobs import job_manager
+from app.services.lifecycle import DrainMiddleware, lifecycle
+from app.services.metrics import TimingHeaderMiddleware, register_client_pool
+from app.services.pins import pin_scheduler
+from app.sessions import ServerSessionMiddleware, run_session_cleanup, session_store
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-Base.metadata.create_all(bind=engine)
+lifecycle.mark_started(_import_started)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Запуск: схема БД, прогрев соединений и фоновые сервисы. Остановка: новые запросы получают 503,
+    начатые запросы и задачи получают до SHUTDOWN_DRAIN_TIMEOUT секунд на завершение,
+    затем отключаются клиенты Telegram и закрываются пулы соединений
+    """
+    # В многопроцессном режиме схему заранее создает диспетчер, см. app/cluster.py
+    if settings.WORKER_COUNT == 1:
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    await lifecycle.startup()
+    await job_manager.start()
+    await pin_scheduler.start()
+    # Устаревшие сессии в общей БД удаляет один процесс
+    session_cleanup = asyncio.create_task(run_session_cleanup(session_store)) if settings.WORKER_ID == 0 else None
+    yield
+    if session_cleanup:
+        session_cleanup.cancel()
+    started = time.perf_counter()
+    remaining = await lifecycle.drain()
+    await asyncio.gather(job_manager.stop(remaining), pin_scheduler.stop(remaining))
+    await client_pool.close()
+    await close_openai_client()
+    await async_engine.dispose()
+    logger.info(f"Приложение остановлено за {time.perf_counter() - started:.2f} с.")
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 template_dir = os.path.join(os.path.dirname(__file__), "templates")
 templates = Jinja2Templates(directory=template_dir)
 
-app.add_middleware(SessionMiddleware, secret_key=os.getenv(settings.SECRET_KEY, "your_default_secret_key"))
+app.add_middleware(
+    ServerSessionMiddleware,
+    store=session_store,
+    secret_key=os.getenv(settings.SECRET_KEY, "your_default_secret_key"),
+    max_age=settings.SESSION_MAX_AGE,
+    refresh_interval=settings.SESSION_REFRESH_INTERVAL,
+)
+app.add_middleware(ClientLeaseMiddleware, pool=client_pool)
+if settings.METRICS_TIMING_HEADER:
+    app.add_middleware(TimingHeaderMiddleware)
+# Добавлен последним, поэтому выполняется первым: учитывает запрос целиком
+app.add_middleware(DrainMiddleware, tracker=lifecycle.requests)
+register_client_pool(client_pool)
 
 app.include_router(router)
 static_dir = os.path.join(os.path.dirname(__file__), 'static')
@@ -41,4 +96,4 @@ async def index(request: Request):
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    run(app, host="0.0.0.0", port=8000)
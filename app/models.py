@@ -1,8 +1,230 @@
-from sqlalchemy import Column, String
+import logging
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Column, DateTime, Index, Integer, String, Text, UniqueConstraint, event, text
 from .database import Base
 
+logger = logging.getLogger(__name__)
+
 
 class UserSession(Base):
     __tablename__ = "user_sessions"
     session_id = Column(String, primary_key=True, index=True)
     session_data = Column(String)
+
+
+class UserSessionAccess(Base):
+    """
+    Последнее обращение к сессии: сессии без обращений дольше SESSION_MAX_AGE удаляются,
+    а клиенты недавно активных сессий при запуске подключаются заранее
+    """
+    __tablename__ = "user_session_access"
+    session_id = Column(String, primary_key=True)
+    accessed_at = Column(DateTime, nullable=False, index=True)
+
+
+class SummaryCacheEntry(Base):
+    __tablename__ = "summary_cache"
+    key = Column(String(64), primary_key=True)
+    summary = Column(Text, nullable=False)
+    size = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    accessed_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class SourceSummaryState(Base):
+    __tablename__ = "source_summary_states"
+    owner_id = Column(BigInteger, primary_key=True)
+    # Полный ID диалога (utils.get_peer_id)
+    entity_id = Column(BigInteger, primary_key=True)
+    last_message_id = Column(Integer, nullable=False, default=0)
+    summary = Column(Text, nullable=False, default="")
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class ArchivedMessage(Base):
+    __tablename__ = "archived_messages"
+    # Явный INTEGER PRIMARY KEY: на него ссылается полнотекстовый индекс. Неявный rowid таблицы
+    # с составным ключом может измениться при VACUUM, и индекс указывал бы на другие строки
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    owner_id = Column(BigInteger, nullable=False)
+    peer_id = Column(BigInteger, nullable=False)
+    message_id = Column(Integer, nullable=False)
+    date = Column(DateTime, nullable=False)
+    text = Column(Text, nullable=False, default="")
+    sender_id = Column(BigInteger)
+
+    __table_args__ = (
+        UniqueConstraint("owner_id", "peer_id", "message_id", name="uq_archived_messages_message"),
+        Index("ix_archived_messages_peer_date", "owner_id", "peer_id", "date"),
+    )
+
+
+class ArchiveSpan(Base):
+    """Непрерывный диапазон ID сообщений, полностью сохраненный в архиве"""
+    __tablename__ = "archive_spans"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    owner_id = Column(BigInteger, nullable=False)
+    peer_id = Column(BigInteger, nullable=False)
+    first_id = Column(Integer, nullable=False)
+    last_id = Column(Integer, nullable=False)
+
+    __table_args__ = (Index("ix_archive_spans_peer", "owner_id", "peer_id"),)
+
+
+class SummaryJob(Base):
+    __tablename__ = "summary_jobs"
+    id = Column(String(32), primary_key=True)
+    session_id = Column(String, nullable=False, index=True)
+    source = Column(String, nullable=False)
+    summary_type = Column(String, nullable=False)
+    period_start = Column(String)
+    period_end = Column(String)
+    dedup_key = Column(String(64), nullable=False, index=True)
+    status = Column(String(16), nullable=False, default="queued", index=True)
+    result = Column(Text)
+    error = Column(Text)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    # Не больше одной незавершенной задачи с одним ключом, даже при одновременной постановке
+    __table_args__ = (
+        Index(
+            "uq_summary_jobs_in_flight", "dedup_key", unique=True,
+            sqlite_where=text("status IN ('queued', 'running')"),
+            postgresql_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+
+class PinnedSource(Base):
+    """Закрепленный источник: суммаризация готовится заранее к указанному времени"""
+    __tablename__ = "pinned_sources"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # Аккаунт Telegram владельца: ID сессии меняется при каждом входе, а закрепления остаются.
+    # NULL только у закреплений прежнего формата, владелец определяется по их сессии (pins.attach_pins)
+    owner_id = Column(BigInteger, index=True)
+    # Сессия, от имени которой готовится суммаризация. При входе закрепления переносятся на новую сессию,
+    # NULL - у владельца нет действующей сессии и подготовка приостановлена до следующего входа
+    session_id = Column(String, index=True)
+    source = Column(String, nullable=False)
+    title = Column(String, nullable=False, default="")
+    summary_type = Column(String, nullable=False)
+    schedule_time = Column(String(5), nullable=False)  # ЧЧ:ММ в часовом поясе PIN_TIMEZONE
+    next_run_at = Column(DateTime, nullable=False, index=True)
+    summary = Column(Text)
+    error = Column(Text)
+    computed_at = Column(DateTime)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("owner_id", "source", "summary_type", name="uq_pinned_sources_owner_source"),
+    )
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_missing_indexes(target, connection, **kw):
+    """create_all не добавляет новые индексы в уже существующие таблицы"""
+    for table in target.sorted_tables:
+        for index in table.indexes:
+            try:
+                with connection.begin_nested():
+                    index.create(connection, checkfirst=True)
+            except Exception as e:
+                logger.warning(f"Не удалось создать индекс {index.name}: {e}")
+
+
+# Полнотекстовый индекс по архиву сообщений (только для SQLite с поддержкой FTS5). Таблица FTS5
+# с внешним содержимым: текст хранится только в archived_messages, индекс связан с ней по id
+# и обновляется триггерами, поэтому удаление и вставка сообщения стоят O(log n), а не просмотр индекса
+ARCHIVE_FTS_TRIGGERS = ("archived_messages_fts_insert", "archived_messages_fts_delete", "archived_messages_fts_update")
+ARCHIVE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS archived_messages_fts USING fts5("
+    "text, content='archived_messages', content_rowid='id', tokenize='unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS archived_messages_fts_insert AFTER INSERT ON archived_messages BEGIN "
+    "INSERT INTO archived_messages_fts (rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER IF NOT EXISTS archived_messages_fts_delete AFTER DELETE ON archived_messages BEGIN "
+    "INSERT INTO archived_messages_fts (archived_messages_fts, rowid, text) "
+    "VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER IF NOT EXISTS archived_messages_fts_update AFTER UPDATE ON archived_messages BEGIN "
+    "INSERT INTO archived_messages_fts (archived_messages_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+    "INSERT INTO archived_messages_fts (rowid, text) VALUES (new.id, new.text); END",
+]
+
+
+def _drop_archive_fts(connection):
+    for trigger in ARCHIVE_FTS_TRIGGERS:
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+    connection.exec_driver_sql("DROP TABLE IF EXISTS archived_messages_fts")
+
+
+@event.listens_for(Base.metadata, "before_create")
+def migrate_archived_messages(target, connection, **kw):
+    """
+    Архив прежнего формата (составной первичный ключ без столбца id) переносится в новую таблицу.
+    Индекс FTS удаляется и заполняется заново в create_archive_fts
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    columns = [row[1] for row in connection.exec_driver_sql("PRAGMA table_info(archived_messages)")]
+    if not columns or "id" in columns:
+        return
+    logger.info("Перенос архива сообщений в таблицу с суррогатным ключом id.")
+    _drop_archive_fts(connection)
+    connection.exec_driver_sql("ALTER TABLE archived_messages RENAME TO archived_messages_legacy")
+    connection.exec_driver_sql("DROP INDEX IF EXISTS ix_archived_messages_peer_date")
+    ArchivedMessage.__table__.create(connection)
+    connection.exec_driver_sql(
+        "INSERT INTO archived_messages (owner_id, peer_id, message_id, date, text, sender_id) "
+        "SELECT owner_id, peer_id, message_id, date, text, sender_id FROM archived_messages_legacy"
+    )
+    connection.exec_driver_sql("DROP TABLE archived_messages_legacy")
+
+
+@event.listens_for(Base.metadata, "before_create")
+def migrate_pinned_sources(target, connection, **kw):
+    """
+    Закрепления прежнего формата (по ID сессии, без владельца) переносятся в новую таблицу.
+    Владелец им назначается при следующем обращении из их сессии
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    columns = [row[1] for row in connection.exec_driver_sql("PRAGMA table_info(pinned_sources)")]
+    if not columns or "owner_id" in columns:
+        return
+    logger.info("Перенос закрепленных источников в таблицу с владельцем.")
+    connection.exec_driver_sql("ALTER TABLE pinned_sources RENAME TO pinned_sources_legacy")
+    for index in PinnedSource.__table__.indexes:
+        connection.exec_driver_sql(f"DROP INDEX IF EXISTS {index.name}")
+    PinnedSource.__table__.create(connection)
+    fields = ("id, session_id, source, title, summary_type, schedule_time, next_run_at, "
+              "summary, error, computed_at, created_at")
+    connection.exec_driver_sql(f"INSERT INTO pinned_sources ({fields}) SELECT {fields} FROM pinned_sources_legacy")
+    connection.exec_driver_sql("DROP TABLE pinned_sources_legacy")
+
+
+@event.listens_for(Base.metadata, "after_create")
+def drop_session_activity(target, connection, **kw):
+    """Время обращения сессий хранилось и в таблице session_activity, теперь только в user_session_access"""
+    connection.exec_driver_sql("DROP TABLE IF EXISTS session_activity")
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_archive_fts(target, connection, **kw):
+    """
+    Создает индекс при создании схемы. Индекс прежнего формата (с копией текста и столбцами
+    owner_id, peer_id, message_id или связанный с archived_messages по rowid) заменяется
+    и заполняется заново из archived_messages
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    existing = connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'archived_messages_fts'"
+    ).scalar()
+    if existing and "content_rowid='id'" not in existing:
+        _drop_archive_fts(connection)
+        existing = None
+    for statement in ARCHIVE_FTS_DDL:
+        connection.exec_driver_sql(statement)
+    if not existing:
+        connection.exec_driver_sql("INSERT INTO archived_messages_fts (archived_messages_fts) VALUES ('rebuild')")
@@ -1,26 +1,55 @@
 import json
 import os
 import logging
-from typing import Optional
-from fastapi import APIRouter, Request, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
+from typing import List, Optional
+from fastapi import APIRouter, Request, Form, HTTPException
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from telethon import functions, types
-from urllib.parse import unquote
+from telethon import functions, types, utils
+from urllib.parse import unquote, urlencode
 
-from app.services.dashboard import get_dialogs_info, sort_dialogs, get_dialog_filters
-from app.services.dependencies import get_current_user, get_messages
+from app.services.archive import search_archive
+from app.services.client_pool import client_pool
+from app.services.dashboard import get_dialogs_info, get_folders, stream_dashboard
+from app.services.dependencies import get_current_user
 from app.config import settings
-from app.services.summarize import get_entity_by_source, summarize_messages, get_messages_to_summarize
+from app.schemas import (
+    DigestRequest, DigestResult, MessagePage, PinnedSummary, SummarizeRequest, SummaryJobStatus
+)
+from app.services.digest import build_digest
+from app.services.jobs import job_manager
+from app.services.lifecycle import READY, lifecycle
+from app.services.message_pages import get_message_page, iter_page_json
+from app.services.pins import (
+    attach_pins, create_pin, delete_pin, find_precomputed, format_age, list_pins, run_pin_now
+)
+from app.services import metrics
+from app.services.summarize import (
+    SUMMARY_ENGINES, get_entity_by_source, summarize_messages, get_messages_to_summarize, stream_summarize_messages
+)
+from app.services.rolling_summary import summarize_incrementally
+from app.services.summary_cache import request_key
+from app.services.workers import owns_session
 from app.telegram_client import get_telegram_client
 
 
 logger = logging.getLogger(__name__)
 
 templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "templates"))
+templates.env.filters["age"] = format_age
 router = APIRouter()
 
 
+def precomputed_response(request: Request, pin, source: str, summary_type: str):
+    """Страница с заранее подготовленной суммаризацией и ссылкой на пересчет"""
+    return templates.TemplateResponse("summary_result.html", {
+        "request": request,
+        "summary": pin.summary,
+        "computed_at": pin.computed_at,
+        "fresh_url": f"/summarize/live?{urlencode({'source': source, 'summary_type': summary_type, 'fresh': 1})}",
+    })
+
+
 @router.get("/authenticate", response_class=HTMLResponse)
 async def authenticate_form(request: Request):
     """Отображение страницы авторизации пользователя и ввода номера телефона"""
@@ -40,6 +69,7 @@ async def authenticate_submit(request: Request, phone_number: str = Form(...)):
             settings=types.CodeSettings()
         ))
 
+        request.session.regenerate()
         request.session["temp_session"] = user_client.session.save()
         request.session["phone_number"] = phone_number
         request.session["phone_code_hash"] = send_code_response.phone_code_hash
@@ -79,13 +109,22 @@ async def complete_login_submit(request: Request, code: str = Form(...)):
 
         session_str = user_client.session.save()
 
+        # Новый ID сессии после входа: ID, известный до входа, не получает доступ к аккаунту
+        session_id = request.session.regenerate()
         request.session["session_str"] = session_str
+        # Закрепленные источники аккаунта готовятся дальше от имени новой сессии
+        await attach_pins(await user_client.get_peer_id("me"), session_id)
 
         request.session.pop("temp_session", None)
         request.session.pop("phone_number", None)
         request.session.pop("phone_code_hash", None)
 
-        await user_client.disconnect()
+        if owns_session(session_id):
+            await client_pool.adopt(session_str, user_client)
+        else:
+            # Запросы с новым ID сессии направляются другому воркеру, он подключит свой клиент.
+            # Клиент этого процесса был бы вторым подключением к тому же аккаунту
+            await user_client.disconnect()
         logger.info("Пользователь успешно авторизовался.")
         return RedirectResponse(url="/dashboard", status_code=303)
     except Exception as e:
@@ -101,26 +140,42 @@ async def dashboard(request: Request, sort_by: str = "participants"):
     if not user_client:
         return RedirectResponse(url="/authenticate")
 
-    all_channels, all_groups, all_private_chats = await get_dialogs_info(user_client)
+    return StreamingResponse(
+        render_dashboard(request, user_client, sort_by),
+        media_type="text/html",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-    sort_dialogs(all_channels, all_groups, all_private_chats, sort_by)
 
-    groups_with_channels, existing_filters = await get_dialog_filters(user_client)
+DASHBOARD_FRAGMENTS_MARKER = "<!-- dashboard-fragments -->"
 
-    request.session["channels"] = all_channels
-    request.session["groups"] = all_groups
-    request.session["private_chats"] = all_private_chats
 
-    return templates.TemplateResponse("dashboard.html", {
-        "request": request,
-        "channels": all_channels,
-        "groups": all_groups,
-        "private_chats": all_private_chats,
-        "groups_with_channels": groups_with_channels,
-        "filters": existing_filters,
-        "sort_by": sort_by,
-        "message": ""
-    })
+async def render_dashboard(request: Request, user_client, sort_by: str):
+    """
+    Потоковая отрисовка панели: страница с первым экраном диалогов отправляется сразу, остальные
+    диалоги и папки дописываются в конец страницы по мере загрузки и встают на свои места (fillSlot)
+    """
+    context = {"request": request, "sort_by": sort_by, "message": "", "fragments_marker": DASHBOARD_FRAGMENTS_MARKER}
+    tail = ""
+    async for event, data in stream_dashboard(user_client, sort_by, settings.DASHBOARD_FIRST_SCREEN):
+        if event == "folders":
+            groups_with_channels, existing_filters = data
+            context.update(groups_with_channels=groups_with_channels, filters=existing_filters)
+            yield render_fragment("folders", "dashboard_folders.html", context)
+            continue
+        channels, groups, private_chats = data
+        context.update(channels=channels, groups=groups, private_chats=private_chats, preview=event == "preview")
+        if tail:
+            yield render_fragment("dialogs", "dashboard_dialogs.html", context)
+            continue
+        page, tail = templates.get_template("dashboard.html").render(context).split(DASHBOARD_FRAGMENTS_MARKER)
+        yield page
+    yield tail
+
+
+def render_fragment(name: str, template_name: str, context: dict) -> str:
+    return (f'<template id="{name}-fragment">{templates.get_template(template_name).render(context)}</template>'
+            f"<script>fillSlot('{name}')</script>")
 
 
 @router.get("/last-messages/{channel_link}", response_class=HTMLResponse)
@@ -131,9 +186,14 @@ async def last_messages(request: Request, channel_link: str):
         return RedirectResponse(url="/authenticate")
     try:
         entity = await user_client.get_entity(channel_link)
-        messages = await get_messages(user_client, entity)
-        return templates.TemplateResponse("messages.html",
-                                          {"request": request, "channel": channel_link, "messages": messages})
+        page = await get_message_page(user_client, entity, limit=10)
+        return templates.TemplateResponse("messages.html", {
+            "request": request,
+            "channel": channel_link,
+            "peer_id": utils.get_peer_id(entity),
+            "messages": page.items,
+            "next_cursor": page.next_cursor,
+        })
     except Exception as e:
         logger.error(f"Ошибка при получении сообщений из канала {channel_link}: {e}")
 
@@ -147,12 +207,14 @@ async def last_group_messages(request: Request, group_id: int):
 
     try:
         entity = await user_client.get_entity(group_id)
-        messages = await get_messages(user_client, entity)
+        page = await get_message_page(user_client, entity, limit=10)
 
         return templates.TemplateResponse("messages.html", {
             "request": request,
             "chat_name": entity.title,
-            "messages": messages
+            "peer_id": utils.get_peer_id(entity),
+            "messages": page.items,
+            "next_cursor": page.next_cursor,
         })
     except Exception as e:
         logger.error(f"Ошибка при получении сообщений из группы {group_id}: {e}")
@@ -168,18 +230,42 @@ async def last_chat_messages(request: Request, chat_id: int):
 
     try:
         entity = await user_client.get_entity(chat_id)
-        messages = await get_messages(user_client, entity)
+        page = await get_message_page(user_client, entity, limit=10)
 
         return templates.TemplateResponse("messages.html", {
             "request": request,
             "chat_name": f"{entity.first_name or ''} {entity.last_name or ''}".strip(),
-            "messages": messages
+            "peer_id": utils.get_peer_id(entity),
+            "messages": page.items,
+            "next_cursor": page.next_cursor,
         })
     except Exception as e:
         logger.error(f"Ошибка при получении сообщений из чата {chat_id}: {e}")
         return RedirectResponse(url="/dashboard")
 
 
+@router.get("/api/messages/{peer_id}", response_model=MessagePage)
+async def messages_api(request: Request, peer_id: int, cursor: Optional[str] = None, limit: Optional[int] = None):
+    """
+    Сообщения диалога страницами от новых к старым. Для следующей страницы передается
+    next_cursor из предыдущего ответа; большие страницы сериализуются потоково.
+    """
+    user_client = await get_current_user(request)
+    if not user_client:
+        raise HTTPException(status_code=401, detail="Требуется авторизация.")
+    try:
+        entity = await user_client.get_entity(peer_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    try:
+        page = await get_message_page(user_client, entity, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(page.items) > settings.MESSAGE_PAGE_STREAM_THRESHOLD:
+        return StreamingResponse(iter_page_json(page), media_type="application/json")
+    return Response("".join(iter_page_json(page)), media_type="application/json")
+
+
 @router.get("/summarize", response_class=HTMLResponse)
 async def summarize_form(request: Request, channels: str = "", groups: str = "", private_chats: str = ""):
     """Форма суммаризации, где делается выбор канала для суммаризации и типа суммаризации (по дате или 10
@@ -206,12 +292,25 @@ async def summarize_submit(
         source: str = Form(...),
         summary_type: str = Form(...),
         period_start: Optional[str] = Form(None),
-        period_end: Optional[str] = Form(None)
+        period_end: Optional[str] = Form(None),
+        fresh: bool = Form(False),
+        engine: str = Form("openai")
 ):
-    """Роутер, формирующий сообщение для суммаризации и делающий запрос к OpenAI"""
+    """Роутер, формирующий сообщение для суммаризации и делающий запрос к OpenAI
+    (или локальную выжимку без OpenAI, если выбран engine="local")"""
     user_client = await get_current_user(request)
     if not user_client:
         return RedirectResponse(url="/authenticate")
+    if engine not in SUMMARY_ENGINES:
+        return templates.TemplateResponse(
+            "summarize_form.html", {"request": request, "message": "Ошибка: неизвестный способ суммаризации."}
+        )
+
+    # Подготовленная заранее суммаризация получена через OpenAI, поэтому для локальной не подходит
+    if not fresh and engine == "openai":
+        pin = await find_precomputed(await user_client.get_peer_id("me"), source, summary_type)
+        if pin:
+            return precomputed_response(request, pin, source, summary_type)
 
     try:
         source_id = int(source)
@@ -224,6 +323,22 @@ async def summarize_submit(
 
         logger.info(f"Получение сообщений из {entity.title if hasattr(entity, 'title') else 'неизвестного источника'}")
 
+        session_id = request.scope.get("session_id")
+        if summary_type == "period" and session_id and engine == "openai":
+            # Суммаризация за период может быть долгой, поэтому выполняется в фоновой задаче.
+            # Локальная выжимка быстрая и выполняется сразу
+            job_id = await job_manager.submit(session_id, SummarizeRequest(
+                source=source, summary_type=summary_type, period_start=period_start, period_end=period_end
+            ))
+            return RedirectResponse(url=f"/summarize/jobs/{job_id}", status_code=303)
+
+        if summary_type == "incremental":
+            final_summary = await summarize_incrementally(user_client, entity, engine)
+            return templates.TemplateResponse(
+                "summary_result.html",
+                {"request": request, "summary": final_summary}
+            )
+
         messages_to_summarize = await get_messages_to_summarize(user_client, entity, summary_type, period_start, period_end)
 
     except Exception as e:
@@ -232,7 +347,11 @@ async def summarize_submit(
             "summarize_form.html", {"request": request, "message": f"Ошибка: {e}"}
         )
 
-    final_summary = await summarize_messages(messages_to_summarize)
+    final_summary = await summarize_messages(
+        [message.text for message in messages_to_summarize],
+        cache_key=await request_key(user_client, entity, messages_to_summarize),
+        engine=engine,
+    )
 
     return templates.TemplateResponse(
         "summary_result.html",
@@ -240,10 +359,311 @@ async def summarize_submit(
     )
 
 
+def format_sse_event(event: str, data) -> str:
+    """Форматирует событие Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.get("/summarize/live", response_class=HTMLResponse)
+async def summarize_live(request: Request):
+    """Страница потоковой суммаризации: результат выводится по мере генерации"""
+    source = request.query_params.get("source", "")
+    summary_type = request.query_params.get("summary_type", "")
+    if not request.query_params.get("fresh") and request.query_params.get("engine", "openai") == "openai":
+        user_client = await get_current_user(request)
+        if user_client:
+            pin = await find_precomputed(await user_client.get_peer_id("me"), source, summary_type)
+            if pin:
+                return precomputed_response(request, pin, source, summary_type)
+    return templates.TemplateResponse("summary_result.html", {
+        "request": request,
+        "summary": "",
+        "stream_url": f"/summarize/stream?{urlencode(request.query_params)}"
+    })
+
+
+@router.get("/summarize/stream")
+async def summarize_stream(
+        request: Request,
+        source: str,
+        summary_type: str,
+        period_start: Optional[str] = None,
+        period_end: Optional[str] = None,
+        engine: str = "openai"
+):
+    """Потоковая суммаризация: прогресс по частям и фрагменты итогового текста передаются как Server-Sent Events"""
+    user_client = await get_current_user(request)
+
+    async def events():
+        yield format_sse_event("status", "Получение сообщений...")
+        if not user_client:
+            yield format_sse_event("error", "Требуется авторизация.")
+            return
+        if engine not in SUMMARY_ENGINES:
+            yield format_sse_event("error", "Ошибка: неизвестный способ суммаризации.")
+            return
+        try:
+            entity = await get_entity_by_source(user_client, int(source))
+            if not entity:
+                yield format_sse_event("error", "Ошибка: не удалось найти источник.")
+                return
+
+            if summary_type == "incremental":
+                yield format_sse_event("token", await summarize_incrementally(user_client, entity, engine))
+                yield format_sse_event("done", {})
+                return
+
+            messages_to_summarize = await get_messages_to_summarize(
+                user_client, entity, summary_type, period_start, period_end
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при получении сообщений: {e}")
+            yield format_sse_event("error", f"Ошибка: {e}")
+            return
+
+        yield format_sse_event("status", f"Суммаризация {len(messages_to_summarize)} сообщений...")
+        async for event, data in stream_summarize_messages(
+            [message.text for message in messages_to_summarize],
+            cache_key=await request_key(user_client, entity, messages_to_summarize),
+            engine=engine,
+        ):
+            yield format_sse_event(event, data)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/summarize/jobs/{job_id}", response_class=HTMLResponse)
+async def summary_job_page(request: Request, job_id: str):
+    """Страница результата фоновой суммаризации. Пока задача выполняется, страница обновляется автоматически"""
+    job_status = await job_manager.status(job_id, request.scope.get("session_id"))
+    if not job_status:
+        return RedirectResponse(url="/summarize")
+    if job_status.status == "done":
+        summary = job_status.result
+    elif job_status.status == "failed":
+        summary = f"Ошибка: {job_status.error}"
+    else:
+        summary = "Суммаризация выполняется, страница обновится автоматически..."
+    return templates.TemplateResponse("summary_result.html", {
+        "request": request,
+        "summary": summary,
+        "refresh": job_status.status in ("queued", "running")
+    })
+
+
+@router.post("/api/summarize/jobs", response_model=SummaryJobStatus, status_code=202)
+async def submit_summary_job(request: Request, summarize_request: SummarizeRequest):
+    """Постановка задачи суммаризации в фоновую очередь. Сразу возвращает ID задачи"""
+    user_client = await get_current_user(request)
+    session_id = request.scope.get("session_id")
+    if not user_client or not session_id:
+        raise HTTPException(status_code=401, detail="Требуется авторизация.")
+    # Фоновые задачи всегда суммаризируют через OpenAI (с локальной выжимкой, если он недоступен)
+    if summarize_request.engine != "openai":
+        raise HTTPException(status_code=400, detail="Фоновые задачи поддерживают только суммаризацию через OpenAI.")
+    job_id = await job_manager.submit(session_id, summarize_request)
+    return await job_manager.status(job_id, session_id)
+
+
+@router.get("/api/summarize/jobs/{job_id}", response_model=SummaryJobStatus)
+async def summary_job_status(request: Request, job_id: str):
+    """Статус и результат фоновой задачи суммаризации"""
+    job_status = await job_manager.status(job_id, request.scope.get("session_id"))
+    if not job_status:
+        raise HTTPException(status_code=404, detail="Задача не найдена.")
+    return job_status
+
+
+@router.get("/search", response_class=HTMLResponse)
+async def search_messages(request: Request, q: str = ""):
+    """Полнотекстовый поиск по сообщениям, сохраненным в локальном архиве"""
+    user_client = await get_current_user(request)
+    if not user_client:
+        return RedirectResponse(url="/authenticate")
+
+    results = []
+    if q.strip():
+        for result in await search_archive(user_client, q):
+            real_id, peer_type = utils.resolve_id(result.peer_id)
+            link = f"/last-messages/chat/{real_id}" if peer_type is types.PeerUser else f"/last-messages/group/{result.peer_id}"
+            results.append({
+                "link": link,
+                "snippet": result.snippet,
+                "date": result.date.strftime("%Y-%m-%d %H:%M:%S")
+            })
+    return templates.TemplateResponse("search.html", {"request": request, "query": q, "results": results})
+
+
+@router.get("/digest", response_class=HTMLResponse)
+async def digest_form(request: Request):
+    """Форма дайджеста: выбор нескольких источников или папки диалогов"""
+    user_client = await get_current_user(request)
+    if not user_client:
+        return RedirectResponse(url="/authenticate")
+
+    return await render_digest_form(request, user_client)
+
+
+async def render_digest_form(request: Request, user_client, message: str = ""):
+    channels, groups, private_chats = await get_dialogs_info(user_client)
+    folders = await get_folders(user_client)
+    return templates.TemplateResponse("digest_form.html", {
+        "request": request,
+        "channels": channels,
+        "groups": groups,
+        "private_chats": private_chats,
+        "folders": folders,
+        "message": message
+    })
+
+
+@router.post("/digest", response_class=HTMLResponse)
+async def digest_submit(
+        request: Request,
+        sources: List[str] = Form([]),
+        folder_id: Optional[str] = Form(None),
+        summary_type: str = Form("last_10"),
+        period_start: Optional[str] = Form(None),
+        period_end: Optional[str] = Form(None),
+        engine: str = Form("openai")
+):
+    """Дайджест нескольких источников с разделом по каждому источнику"""
+    user_client = await get_current_user(request)
+    if not user_client:
+        return RedirectResponse(url="/authenticate")
+
+    try:
+        digest = await build_digest(user_client, DigestRequest(
+            sources=sources,
+            folder_id=int(folder_id) if folder_id else None,
+            summary_type=summary_type,
+            period_start=period_start,
+            period_end=period_end,
+            engine=engine,
+        ))
+    except Exception as e:
+        logger.error(f"Ошибка при построении дайджеста: {e}")
+        return await render_digest_form(request, user_client, f"Ошибка: {e}")
+    return templates.TemplateResponse("summary_result.html", {"request": request, "summary": digest.digest})
+
+
+@router.post("/api/digest", response_model=DigestResult)
+async def digest_api(request: Request, digest_request: DigestRequest):
+    """Дайджест нескольких источников в формате JSON"""
+    user_client = await get_current_user(request)
+    if not user_client:
+        raise HTTPException(status_code=401, detail="Требуется авторизация.")
+    try:
+        return await build_digest(user_client, digest_request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/pins", response_class=HTMLResponse)
+async def pins_page(request: Request, message: str = ""):
+    """Закрепленные источники: суммаризации готовятся заранее к указанному времени"""
+    user_client = await get_current_user(request)
+    session_id = request.scope.get("session_id")
+    if not user_client or not session_id:
+        return RedirectResponse(url="/authenticate")
+
+    owner_id = await user_client.get_peer_id("me")
+    await attach_pins(owner_id, session_id)
+    channels, groups, private_chats = await get_dialogs_info(user_client)
+    return templates.TemplateResponse("pins.html", {
+        "request": request,
+        "pins": await list_pins(owner_id),
+        "channels": channels,
+        "groups": groups,
+        "private_chats": private_chats,
+        "timezone": settings.PIN_TIMEZONE,
+        "message": message,
+    })
+
+
+@router.post("/pins", response_class=HTMLResponse)
+async def pins_submit(
+        request: Request,
+        source: str = Form(...),
+        summary_type: str = Form(...),
+        schedule_time: str = Form(...)
+):
+    """Закрепление источника с расписанием"""
+    user_client = await get_current_user(request)
+    session_id = request.scope.get("session_id")
+    if not user_client or not session_id:
+        return RedirectResponse(url="/authenticate")
+
+    try:
+        entity = await get_entity_by_source(user_client, int(source))
+        if not entity:
+            raise ValueError("не удалось найти источник.")
+        owner_id = await user_client.get_peer_id("me")
+        await attach_pins(owner_id, session_id)
+        await create_pin(owner_id, session_id, source, utils.get_display_name(entity), summary_type, schedule_time)
+    except ValueError as e:
+        return RedirectResponse(url=f"/pins?{urlencode({'message': f'Ошибка: {e}'})}", status_code=303)
+    return RedirectResponse(url="/pins", status_code=303)
+
+
+@router.post("/pins/{pin_id}/run")
+async def pins_run(request: Request, pin_id: int):
+    """Подготовка суммаризации закрепленного источника вне расписания"""
+    user_client = await get_current_user(request)
+    if not user_client:
+        return RedirectResponse(url="/authenticate")
+    await run_pin_now(await user_client.get_peer_id("me"), pin_id)
+    return RedirectResponse(url="/pins", status_code=303)
+
+
+@router.post("/pins/{pin_id}/delete")
+async def pins_delete(request: Request, pin_id: int):
+    """Открепление источника"""
+    user_client = await get_current_user(request)
+    if not user_client:
+        return RedirectResponse(url="/authenticate")
+    await delete_pin(await user_client.get_peer_id("me"), pin_id)
+    return RedirectResponse(url="/pins", status_code=303)
+
+
+@router.get("/api/pins", response_model=List[PinnedSummary])
+async def pins_api(request: Request):
+    """Закрепленные источники пользователя с заранее подготовленными суммаризациями"""
+    user_client = await get_current_user(request)
+    if not user_client:
+        raise HTTPException(status_code=401, detail="Требуется авторизация.")
+    return await list_pins(await user_client.get_peer_id("me"))
+
+
+@router.get("/health")
+async def health():
+    """
+    Готовность процесса для балансировщика: 503 до завершения запуска и во время остановки.
+    Фоновый прогрев (клиенты Telegram, соединение с OpenAI) на готовность не влияет, его состояние в warmed_up
+    """
+    return JSONResponse(
+        {"status": lifecycle.status, "warmed_up": lifecycle.warmed_up, "startup_seconds": lifecycle.timings},
+        status_code=200 if lifecycle.status == READY else 503,
+    )
+
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    """Метрики приложения в формате Prometheus"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 # Выход из системы
 @router.get("/logout", response_class=HTMLResponse)
 async def logout(request: Request):
     """Роутер выхода из системы"""
+    session_str = request.session.get("session_str")
+    if session_str:
+        await client_pool.release(session_str)
     request.session.clear()
     logger.info("Пользователь вышел из системы.")
     return RedirectResponse(url="/", status_code=303)
@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import Optional
+from datetime import datetime
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional
 
 
 class ChannelInfo(BaseModel):
@@ -8,6 +9,63 @@ class ChannelInfo(BaseModel):
 
 class SummarizeRequest(BaseModel):
     source: str
-    summary_type: str  # 'last_10' или 'period'
+    summary_type: str  # 'last_10', 'period' или 'incremental'
     period_start: Optional[str] = None
     period_end: Optional[str] = None
+    engine: str = "openai"  # 'openai' или 'local' (локальная выжимка без OpenAI)
+
+
+class SummaryJobStatus(BaseModel):
+    job_id: str
+    status: str  # 'queued', 'running', 'done' или 'failed'
+    result: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+
+class DigestRequest(BaseModel):
+    sources: List[str] = []  # полные ID диалогов (utils.get_peer_id), как в /api/messages/{peer_id}
+    folder_id: Optional[int] = None  # ID папки диалогов: в дайджест попадают все ее источники
+    summary_type: str = "last_10"  # 'last_10', 'period' или 'incremental'
+    period_start: Optional[str] = None
+    period_end: Optional[str] = None
+    engine: str = "openai"  # 'openai' или 'local' (локальная выжимка без OpenAI)
+
+
+class DigestSection(BaseModel):
+    source_id: int  # полный ID диалога
+    title: str
+    summary: Optional[str] = None
+    error: Optional[str] = None
+
+
+class DigestResult(BaseModel):
+    digest: str
+    sections: List[DigestSection]
+
+
+class MessageItem(BaseModel):
+    id: int
+    date: datetime
+    text: str
+    sender_id: Optional[int] = None
+
+
+class MessagePage(BaseModel):
+    items: List[MessageItem]
+    next_cursor: Optional[str] = None  # передается в параметре cursor для получения более старых сообщений
+
+
+class PinnedSummary(BaseModel):
+    id: int
+    source: str
+    title: str
+    summary_type: str
+    schedule_time: str
+    next_run_at: datetime
+    summary: Optional[str] = None
+    error: Optional[str] = None
+    computed_at: Optional[datetime] = None  # время подготовки суммаризации (UTC)
+
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,63 @@
+"""
+Запуск процесса приложения в uvicorn с плавной остановкой. По сигналу остановки процесс сначала
+SHUTDOWN_DRAIN_DELAY секунд продолжает принимать соединения: новые запросы получают 503, а `/health` -
+статус draining, чтобы балансировщик успел исключить процесс. Только затем uvicorn закрывает порт
+и ждет завершения начатых запросов.
+
+Запуск: python -m app.server --app app.main:app --host 0.0.0.0 --port 8000
+"""
+import argparse
+import logging
+import time
+from typing import List, Optional
+
+import uvicorn
+
+from app.config import settings
+from app.services.lifecycle import lifecycle
+
+logger = logging.getLogger(__name__)
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn.Server, который по первому сигналу остановки переводит приложение в режим draining"""
+
+    def __init__(self, config: uvicorn.Config):
+        super().__init__(config)
+        self.draining_since: Optional[float] = None
+
+    def handle_exit(self, sig, frame):
+        # Повторный сигнал останавливает сервер сразу, как обычно в uvicorn
+        if self.draining_since is not None or settings.SHUTDOWN_DRAIN_DELAY <= 0:
+            super().handle_exit(sig, frame)
+            return
+        self.draining_since = time.monotonic()
+        lifecycle.requests.start_draining()
+
+    async def on_tick(self, counter: int) -> bool:
+        if (self.draining_since is not None and not self.should_exit
+                and time.monotonic() - self.draining_since >= settings.SHUTDOWN_DRAIN_DELAY):
+            logger.info(f"Режим draining длился {settings.SHUTDOWN_DRAIN_DELAY} с, порт закрывается.")
+            self.should_exit = True
+        return await super().on_tick(counter)
+
+
+def run(app, host: str = "0.0.0.0", port: int = 8000, **kwargs):
+    """Запускает приложение (объект или строку импорта "модуль:атрибут") до сигнала остановки"""
+    config = uvicorn.Config(app, host=host, port=port,
+                            timeout_graceful_shutdown=int(settings.SHUTDOWN_DRAIN_TIMEOUT), **kwargs)
+    DrainingServer(config).run()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Запуск процесса приложения")
+    parser.add_argument("--app", default="app.main:app", help="ASGI-приложение")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    run(args.app, host=args.host, port=args.port, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, text
+from telethon import TelegramClient, utils
+
+from app.database import AsyncSessionLocal
+from app.models import ArchivedMessage, ArchiveSpan
+from app.services.fetcher import IdBoundaries, RangeFetcher
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StoredMessage:
+    """Сообщение из локального архива. Повторяет поля сообщения Telethon, которые использует приложение"""
+    id: int
+    peer_id: int
+    date: datetime
+    text: str
+    sender_id: Optional[int] = None
+
+
+@dataclass
+class PeriodPlan:
+    """План получения сообщений за период: диапазон ID (low, high] и источник данных"""
+    start: datetime
+    end: datetime
+    low: int
+    high: int
+    archived_span: Optional[Tuple[int, int]] = None
+    boundaries: Optional[IdBoundaries] = None
+
+
+@dataclass
+class SearchResult:
+    peer_id: int
+    message_id: int
+    date: datetime
+    snippet: str
+
+
+def _naive_utc(date: datetime) -> datetime:
+    if date.tzinfo is None:
+        return date
+    return date.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _to_stored(row: ArchivedMessage) -> StoredMessage:
+    return StoredMessage(
+        id=row.message_id,
+        peer_id=row.peer_id,
+        date=row.date.replace(tzinfo=timezone.utc),
+        text=row.text,
+        sender_id=row.sender_id,
+    )
+
+
+async def _fts_available(db) -> bool:
+    if db.bind.dialect.name != "sqlite":
+        return False
+    result = await db.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archived_messages_fts'")
+    )
+    return result.first() is not None
+
+
+async def _merge_span(db, owner_id: int, peer_id: int, first_id: int, last_id: int):
+    """Добавляет диапазон ID и объединяет его с пересекающимися диапазонами"""
+    overlapping = await db.scalars(select(ArchiveSpan).where(
+        ArchiveSpan.owner_id == owner_id,
+        ArchiveSpan.peer_id == peer_id,
+        ArchiveSpan.first_id <= last_id,
+        ArchiveSpan.last_id >= first_id,
+    ))
+    for span in overlapping.all():
+        first_id, last_id = min(first_id, span.first_id), max(last_id, span.last_id)
+        await db.delete(span)
+    db.add(ArchiveSpan(owner_id=owner_id, peer_id=peer_id, first_id=first_id, last_id=last_id))
+
+
+async def _ingest(owner_id: int, peer_id: int, rows: List[StoredMessage], span: Optional[Tuple[int, int]]):
+    rows = list({row.id: row for row in rows}.values())
+    async with AsyncSessionLocal() as db:
+        if rows:
+            # Вместо merge по одной строке: удаление старых версий и вставка пачкой за два запроса.
+            # Полнотекстовый индекс обновляют триггеры archived_messages, см. app/models.py
+            ids = [row.id for row in rows]
+            await db.execute(delete(ArchivedMessage).where(
+                ArchivedMessage.owner_id == owner_id,
+                ArchivedMessage.peer_id == peer_id,
+                ArchivedMessage.message_id.in_(ids),
+            ))
+            await db.execute(insert(ArchivedMessage), [
+                {
+                    "owner_id": owner_id,
+                    "peer_id": peer_id,
+                    "message_id": row.id,
+                    "date": _naive_utc(row.date),
+                    "text": row.text,
+                    "sender_id": row.sender_id,
+                }
+                for row in rows
+            ])
+        if span:
+            await _merge_span(db, owner_id, peer_id, *span)
+        await db.commit()
+
+
+async def _spans(owner_id: int, peer_id: int) -> List[Tuple[int, int]]:
+    async with AsyncSessionLocal() as db:
+        spans = await db.execute(select(ArchiveSpan.first_id, ArchiveSpan.last_id).where(
+            ArchiveSpan.owner_id == owner_id, ArchiveSpan.peer_id == peer_id
+        ).order_by(ArchiveSpan.last_id.desc()))
+        return [(span.first_id, span.last_id) for span in spans]
+
+
+async def _span_dates(owner_id: int, peer_id: int, first_id: int, last_id: int):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(func.min(ArchivedMessage.date), func.max(ArchivedMessage.date)).where(
+            ArchivedMessage.owner_id == owner_id,
+            ArchivedMessage.peer_id == peer_id,
+            ArchivedMessage.message_id.between(first_id, last_id),
+        ))
+        return result.one()
+
+
+async def _read(owner_id: int, peer_id: int, first_id: int, last_id: int, limit: Optional[int] = None,
+                start: Optional[datetime] = None, end: Optional[datetime] = None,
+                newest_first: bool = False) -> List[StoredMessage]:
+    query = select(ArchivedMessage).where(
+        ArchivedMessage.owner_id == owner_id,
+        ArchivedMessage.peer_id == peer_id,
+        ArchivedMessage.message_id.between(first_id, last_id),
+    )
+    if start:
+        query = query.where(ArchivedMessage.date >= _naive_utc(start))
+    if end:
+        query = query.where(ArchivedMessage.date < _naive_utc(end))
+    order = ArchivedMessage.message_id.desc() if newest_first else ArchivedMessage.message_id
+    query = query.order_by(order)
+    if limit:
+        query = query.limit(limit)
+    async with AsyncSessionLocal() as db:
+        rows = await db.scalars(query)
+        return [_to_stored(row) for row in rows]
+
+
+async def _id_bounds(owner_id: int, peer_id: int, first_id: int, last_id: int,
+                     start: datetime, end: datetime) -> Tuple[int, int]:
+    """Границы периода в ID по архиву: последнее сообщение до start и последнее сообщение до end"""
+    async with AsyncSessionLocal() as db:
+        async def last_before(date: datetime) -> Optional[int]:
+            return await db.scalar(select(func.max(ArchivedMessage.message_id)).where(
+                ArchivedMessage.owner_id == owner_id,
+                ArchivedMessage.peer_id == peer_id,
+                ArchivedMessage.message_id.between(first_id, last_id),
+                ArchivedMessage.date < _naive_utc(date),
+            ))
+
+        low = await last_before(start) or 0
+        high = await last_before(end) or low
+        return low, max(low, high)
+
+
+async def _search(owner_id: int, query: str, limit: int) -> List[SearchResult]:
+    # Каждое слово запроса берется в кавычки, чтобы спецсимволы не ломали синтаксис FTS5
+    match = " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+    if not match:
+        return []
+    async with AsyncSessionLocal() as db:
+        if not await _fts_available(db):
+            return []
+        result = await db.execute(text(
+            "SELECT m.peer_id, m.message_id, m.date, "
+            "snippet(archived_messages_fts, 0, '[', ']', '…', 16) AS snippet "
+            "FROM archived_messages_fts AS f "
+            "JOIN archived_messages AS m ON m.id = f.rowid "
+            "WHERE archived_messages_fts MATCH :match AND m.owner_id = :owner_id "
+            "ORDER BY rank LIMIT :limit"
+        ), {"match": match, "owner_id": owner_id, "limit": limit})
+        rows = result.all()
+    return [
+        SearchResult(
+            peer_id=row.peer_id,
+            message_id=row.message_id,
+            date=datetime.fromisoformat(str(row.date)).replace(tzinfo=timezone.utc),
+            snippet=row.snippet,
+        )
+        for row in rows
+    ]
+
+
+def _from_telegram(peer_id: int, message) -> StoredMessage:
+    return StoredMessage(
+        id=message.id,
+        peer_id=peer_id,
+        date=message.date,
+        text=message.text or "",
+        sender_id=message.sender_id,
+    )
+
+
+class MessageArchive:
+    """
+    Локальный архив сообщений. Чтение идет из архива, а в Telegram запрашиваются только
+    отсутствующие участки. Полностью сохраненные участки истории учитываются диапазонами ID (ArchiveSpan).
+    """
+
+    def __init__(self, user_client: TelegramClient, entity):
+        self.user_client = user_client
+        self.entity = entity
+        self.peer_id = utils.get_peer_id(entity)
+        self.owner_id: Optional[int] = None
+
+    async def _owner(self) -> int:
+        if self.owner_id is None:
+            self.owner_id = await self.user_client.get_peer_id("me")
+        return self.owner_id
+
+    async def ingest(self, messages, span: Optional[Tuple[int, int]] = None) -> List[StoredMessage]:
+        """Сохраняет сообщения Telegram в архив и отмечает диапазон span как полностью загруженный"""
+        rows = [_from_telegram(self.peer_id, message) for message in messages]
+        await _ingest(await self._owner(), self.peer_id, rows, span)
+        return rows
+
+    async def refresh_head(self) -> Optional[Tuple[int, int]]:
+        """Догружает сообщения новее самого свежего сохраненного диапазона. Возвращает обновленный диапазон"""
+        owner_id = await self._owner()
+        spans = await _spans(owner_id, self.peer_id)
+        if not spans:
+            return None
+        first_id, last_id = spans[0]
+        _, newest = await self._load_after(last_id)
+        return first_id, newest
+
+    async def _load_after(self, min_id: int) -> Tuple[List[StoredMessage], int]:
+        """
+        Загружает в архив все сообщения новее min_id через RangeFetcher и отмечает диапазон загруженным.
+        Возвращает сохраненные сообщения и ID самого нового из них
+        """
+        fetcher = RangeFetcher(self.user_client, self.entity)
+        newest = max(await fetcher.newest_id(), min_id)
+        rows = []
+        async for batch in fetcher.fetch(min_id, newest):
+            rows.extend(await self.ingest(batch))
+        # Диапазон отмечается только после того, как сохранены все пачки
+        await self.ingest([], span=(min_id, newest))
+        return rows, newest
+
+    async def recent(self, limit: int) -> List[StoredMessage]:
+        """Последние limit сообщений (от новых к старым)"""
+        owner_id = await self._owner()
+        spans = await _spans(owner_id, self.peer_id)
+        if spans:
+            _, last_id = spans[0]
+            fresh = [message async for message in self.user_client.iter_messages(
+                self.entity, min_id=last_id, limit=limit
+            )]
+            ids = [message.id for message in fresh]
+            # Если новых сообщений меньше limit, они примыкают к сохраненному диапазону
+            span = (last_id, max(ids, default=last_id)) if len(fresh) < limit else (min(ids), max(ids))
+        else:
+            fresh = [message async for message in self.user_client.iter_messages(self.entity, limit=limit)]
+            ids = [message.id for message in fresh]
+            span = (0 if len(fresh) < limit else min(ids), max(ids, default=0))
+        await self.ingest(fresh, span=span)
+
+        head = span[1]
+        spans = await _spans(owner_id, self.peer_id)
+        first_id, last_id = next((s for s in spans if s[0] <= head <= s[1]), (head, head))
+        rows = await _read(owner_id, self.peer_id, first_id, last_id, limit, None, None, True)
+        if len(rows) < limit and first_id > 0:
+            offset_id = rows[-1].id if rows else last_id + 1
+            older = [message async for message in self.user_client.iter_messages(
+                self.entity, offset_id=offset_id, limit=limit - len(rows)
+            )]
+            lower = 0 if len(older) < limit - len(rows) else min(message.id for message in older)
+            rows += await self.ingest(older, span=(lower, offset_id))
+        return rows
+
+    async def before(self, offset_id: int, limit: int) -> List[StoredMessage]:
+        """limit сообщений с ID меньше offset_id (от новых к старым). Недостающие догружаются из Telegram"""
+        owner_id = await self._owner()
+        spans = await _spans(owner_id, self.peer_id)
+        upper = offset_id - 1
+        span = next((s for s in spans if s[0] <= upper <= s[1]), None)
+        rows = await _read(owner_id, self.peer_id, span[0], upper, limit, None, None, True) if span else []
+        if len(rows) < limit and (span is None or span[0] > 0):
+            next_offset = rows[-1].id if rows else offset_id
+            older = [message async for message in self.user_client.iter_messages(
+                self.entity, offset_id=next_offset, limit=limit - len(rows)
+            )]
+            lower = 0 if len(older) < limit - len(rows) else min(message.id for message in older)
+            # Диапазон пересекается с уже сохраненным, только если граница сама есть в архиве
+            rows += await self.ingest(older, span=(lower, next_offset if rows else upper))
+        return rows
+
+    async def since(self, min_id: int) -> List[StoredMessage]:
+        """Все сообщения с ID больше min_id (от старых к новым)"""
+        owner_id = await self._owner()
+        spans = await _spans(owner_id, self.peer_id)
+        if spans and spans[0][0] <= min_id:
+            first_id, last_id = await self.refresh_head()
+            return await _read(owner_id, self.peer_id, min_id + 1, last_id)
+        rows, _ = await self._load_after(min_id)
+        return sorted(rows, key=lambda row: row.id)
+
+    async def plan_period(self, start: datetime, end: datetime) -> PeriodPlan:
+        """Определяет, откуда брать сообщения за период [start, end): из архива или из Telegram"""
+        owner_id = await self._owner()
+        spans = await _spans(owner_id, self.peer_id)
+        for index, (first_id, last_id) in enumerate(spans):
+            min_date, max_date = await _span_dates(owner_id, self.peer_id, first_id, last_id)
+            if min_date is None:
+                continue
+            lower_covered = first_id == 0 or min_date < _naive_utc(start)
+            if not lower_covered:
+                continue
+            if max_date < _naive_utc(end):
+                if index != 0:
+                    continue
+                # Самый свежий диапазон покрывает интервал, если догрузить новые сообщения
+                first_id, last_id = await self.refresh_head()
+            low, high = await _id_bounds(owner_id, self.peer_id, first_id, last_id, start, end)
+            return PeriodPlan(start=start, end=end, low=low, high=high, archived_span=(first_id, last_id))
+
+        boundaries = await RangeFetcher(self.user_client, self.entity).boundaries(start, end)
+        return PeriodPlan(start=start, end=end, low=boundaries.low, high=boundaries.high, boundaries=boundaries)
+
+    async def period_batches(self, plan: PeriodPlan):
+        """Отдает сообщения периода пачками от старых к новым. Сообщения из Telegram сразу сохраняются в архив"""
+        owner_id = await self._owner()
+        if plan.archived_span:
+            logger.info(f"Сообщения за период для {self.peer_id} получены из архива.")
+            yield await _read(owner_id, self.peer_id, *plan.archived_span, None, plan.start, plan.end)
+            return
+
+        boundaries = plan.boundaries
+        async for batch in RangeFetcher(self.user_client, self.entity).fetch(plan.low, plan.high):
+            rows = await self.ingest(batch)
+            yield [row for row in rows if plan.start <= row.date < plan.end]
+        # Граничные сообщения сохраняются, чтобы по архиву можно было проверить покрытие периода
+        edges = [message for message in (boundaries.before_start, boundaries.after_end) if message]
+        upper = boundaries.after_end.id if boundaries.after_end else plan.high
+        await self.ingest(edges, span=(plan.low, max(upper, plan.high)))
+
+    async def period(self, start: datetime, end: datetime) -> List[StoredMessage]:
+        """Сообщения с датой в интервале [start, end) (от старых к новым)"""
+        plan = await self.plan_period(start, end)
+        return [message async for batch in self.period_batches(plan) for message in batch]
+
+
+async def search_archive(user_client: TelegramClient, query: str, limit: int = 50) -> List[SearchResult]:
+    """Полнотекстовый поиск по всем сообщениям, сохраненным в архиве пользователя"""
+    owner_id = await user_client.get_peer_id("me")
+    return await _search(owner_id, query, limit)
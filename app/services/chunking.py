@@ -0,0 +1,145 @@
+import logging
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Tuple
+
+from app.client_ai import SUMMARY_MAX_TOKENS, SUMMARY_MODEL
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - токенизатор необязателен
+    tiktoken = None
+
+MESSAGE_SEPARATOR = "\n\n"
+# Запас под системный промпт, инструкцию и служебные токены формата chat
+PROMPT_OVERHEAD_TOKENS = 200
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…])\s+|\n+")
+CYRILLIC = re.compile(r"[а-яА-ЯёЁ]")
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """Загружает токенизатор модели. Если tiktoken недоступен (или нет файла словаря), возвращает None"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(SUMMARY_MODEL)
+    except Exception as e:
+        logger.warning(f"Токенизатор недоступен, используется приблизительный подсчет токенов: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Подсчитывает количество токенов в тексте"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # Приблизительная оценка: кириллица кодируется плотнее латиницы
+    cyrillic = len(CYRILLIC.findall(text))
+    return cyrillic // 2 + (len(text) - cyrillic) // 4 + 1
+
+
+def chunk_token_budget() -> int:
+    """Бюджет токенов на одну часть с учетом контекста модели и ответа"""
+    if settings.SUMMARY_CHUNK_TOKENS:
+        return settings.SUMMARY_CHUNK_TOKENS
+    return settings.SUMMARY_CONTEXT_TOKENS - SUMMARY_MAX_TOKENS - PROMPT_OVERHEAD_TOKENS
+
+
+@dataclass
+class ChunkStats:
+    """Статистика разбиения: количество частей и заполненность бюджета токенов"""
+    chunks: int
+    total_tokens: int
+    max_tokens: int
+
+    @property
+    def fill_ratio(self) -> float:
+        if not self.chunks:
+            return 0.0
+        return self.total_tokens / (self.chunks * self.max_tokens)
+
+
+def split_oversized(text: str, max_tokens: int) -> List[str]:
+    """Разбивает слишком длинное сообщение по границам предложений, а длинные предложения — по словам"""
+    pieces = []
+    for sentence in SENTENCE_BOUNDARY.split(text):
+        if not sentence:
+            continue
+        if count_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        words, current = sentence.split(" "), []
+        for word in words:
+            if current and count_tokens(" ".join(current + [word])) > max_tokens:
+                pieces.append(" ".join(current))
+                current = []
+            current.append(word)
+        if current:
+            pieces.append(" ".join(current))
+    return pieces
+
+
+class MessageChunker:
+    """
+    Потоковый упаковщик сообщений: жадно собирает целые сообщения в части, не превышающие бюджет токенов.
+    Готовые части возвращаются сразу, как только следующая часть начинает заполняться.
+    """
+
+    def __init__(self, max_tokens: int = None):
+        self.max_tokens = max_tokens or chunk_token_budget()
+        self.separator_tokens = count_tokens(MESSAGE_SEPARATOR)
+        self.current: List[str] = []
+        self.current_tokens = 0
+        self.chunks = 0
+        self.total_tokens = 0
+
+    def add(self, message: str) -> List[str]:
+        """Добавляет сообщение и возвращает список частей, заполнение которых завершено"""
+        completed = []
+        tokens = count_tokens(message)
+        pieces = [(message, tokens)] if tokens <= self.max_tokens else [
+            (piece, count_tokens(piece)) for piece in split_oversized(message, self.max_tokens)
+        ]
+        for piece, piece_tokens in pieces:
+            extra = piece_tokens + (self.separator_tokens if self.current else 0)
+            if self.current and self.current_tokens + extra > self.max_tokens:
+                completed.extend(self.flush())
+                extra = piece_tokens
+            self.current.append(piece)
+            self.current_tokens += extra
+        return completed
+
+    def flush(self) -> List[str]:
+        """Завершает текущую часть"""
+        if not self.current:
+            return []
+        chunk = MESSAGE_SEPARATOR.join(self.current)
+        self.chunks += 1
+        self.total_tokens += self.current_tokens
+        self.current, self.current_tokens = [], 0
+        return [chunk]
+
+    @property
+    def stats(self) -> ChunkStats:
+        return ChunkStats(chunks=self.chunks, total_tokens=self.total_tokens, max_tokens=self.max_tokens)
+
+
+def chunk_messages(messages: List[str], max_tokens: int = None) -> Tuple[List[str], ChunkStats]:
+    """
+    Жадно упаковывает целые сообщения в части, не превышающие бюджет токенов.
+    Сообщения, не помещающиеся в одну часть, разбиваются по предложениям.
+    """
+    chunker = MessageChunker(max_tokens)
+    chunks = []
+    for message in messages:
+        chunks.extend(chunker.add(message))
+    chunks.extend(chunker.flush())
+
+    stats = chunker.stats
+    logger.info(f"Сообщения разбиты на {stats.chunks} частей, заполненность {stats.fill_ratio:.0%}.")
+    return chunks, stats
@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+from telethon import TelegramClient
+
+from app.config import settings
+from app.telegram_client import get_telegram_client
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PooledClient:
+    """Подключенный и авторизованный клиент Telegram, хранящийся в пуле"""
+    client: TelegramClient
+    last_used: float = field(default_factory=time.monotonic)
+    # Сколько запросов и фоновых задач сейчас используют клиент: такой клиент не вытесняется
+    leases: int = 0
+
+
+class TelegramClientPool:
+    """
+    Пул переиспользуемых подключений TelegramClient, ключом служит строка сессии.
+    Клиенты вытесняются по времени простоя (TTL) и по LRU при превышении размера пула,
+    при вытеснении клиент отключается. Используемые клиенты (см. hold и lease) не вытесняются,
+    время простоя отсчитывается от окончания последнего использования.
+    Число подключенных клиентов ограничено max_size, пока все клиенты пула заняты, пул может
+    временно его превысить. max_concurrent_connects ограничивает одновременные подключения
+    (установку соединения и проверку авторизации), а не число открытых соединений.
+    """
+
+    def __init__(self, max_size: int, idle_ttl: float, max_concurrent_connects: int):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._clients: "OrderedDict[str, PooledClient]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._connect_semaphore = asyncio.Semaphore(max_concurrent_connects)
+        self._evict_listeners: List[Callable[[TelegramClient], None]] = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._clients)
+
+    def on_evict(self, listener: Callable[[TelegramClient], None]):
+        """Регистрирует обработчик, вызываемый перед отключением вытесняемого клиента"""
+        self._evict_listeners.append(listener)
+
+    def stats(self) -> dict:
+        """Счетчики пула для логов и мониторинга"""
+        return {
+            "size": len(self._clients),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "leased": sum(1 for pooled in self._clients.values() if pooled.leases),
+        }
+
+    async def acquire(self, session_str: str) -> Optional[TelegramClient]:
+        """
+        Возвращает подключенный и авторизованный клиент для строки сессии.
+        Если клиента нет в пуле, он создается, подключается и проверяется на авторизацию.
+        Возвращает None, если сессия не авторизована.
+        """
+        await self._evict_expired()
+
+        pooled = self._clients.get(session_str)
+        if pooled and pooled.client.is_connected():
+            self.hits += 1
+            pooled.last_used = time.monotonic()
+            self._clients.move_to_end(session_str)
+            return pooled.client
+        if pooled:
+            await self._evict(session_str)
+
+        pending = self._pending.get(session_str)
+        if pending:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[session_str] = future
+        try:
+            client = await self._connect(session_str)
+            if client:
+                await self._store(session_str, client)
+            future.set_result(client)
+            return client
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже передано вызывающему коду, ожидающие получат его через future
+            future.exception()
+            raise
+        finally:
+            self._pending.pop(session_str, None)
+
+    def hold(self, session_str: str) -> Optional[PooledClient]:
+        """
+        Отмечает клиент как используемый, пока не будет вызван unhold. Вызывается сразу после acquire,
+        без await между ними, иначе клиент может быть вытеснен раньше
+        """
+        pooled = self._clients.get(session_str)
+        if pooled:
+            pooled.leases += 1
+        return pooled
+
+    def hold_for_request(self, scope: Scope, session_str: str):
+        """Отмечает клиент как используемый до окончания запроса (см. ClientLeaseMiddleware)"""
+        if "client_leases" not in scope:
+            return
+        pooled = self.hold(session_str)
+        if pooled:
+            scope["client_leases"].append(pooled)
+
+    def unhold(self, pooled: PooledClient):
+        pooled.leases -= 1
+        pooled.last_used = time.monotonic()
+
+    @asynccontextmanager
+    async def lease(self, session_str: str) -> AsyncIterator[Optional[TelegramClient]]:
+        """Клиент для фоновой задачи: не вытесняется, пока задача его использует"""
+        client = await self.acquire(session_str)
+        pooled = self.hold(session_str) if client else None
+        try:
+            yield client
+        finally:
+            if pooled:
+                self.unhold(pooled)
+
+    async def adopt(self, session_str: str, client: TelegramClient):
+        """Помещает в пул уже подключенный клиент (например, сразу после входа пользователя)"""
+        if session_str in self._clients and self._clients[session_str].client is not client:
+            await self._evict(session_str)
+        await self._store(session_str, client)
+
+    async def release(self, session_str: str):
+        """Удаляет клиент из пула и отключает его (например, при выходе пользователя)"""
+        if session_str in self._clients:
+            await self._evict(session_str)
+
+    async def close(self):
+        """Отключает все клиенты пула"""
+        for session_str in list(self._clients):
+            await self._evict(session_str)
+
+    async def _connect(self, session_str: str) -> Optional[TelegramClient]:
+        async with self._connect_semaphore:
+            client = await get_telegram_client(session_str)
+            await client.connect()
+            try:
+                authorized = await client.is_user_authorized()
+            except Exception:
+                await client.disconnect()
+                raise
+            if not authorized:
+                logger.warning("User is not authorized.")
+                await client.disconnect()
+                return None
+            return client
+
+    async def _store(self, session_str: str, client: TelegramClient):
+        self._clients[session_str] = PooledClient(client)
+        self._clients.move_to_end(session_str)
+        idle = [key for key, pooled in self._clients.items() if not pooled.leases and key != session_str]
+        for oldest in idle[:max(0, len(self._clients) - self.max_size)]:
+            await self._evict(oldest)
+        if len(self._clients) > self.max_size:
+            logger.warning(f"Все {len(self._clients)} клиентов пула используются, размер пула превышен.")
+
+    async def _evict_expired(self):
+        now = time.monotonic()
+        expired = [
+            key for key, pooled in self._clients.items()
+            if not pooled.leases and now - pooled.last_used > self.idle_ttl
+        ]
+        for key in expired:
+            await self._evict(key)
+
+    async def _evict(self, session_str: str):
+        pooled = self._clients.pop(session_str, None)
+        if not pooled:
+            return
+        self.evictions += 1
+        for listener in self._evict_listeners:
+            try:
+                listener(pooled.client)
+            except Exception as e:
+                logger.error(f"Ошибка в обработчике вытеснения клиента: {e}")
+        try:
+            await pooled.client.disconnect()
+        except Exception as e:
+            logger.error(f"Ошибка при отключении клиента Telegram: {e}")
+
+
+class ClientLeaseMiddleware:
+    """
+    Клиенты, полученные в запросе через hold_for_request, считаются используемыми до окончания
+    ответа, включая потоковую передачу тела
+    """
+
+    def __init__(self, app: ASGIApp, pool: TelegramClientPool):
+        self.app = app
+        self.pool = pool
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        scope["client_leases"] = leases = []
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            for pooled in leases:
+                self.pool.unhold(pooled)
+
+
+client_pool = TelegramClientPool(
+    max_size=settings.CLIENT_POOL_SIZE,
+    idle_ttl=settings.CLIENT_POOL_IDLE_TTL,
+    max_concurrent_connects=settings.CLIENT_POOL_MAX_CONNECTS,
+)
@@ -1,44 +1,26 @@
+import asyncio
+import heapq
 import logging
-from typing import List
+from operator import itemgetter
+from typing import AsyncIterator, List
 
-from telethon import functions, types, TelegramClient
+from telethon import types, utils, TelegramClient
+
+from app.services.dialog_cache import (
+    CHANNELS, GROUPS, PRIVATE_CHATS, get_cached_dialogs, get_cached_filters, stream_cached_dialogs,
+)
+from app.services.entity_resolver import get_entity_resolver
 
 logger = logging.getLogger(__name__)
 
+SORT_KEYS = {"participants": "participants_count", "unread": "unread_count"}
+
 
 async def get_dialogs_info(user_client: TelegramClient):
-    """Функция для получения списка сообщений из каналов, групп и личных чатов пользователя"""
+    """Функция для получения списка сообщений из каналов, групп и личных чатов пользователя.
+    Данные берутся из снимка диалогов, который обновляется событиями Telegram"""
     try:
-        dialogs = await user_client.get_dialogs()
-        all_channels, all_groups, all_private_chats = [], [], []
-
-        for dialog in dialogs:
-            entity = dialog.entity
-
-            if dialog.is_channel and entity.username:
-                all_channels.append({
-                    "id": entity.id,
-                    "name": f"@{entity.username}",
-                    "participants_count": getattr(entity, "participants_count", 0),
-                    "unread_count": dialog.unread_count
-                })
-            elif dialog.is_group:
-                group_name = getattr(entity, 'title', f"Группа {entity.id}")
-                all_groups.append({
-                    "id": entity.id,
-                    "name": group_name,
-                    "participants_count": getattr(entity, "participants_count", 0),
-                    "unread_count": dialog.unread_count
-                })
-            elif dialog.is_user:
-                user_name = f"{entity.first_name or ''} {entity.last_name or ''}".strip()
-                all_private_chats.append({
-                    "id": entity.id,
-                    "name": user_name,
-                    "participants_count": 1,
-                    "unread_count": dialog.unread_count
-                })
-
+        all_channels, all_groups, all_private_chats = await get_cached_dialogs(user_client)
         logger.info(f"Найдено {len(all_channels)} каналов, {len(all_groups)} групп и {len(all_private_chats)} личных чатов.")
         return all_channels, all_groups, all_private_chats
     except Exception as e:
@@ -59,14 +41,91 @@ def sort_dialogs(all_channels, all_groups, all_private_chats, sort_by):
         all_private_chats.sort(key=lambda x: x["unread_count"], reverse=True)
 
 
+def top_dialogs(dialogs: List[dict], k: int, sort_by: str) -> List[dict]:
+    """
+    Первые k диалогов в порядке sort_dialogs: отбор через кучу за O(n log k) вместо сортировки
+    всего списка. Порядок совпадает с началом отсортированного списка, включая равные значения
+    """
+    key = SORT_KEYS.get(sort_by)
+    if key is None:
+        return dialogs[:k]
+    return heapq.nlargest(k, dialogs, key=itemgetter(key))
+
+
+async def stream_dashboard(user_client: TelegramClient, sort_by: str, first_screen: int) -> AsyncIterator[tuple]:
+    """
+    События потоковой панели управления. Диалоги и папки загружаются одновременно.
+    Первым событием всегда идут диалоги, по ним отрисовывается страница: ("preview", списки) - первые
+    first_screen диалогов каждого раздела из первой полученной страницы, если загружено еще не все
+    или разделы длиннее первого экрана, иначе сразу ("dialogs", списки) - все диалоги, отсортированные
+    по sort_by. Остальные события идут в порядке готовности: ("dialogs", списки) после preview
+    и ("folders", (groups_with_channels, existing_filters)). Списки - каналы, группы и личные чаты
+    """
+    folders = asyncio.create_task(_labelled("folders", get_dialog_filters(user_client)))
+    batches = stream_cached_dialogs(user_client)
+    received = {CHANNELS: [], GROUPS: [], PRIVATE_CHATS: []}
+    rest = None
+    try:
+        complete = await _collect(batches, received, limit=1)
+        lists = received[CHANNELS], received[GROUPS], received[PRIVATE_CHATS]
+        previewed = not complete or any(len(dialogs) > first_screen for dialogs in lists)
+        if previewed:
+            yield "preview", tuple(top_dialogs(dialogs, first_screen, sort_by) for dialogs in lists)
+        rest = asyncio.create_task(_labelled("dialogs", _finish_dialogs(batches, received, sort_by, complete)))
+        if not previewed:
+            # Папки могли загрузиться раньше, но страница еще не отправлена: сначала диалоги
+            yield await rest
+        for next_event in asyncio.as_completed([rest, folders] if previewed else [folders]):
+            yield await next_event
+    finally:
+        pending = [task for task in (rest, folders) if task and not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        await batches.aclose()
+
+
+async def _labelled(name: str, coroutine):
+    return name, await coroutine
+
+
+async def _collect(batches, received: dict, limit: int = 0) -> bool:
+    """Раскладывает пачки диалогов по разделам (не больше limit пачек, если задан). True - загружено все"""
+    count = 0
+    try:
+        async for batch, last in batches:
+            for category, info in batch:
+                received[category].append(info)
+            count += 1
+            if last:
+                return True
+            if limit and count >= limit:
+                return False
+    except Exception as e:
+        logger.error(f"Ошибка при получении диалогов: {e}")
+    return True
+
+
+async def _finish_dialogs(batches, received: dict, sort_by: str, complete: bool):
+    if not complete:
+        await _collect(batches, received)
+    all_channels, all_groups, all_private_chats = received[CHANNELS], received[GROUPS], received[PRIVATE_CHATS]
+    logger.info(f"Найдено {len(all_channels)} каналов, {len(all_groups)} групп и {len(all_private_chats)} личных чатов.")
+    sort_dialogs(all_channels, all_groups, all_private_chats, sort_by)
+    return all_channels, all_groups, all_private_chats
+
+
 async def get_dialog_filters(user_client: TelegramClient):
-    """Функция для получения фильтров диалогов"""
+    """Функция для получения фильтров диалогов. Фильтры берутся из снимка диалогов,
+    сущности всех папок запрашиваются одним пакетом"""
     groups_with_channels = []
     try:
-        dialog_filters = await user_client(functions.messages.GetDialogFiltersRequest())
-        existing_filters = dialog_filters.filters if dialog_filters.filters else []
+        existing_filters = await get_cached_filters(user_client)
         logger.info(f"Получено {len(existing_filters)} фильтров диалогов.")
 
+        all_peers = [peer for dialog_filter in existing_filters for peer in getattr(dialog_filter, 'include_peers', [])]
+        entities = await get_entity_resolver(user_client).resolve(all_peers)
+
         for dialog_filter in existing_filters:
             group_channels = []
             filter_title = getattr(dialog_filter, 'title', f"Фильтр {getattr(dialog_filter, 'id', 'unknown')}")
@@ -76,12 +135,14 @@ async def get_dialog_filters(user_client: TelegramClient):
 
             for included_peer in include_peers:
                 try:
-                    entity = await get_entity_from_peer(user_client, included_peer)
-                    if entity:
-                        group_channels.append(entity)
-                except Exception as e:
-                    logger.error(f"Ошибка при обработке peer {included_peer}: {e}")
-                    continue
+                    entity = entities.get(utils.get_peer_id(included_peer))
+                except TypeError:
+                    entity = None
+                name = format_entity(entity) if entity else None
+                if name:
+                    group_channels.append(name)
+                else:
+                    logger.error(f"Ошибка: не найден entity для {included_peer}.")
 
             groups_with_channels.append({
                 "filter_name": filter_title,
@@ -93,28 +154,49 @@ async def get_dialog_filters(user_client: TelegramClient):
         return [], []
 
 
-async def get_entity_from_peer(user_client, included_peer):
-    """Функция для получения entity из пира"""
+async def get_folders(user_client: TelegramClient) -> List[dict]:
+    """Список папок пользователя (ID и название), в которые включены отдельные диалоги"""
     try:
-        if isinstance(included_peer, types.InputPeerChannel):
-            entity = await user_client.get_input_entity(included_peer)
-        elif isinstance(included_peer, types.InputPeerUser):
-            entity = await user_client.get_input_entity(included_peer)
-        elif isinstance(included_peer, types.InputPeerChat):
-            entity = await user_client.get_input_entity(included_peer)
-        else:
-            logger.warning(f"Неизвестный тип peer: {included_peer}")
-            return None
-
-        if isinstance(entity, types.Channel):
-            return f"@{entity.username}" if entity.username else f"{entity.title} (ID: {entity.id})"
-        elif isinstance(entity, types.User):
-            return f"{entity.first_name or ''} {entity.last_name or ''} (ID: {entity.id})"
-        elif isinstance(entity, types.Chat):
-            return f"{entity.title} (ID: {entity.id})"
-        else:
-            logger.warning(f"Неизвестный тип сущности: {type(entity)}")
-            return None
-    except ValueError:
-        logger.error(f"Ошибка: не найден entity для {included_peer}. Возможно, отсутствует access_hash.")
-    return None
+        dialog_filters = await get_cached_filters(user_client)
+    except Exception as e:
+        logger.error(f"Ошибка при получении фильтров диалогов: {e}")
+        return []
+    return [
+        {"id": dialog_filter.id, "title": dialog_filter.title}
+        for dialog_filter in dialog_filters
+        if getattr(dialog_filter, "include_peers", None)
+    ]
+
+
+async def get_folder_entities(user_client: TelegramClient, folder_id: int) -> list:
+    """Сущности диалогов, включенных в папку. Запрашиваются одним пакетом"""
+    dialog_filters = await get_cached_filters(user_client)
+    dialog_filter = next(
+        (item for item in dialog_filters if getattr(item, "id", None) == folder_id), None
+    )
+    if dialog_filter is None:
+        raise ValueError(f"папка {folder_id} не найдена.")
+    include_peers = getattr(dialog_filter, "include_peers", [])
+    entities = await get_entity_resolver(user_client).resolve(include_peers)
+    result = []
+    for peer in include_peers:
+        try:
+            entity = entities.get(utils.get_peer_id(peer))
+        except TypeError:
+            entity = None
+        if entity is not None:
+            result.append(entity)
+    return result
+
+
+def format_entity(entity):
+    """Функция для получения отображаемого имени сущности"""
+    if isinstance(entity, types.Channel):
+        return f"@{entity.username}" if entity.username else f"{entity.title} (ID: {entity.id})"
+    elif isinstance(entity, types.User):
+        return f"{entity.first_name or ''} {entity.last_name or ''} (ID: {entity.id})"
+    elif isinstance(entity, types.Chat):
+        return f"{entity.title} (ID: {entity.id})"
+    else:
+        logger.warning(f"Неизвестный тип сущности: {type(entity)}")
+        return None
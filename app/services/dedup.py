@@ -0,0 +1,161 @@
+import hashlib
+import logging
+import re
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.config import settings
+from app.services.chunking import MESSAGE_SEPARATOR, count_tokens
+from app.services.metrics import record_dedup
+
+logger = logging.getLogger(__name__)
+
+WORD = re.compile(r"\w+")
+URL = re.compile(r"https?://\S+|t\.me/\S+")
+SHINGLE_SIZE = 3
+# Подпись MinHash из NUM_PERM значений делится на BANDS полос для поиска кандидатов (LSH).
+# При 16 полосах по 4 значения кандидатами становятся пары со сходством примерно от 0.5,
+# окончательное решение принимается по доле совпадающих значений подписи (DEDUP_THRESHOLD)
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Ограничение размера матрицы хэшей (NUM_PERM x шинглы) при векторном расчете подписей
+MAX_SHINGLES_PER_BLOCK = 50_000
+
+_rng = np.random.default_rng(20240917)
+# Нечетные множители для хэширования multiply-shift: (a * x + b) mod 2^64, старшие 32 бита
+_PERM_A = _rng.integers(1, 2 ** 63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 2 ** 63, size=NUM_PERM, dtype=np.uint64)
+
+
+def normalize(text: str) -> List[str]:
+    """Слова сообщения без ссылок, регистра и пунктуации"""
+    return WORD.findall(URL.sub(" ", text).lower())
+
+
+def shingle_hashes(words: List[str]) -> np.ndarray:
+    """Хэши шинглов из SHINGLE_SIZE слов подряд (короткое сообщение - один шингл)"""
+    if len(words) <= SHINGLE_SIZE:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    return np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64)
+
+
+def minhash_signatures(shingle_sets: List[np.ndarray]) -> np.ndarray:
+    """
+    Подписи MinHash для нескольких сообщений сразу: хэши всех шинглов блока сообщений
+    пропускаются через NUM_PERM хэш-функций одной матричной операцией, минимумы по каждому
+    сообщению берутся через np.minimum.reduceat. Возвращает матрицу (сообщения x NUM_PERM)
+    """
+    signatures = np.empty((len(shingle_sets), NUM_PERM), dtype=np.uint64)
+    start = 0
+    while start < len(shingle_sets):
+        end, size = start, 0
+        while end < len(shingle_sets) and (end == start or size + len(shingle_sets[end]) <= MAX_SHINGLES_PER_BLOCK):
+            size += len(shingle_sets[end])
+            end += 1
+        block = shingle_sets[start:end]
+        offsets = np.cumsum([0] + [len(hashes) for hashes in block[:-1]])
+        hashes = np.concatenate(block)
+        # Переполнение uint64 здесь ожидаемо: это и есть взятие по модулю 2^64
+        permuted = (np.multiply.outer(_PERM_A, hashes) + _PERM_B[:, None]) >> np.uint64(32)
+        signatures[start:end] = np.minimum.reduceat(permuted, offsets, axis=1).T
+        start = end
+    return signatures
+
+
+@dataclass
+class DedupStats:
+    """Результат фильтрации: сколько сообщений удалено и сколько токенов сэкономлено"""
+    messages: int = 0
+    exact: int = 0
+    near: int = 0
+    tokens_saved: int = 0
+
+    @property
+    def removed(self) -> int:
+        return self.exact + self.near
+
+
+class NearDuplicateFilter:
+    """
+    Удаляет повторы сообщений перед разбиением на части: точные (совпадает нормализованный текст)
+    и почти одинаковые (пересылки, репосты, варианты одного объявления) по сходству Жаккара
+    шинглов, оцененному MinHash с LSH. Остается первое сообщение из группы похожих.
+    Фильтр можно применять к пачкам по мере загрузки: повторы ищутся среди всех переданных ранее сообщений.
+    """
+
+    def __init__(self, threshold: Optional[float] = None):
+        self.threshold = threshold if threshold is not None else settings.DEDUP_THRESHOLD
+        self.stats = DedupStats()
+        self._seen_exact = set()
+        self._signatures: List[np.ndarray] = []
+        self._buckets: Dict[bytes, List[int]] = defaultdict(list)
+
+    def _is_near_duplicate(self, signature: np.ndarray) -> bool:
+        candidates = set()
+        for band in range(BANDS):
+            candidates.update(self._buckets.get(self._band_key(band, signature), ()))
+        return any(
+            np.count_nonzero(self._signatures[index] == signature) >= self.threshold * NUM_PERM
+            for index in candidates
+        )
+
+    @staticmethod
+    def _band_key(band: int, signature: np.ndarray) -> bytes:
+        return bytes([band]) + signature[band * ROWS:(band + 1) * ROWS].tobytes()
+
+    def _remember(self, signature: np.ndarray):
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        for band in range(BANDS):
+            self._buckets[self._band_key(band, signature)].append(index)
+
+    def _drop(self, text: str):
+        self.stats.tokens_saved += count_tokens(text) + count_tokens(MESSAGE_SEPARATOR)
+
+    def filter(self, texts: List[str]) -> List[str]:
+        """Возвращает сообщения без повторов, порядок сохраняется"""
+        candidates, words = [], []
+        for text in texts:
+            if not text:
+                continue
+            self.stats.messages += 1
+            normalized = normalize(text)
+            digest = hashlib.blake2b((" ".join(normalized) or text).encode("utf-8"), digest_size=16).digest()
+            if digest in self._seen_exact:
+                self.stats.exact += 1
+                self._drop(text)
+                continue
+            self._seen_exact.add(digest)
+            candidates.append(text)
+            words.append(normalized)
+
+        with_shingles = [index for index, normalized in enumerate(words) if normalized]
+        signatures = minhash_signatures([shingle_hashes(words[index]) for index in with_shingles])
+        signature_of = dict(zip(with_shingles, signatures))
+
+        unique = []
+        for index, text in enumerate(candidates):
+            signature = signature_of.get(index)
+            if signature is not None:
+                if self._is_near_duplicate(signature):
+                    self.stats.near += 1
+                    self._drop(text)
+                    continue
+                self._remember(signature)
+            unique.append(text)
+        return unique
+
+    def report(self):
+        """Записывает итог фильтрации в лог и метрики"""
+        stats = self.stats
+        if stats.removed:
+            logger.info(f"Удалено повторов: {stats.exact} точных и {stats.near} похожих из {stats.messages} "
+                        f"сообщений, сэкономлено примерно {stats.tokens_saved} токенов.")
+        record_dedup(stats.exact, stats.near, stats.tokens_saved)
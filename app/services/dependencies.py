@@ -1,7 +1,10 @@
 import logging
 
 from fastapi import Request
-from app.telegram_client import get_telegram_client
+from app.services.client_pool import client_pool
+from app.services.lifecycle import lifecycle
+from app.services.metrics import stage
+from app.services.rate_limit import set_owner
 
 logger = logging.getLogger(__name__)
 
@@ -11,27 +14,18 @@ async def get_current_user(request: Request):
     session_str = request.session.get("session_str")
     if not session_str:
         return None
+    # Исходящие вызовы запроса ставятся в очередь планировщика от имени этой сессии
+    set_owner(request.scope.get("session_id"))
     try:
         logger.debug(f"Session String in FastAPI: {session_str}")
-        user_client = await get_telegram_client(session_str)
-        await user_client.connect()
-        if not await user_client.is_user_authorized():
-            logger.warning("User is not authorized.")
-            return None
+        with stage("connect"):
+            user_client = await client_pool.acquire(session_str)
+        if user_client:
+            client_pool.hold_for_request(request.scope, session_str)
+            # По времени последнего обращения при следующем запуске клиент подключается заранее
+            await lifecycle.activity.touch(request.scope.get("session_id"))
         return user_client
     except Exception as e:
         logger.error(f"Authorization Error: {e}")
         return None
 
-
-async def get_messages(user_client, entity, limit: int = 10):
-    """Функция для получения сообщений из канала, группы или личного чата"""
-    messages = []
-    async for message in user_client.iter_messages(entity, limit=limit):
-        messages.append({
-            "id": message.id,
-            "text": message.text,
-            "date": message.date.strftime("%Y-%m-%d %H:%M:%S")
-        })
-    return messages
-
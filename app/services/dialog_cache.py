@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import time
+import weakref
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from telethon import TelegramClient, events, functions, types
+
+from app.config import settings
+from app.services.client_pool import client_pool
+from app.services.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+CHANNELS, GROUPS, PRIVATE_CHATS = "channels", "groups", "private_chats"
+# Обновления, после которых список папок нужно запросить заново
+FILTER_UPDATES = (types.UpdateDialogFilter, types.UpdateDialogFilters, types.UpdateDialogFilterOrder)
+
+
+def dialog_to_info(dialog) -> Tuple[Optional[str], Optional[dict]]:
+    """Преобразует диалог Telethon в категорию и словарь для отображения на панели.
+    id - ID сущности, peer_id - полный ID диалога (utils.get_peer_id), по нему сущность находится без типа"""
+    entity = dialog.entity
+    if dialog.is_channel and entity.username:
+        return CHANNELS, {
+            "id": entity.id,
+            "peer_id": dialog.id,
+            "name": f"@{entity.username}",
+            "participants_count": getattr(entity, "participants_count", 0),
+            "unread_count": dialog.unread_count
+        }
+    elif dialog.is_group:
+        group_name = getattr(entity, 'title', f"Группа {entity.id}")
+        return GROUPS, {
+            "id": entity.id,
+            "peer_id": dialog.id,
+            "name": group_name,
+            "participants_count": getattr(entity, "participants_count", 0),
+            "unread_count": dialog.unread_count
+        }
+    elif dialog.is_user:
+        user_name = f"{entity.first_name or ''} {entity.last_name or ''}".strip()
+        return PRIVATE_CHATS, {
+            "id": entity.id,
+            "peer_id": dialog.id,
+            "name": user_name,
+            "participants_count": 1,
+            "unread_count": dialog.unread_count
+        }
+    return None, None
+
+
+class DialogSnapshot:
+    """
+    Снимок списка диалогов пользователя. Заполняется один раз через iter_dialogs,
+    затем поддерживается в актуальном состоянии событиями Telethon (новые сообщения,
+    прочтение, изменение состава участников). Вместе с диалогами хранятся папки (фильтры диалогов):
+    они запрашиваются при первом обращении и заново после изменения папок или истечения TTL.
+    Загрузка выполняется одной фоновой задачей на клиента: одновременные запросы ждут ее,
+    а потоковые читатели получают диалоги по мере прихода страниц от Telegram.
+    """
+
+    def __init__(self):
+        self.entries: "OrderedDict[int, Tuple[str, dict]]" = OrderedDict()
+        self.last_message_ids: Dict[int, int] = {}
+        self.known_peers = set()
+        self.loaded_at: Optional[float] = None
+        self.stale = True
+        self._loading: Optional[asyncio.Task] = None
+        # Диалоги текущей загрузки в порядке получения и событие о поступлении новых
+        self._received: List[Tuple[Optional[str], Optional[dict]]] = []
+        self._progress = asyncio.Event()
+        self.filters: Optional[list] = None
+        self.filters_loaded_at: Optional[float] = None
+        self._filters_loading: Optional[asyncio.Task] = None
+        # Увеличивается при изменении папок: ответ, запрошенный до изменения, не сохраняется
+        self._filters_version = 0
+
+    def is_fresh(self) -> bool:
+        if self.stale or self.loaded_at is None:
+            return False
+        return time.monotonic() - self.loaded_at < settings.DIALOG_CACHE_TTL
+
+    def filters_fresh(self) -> bool:
+        if self.filters is None:
+            return False
+        return time.monotonic() - self.filters_loaded_at < settings.DIALOG_CACHE_TTL
+
+    def fill(self, dialogs):
+        self.entries.clear()
+        self.last_message_ids.clear()
+        self.known_peers.clear()
+        for dialog in dialogs:
+            self.known_peers.add(dialog.id)
+            category, info = dialog_to_info(dialog)
+            if category:
+                self.entries[dialog.id] = (category, info)
+                self.last_message_ids[dialog.id] = dialog.message.id if dialog.message else 0
+        self.loaded_at = time.monotonic()
+        self.stale = False
+
+    def load(self, user_client: TelegramClient) -> asyncio.Task:
+        """Запускает загрузку диалогов, если она еще не идет, и возвращает ее задачу"""
+        if self._loading is None or self._loading.done():
+            self._received = []
+            self._loading = asyncio.create_task(self._load(user_client))
+            # Ошибку получают ожидающие задачу, но читателей может уже не остаться
+            self._loading.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self._loading
+
+    async def _load(self, user_client: TelegramClient):
+        dialogs = []
+        try:
+            async for dialog in user_client.iter_dialogs():
+                dialogs.append(dialog)
+                self._received.append(dialog_to_info(dialog))
+                self._notify()
+            self.fill(dialogs)
+        finally:
+            self._notify()
+
+    def _notify(self):
+        self._progress.set()
+        self._progress = asyncio.Event()
+
+    async def get_filters(self, user_client: TelegramClient) -> list:
+        """Папки пользователя; одновременные запросы ждут одну загрузку"""
+        if self.filters_fresh():
+            return self.filters
+        if self._filters_loading is None or self._filters_loading.done():
+            self._filters_loading = asyncio.create_task(self._load_filters(user_client))
+            self._filters_loading.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return await asyncio.shield(self._filters_loading)
+
+    async def _load_filters(self, user_client: TelegramClient) -> list:
+        version = self._filters_version
+        response = await user_client(functions.messages.GetDialogFiltersRequest())
+        filters = list(response.filters or [])
+        if version == self._filters_version:
+            self.filters, self.filters_loaded_at = filters, time.monotonic()
+        return filters
+
+    def cancel(self):
+        for task in (self._loading, self._filters_loading):
+            if task:
+                task.cancel()
+
+    async def stream(self, user_client: TelegramClient) -> AsyncIterator[Tuple[List[Tuple[str, dict]], bool]]:
+        """
+        Диалоги пачками по мере загрузки: свежий снимок отдается одной пачкой, иначе каждая пачка -
+        диалоги, пришедшие с момента предыдущей (обычно страница ответа Telegram).
+        Вместе с пачкой передается признак, что она последняя
+        """
+        if self.is_fresh():
+            yield [(category, dict(info)) for category, info in self.entries.values()], True
+            return
+        task = self.load(user_client)
+        received, position = self._received, 0
+        while True:
+            progress = self._progress
+            if position < len(received):
+                batch = [(category, dict(info)) for category, info in received[position:] if category]
+                position = len(received)
+                if batch:
+                    yield batch, task.done() and position == len(received)
+                continue
+            if task.done():
+                task.result()
+                return
+            await progress.wait()
+
+    def lists(self) -> Tuple[List[dict], List[dict], List[dict]]:
+        """Возвращает копии списков каналов, групп и личных чатов (их можно сортировать и изменять)"""
+        result = {CHANNELS: [], GROUPS: [], PRIVATE_CHATS: []}
+        for category, info in self.entries.values():
+            result[category].append(dict(info))
+        return result[CHANNELS], result[GROUPS], result[PRIVATE_CHATS]
+
+    async def on_new_message(self, event):
+        peer_id = event.chat_id
+        if peer_id not in self.known_peers:
+            # Новый диалог: при следующем обращении список будет загружен заново
+            self.stale = True
+            return
+        entry = self.entries.get(peer_id)
+        if not entry:
+            return
+        info = entry[1]
+        self.last_message_ids[peer_id] = max(self.last_message_ids.get(peer_id, 0), event.message.id)
+        if event.message.out:
+            info["unread_count"] = 0
+        else:
+            info["unread_count"] += 1
+        self.entries.move_to_end(peer_id, last=False)
+
+    async def on_message_read(self, event):
+        if not event.inbox:
+            return
+        entry = self.entries.get(event.chat_id)
+        if entry and event.max_id >= self.last_message_ids.get(event.chat_id, 0):
+            entry[1]["unread_count"] = 0
+
+    async def on_chat_action(self, event):
+        entry = self.entries.get(event.chat_id)
+        if not entry:
+            return
+        info = entry[1]
+        count = len(event.user_ids or []) or 1
+        if event.user_joined or event.user_added:
+            info["participants_count"] = (info["participants_count"] or 0) + count
+        elif event.user_left or event.user_kicked:
+            info["participants_count"] = max(0, (info["participants_count"] or 0) - count)
+
+    async def on_filters_update(self, event):
+        self._filters_version += 1
+        self.filters = None
+
+    def handlers(self):
+        return [
+            (self.on_new_message, events.NewMessage()),
+            (self.on_message_read, events.MessageRead()),
+            (self.on_chat_action, events.ChatAction()),
+            (self.on_filters_update, events.Raw(FILTER_UPDATES)),
+        ]
+
+
+_snapshots: "weakref.WeakKeyDictionary[TelegramClient, DialogSnapshot]" = weakref.WeakKeyDictionary()
+
+
+def _get_snapshot(user_client: TelegramClient) -> DialogSnapshot:
+    snapshot = _snapshots.get(user_client)
+    if snapshot is None:
+        snapshot = DialogSnapshot()
+        for callback, event in snapshot.handlers():
+            user_client.add_event_handler(callback, event)
+        _snapshots[user_client] = snapshot
+    return snapshot
+
+
+def drop_snapshot(user_client: TelegramClient):
+    """Удаляет снимок диалогов клиента и отписывает его от событий"""
+    snapshot = _snapshots.pop(user_client, None)
+    if snapshot:
+        snapshot.cancel()
+        for callback, event in snapshot.handlers():
+            user_client.remove_event_handler(callback, event)
+
+
+async def get_cached_dialogs(user_client: TelegramClient) -> Tuple[List[dict], List[dict], List[dict]]:
+    """Возвращает каналы, группы и личные чаты из снимка, загружая диалоги только при необходимости"""
+    snapshot = _get_snapshot(user_client)
+    record_cache("dialogs", snapshot.is_fresh())
+    if not snapshot.is_fresh():
+        # Отмена запроса не должна прерывать общую загрузку, которую ждут и другие запросы
+        await asyncio.shield(snapshot.load(user_client))
+    return snapshot.lists()
+
+
+async def stream_cached_dialogs(user_client: TelegramClient) -> AsyncIterator[Tuple[List[Tuple[str, dict]], bool]]:
+    """
+    Каналы, группы и личные чаты пачками (список пар категория-словарь, признак последней пачки)
+    по мере загрузки, см. DialogSnapshot.stream
+    """
+    snapshot = _get_snapshot(user_client)
+    record_cache("dialogs", snapshot.is_fresh())
+    async for batch, last in snapshot.stream(user_client):
+        yield batch, last
+
+
+async def get_cached_filters(user_client: TelegramClient) -> list:
+    """Папки (фильтры диалогов) пользователя из снимка, запрашиваются только при необходимости"""
+    snapshot = _get_snapshot(user_client)
+    record_cache("dialog_filters", snapshot.filters_fresh())
+    return await snapshot.get_filters(user_client)
+
+
+client_pool.on_evict(drop_snapshot)
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+from telethon import TelegramClient, utils
+
+from app.config import settings
+from app.schemas import DigestRequest, DigestResult, DigestSection
+from app.services.dashboard import get_folder_entities
+from app.services.metrics import stage
+from app.services.rolling_summary import summarize_incrementally
+from app.services.summarize import (
+    SUMMARY_ENGINES, get_messages_to_summarize, summarize_messages, summarize_period
+)
+from app.services.summary_cache import request_key
+
+logger = logging.getLogger(__name__)
+
+
+async def summarize_source(user_client: TelegramClient, entity, summary_type: str,
+                           period_start: Optional[str] = None, period_end: Optional[str] = None,
+                           engine: str = "openai") -> str:
+    """Суммаризация одного источника выбранным способом: за период, инкрементально или последние сообщения.
+    engine="local" - локальная выжимка без обращения к OpenAI"""
+    if summary_type == "incremental":
+        return await summarize_incrementally(user_client, entity, engine)
+    if summary_type == "period" and period_start and period_end:
+        return await summarize_period(user_client, entity, period_start, period_end, engine)
+    messages_to_summarize = await get_messages_to_summarize(
+        user_client, entity, summary_type, period_start, period_end
+    )
+    return await summarize_messages(
+        [message.text for message in messages_to_summarize],
+        cache_key=await request_key(user_client, entity, messages_to_summarize),
+        engine=engine,
+    )
+
+
+async def get_entity_by_peer_id(user_client: TelegramClient, source: str):
+    """
+    Сущность по полному ID диалога. В отличие от summarize.get_entity_by_source тип диалога
+    определяется по самому ID, поэтому так находятся и обычные группы, и личные чаты
+    """
+    try:
+        with stage("entity"):
+            return await user_client.get_entity(int(source))
+    except Exception as e:
+        logger.error(f"Ошибка при получении сущности для {source}: {e}")
+        return None
+
+
+async def resolve_digest_sources(user_client: TelegramClient, digest_request: DigestRequest) -> list:
+    """Сущности источников дайджеста: из папки и из списка ID. Повторы убираются, порядок сохраняется"""
+    entities = []
+    if digest_request.folder_id is not None:
+        entities.extend(await get_folder_entities(user_client, digest_request.folder_id))
+    found = await asyncio.gather(*(get_entity_by_peer_id(user_client, source) for source in digest_request.sources))
+    for source, entity in zip(digest_request.sources, found):
+        if entity is None:
+            logger.warning(f"Источник {source} не найден и не попадет в дайджест.")
+        else:
+            entities.append(entity)
+
+    unique = {}
+    for entity in entities:
+        unique.setdefault(utils.get_peer_id(entity), entity)
+    if len(unique) > settings.DIGEST_MAX_SOURCES:
+        logger.warning(f"В дайджест попадут первые {settings.DIGEST_MAX_SOURCES} из {len(unique)} источников.")
+    return list(unique.values())[:settings.DIGEST_MAX_SOURCES]
+
+
+async def _summarize_section(user_client: TelegramClient, entity, digest_request: DigestRequest) -> DigestSection:
+    section = DigestSection(source_id=utils.get_peer_id(entity),
+                            title=utils.get_display_name(entity) or str(entity.id))
+    try:
+        section.summary = await summarize_source(
+            user_client, entity, digest_request.summary_type,
+            digest_request.period_start, digest_request.period_end, digest_request.engine,
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при суммаризации источника {entity.id} для дайджеста: {e}")
+        section.error = str(e)
+    return section
+
+
+def format_digest(sections: List[DigestSection]) -> str:
+    """Дайджест из разделов по источникам"""
+    parts = []
+    for section in sections:
+        body = section.summary if section.error is None else f"Не удалось получить суммаризацию: {section.error}"
+        parts.append(f"## {section.title}\n\n{body}")
+    return "\n\n".join(parts) if parts else "Нет источников для дайджеста."
+
+
+async def build_digest(user_client: TelegramClient, digest_request: DigestRequest) -> DigestResult:
+    """
+    Дайджест нескольких источников: все источники загружаются и суммаризируются одновременно,
+    поэтому общее время близко ко времени самого медленного источника. Ошибка одного источника
+    не прерывает дайджест, а попадает в его раздел.
+    """
+    if digest_request.engine not in SUMMARY_ENGINES:
+        raise ValueError("неизвестный способ суммаризации.")
+    with stage("digest"):
+        entities = await resolve_digest_sources(user_client, digest_request)
+        logger.info(f"Дайджест по {len(entities)} источникам.")
+        sections = await asyncio.gather(*(
+            _summarize_section(user_client, entity, digest_request) for entity in entities
+        ))
+    return DigestResult(digest=format_digest(sections), sections=sections)
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+import weakref
+from typing import Dict, Iterable, List, Tuple
+
+from telethon import TelegramClient, functions, types, utils
+
+from app.config import settings
+from app.services.client_pool import client_pool
+from app.services.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Максимальное количество ID в одном запросе GetChannels / GetUsers / GetChats
+BATCH_SIZE = 100
+
+
+def _batches(items: List, size: int = BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class EntityResolver:
+    """
+    Пакетное получение сущностей по InputPeer с кэшем на пользователя.
+    Пиры группируются по типу и запрашиваются через channels.GetChannels,
+    users.GetUsers и messages.GetChats, одинаковые пиры запрашиваются один раз.
+    """
+
+    def __init__(self, user_client: TelegramClient):
+        self.user_client = user_client
+        self._entities: Dict[int, Tuple[float, object]] = {}
+
+    def _cached(self, peer_id: int):
+        cached = self._entities.get(peer_id)
+        if cached and time.monotonic() - cached[0] < settings.DIALOG_CACHE_TTL:
+            return cached[1]
+        return None
+
+    async def resolve(self, peers: Iterable) -> Dict[int, object]:
+        """Возвращает словарь {ID пира: сущность} для переданных InputPeer"""
+        channels, users, chats = {}, {}, {}
+        result = {}
+        for peer in peers:
+            if isinstance(peer, types.InputPeerSelf):
+                peer = types.InputPeerUser(await self.user_client.get_peer_id("me"), 0)
+            try:
+                peer_id = utils.get_peer_id(peer)
+            except TypeError:
+                logger.warning(f"Неизвестный тип peer: {peer}")
+                continue
+            cached = self._cached(peer_id)
+            record_cache("entities", cached is not None)
+            if cached is not None:
+                result[peer_id] = cached
+            elif isinstance(peer, types.InputPeerChannel):
+                channels[peer_id] = types.InputChannel(peer.channel_id, peer.access_hash)
+            elif isinstance(peer, types.InputPeerUser):
+                users[peer_id] = types.InputUser(peer.user_id, peer.access_hash)
+            elif isinstance(peer, types.InputPeerChat):
+                chats[peer_id] = peer.chat_id
+            else:
+                logger.warning(f"Неизвестный тип peer: {peer}")
+
+        requests = [
+            *(functions.channels.GetChannelsRequest(id=batch) for batch in _batches(list(channels.values()))),
+            *(functions.users.GetUsersRequest(id=batch) for batch in _batches(list(users.values()))),
+            *(functions.messages.GetChatsRequest(id=batch) for batch in _batches(list(chats.values()))),
+        ]
+        responses = await asyncio.gather(*(self.user_client(request) for request in requests), return_exceptions=True)
+
+        now = time.monotonic()
+        for response in responses:
+            if isinstance(response, Exception):
+                logger.error(f"Ошибка при пакетном получении сущностей: {response}")
+                continue
+            entities = response if isinstance(response, list) else response.chats
+            for entity in entities:
+                peer_id = utils.get_peer_id(entity)
+                self._entities[peer_id] = (now, entity)
+                result[peer_id] = entity
+        return result
+
+
+_resolvers: "weakref.WeakKeyDictionary[TelegramClient, EntityResolver]" = weakref.WeakKeyDictionary()
+
+
+def get_entity_resolver(user_client: TelegramClient) -> EntityResolver:
+    """Резолвер сущностей пользователя; его кэш общий для всех запросов с этим клиентом"""
+    resolver = _resolvers.get(user_client)
+    if resolver is None:
+        resolver = _resolvers[user_client] = EntityResolver(user_client)
+    return resolver
+
+
+def drop_entity_resolver(user_client: TelegramClient):
+    _resolvers.pop(user_client, None)
+
+
+client_pool.on_evict(drop_entity_resolver)
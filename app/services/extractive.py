@@ -0,0 +1,202 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.client_ai import SUMMARY_MAX_TOKENS
+from app.config import settings
+from app.services.chunking import MESSAGE_SEPARATOR, SENTENCE_BOUNDARY, count_tokens
+from app.services.dedup import normalize
+from app.services.metrics import record_compression
+
+logger = logging.getLogger(__name__)
+
+# Предложения короче MIN_WORDS слов («Спасибо!», «Ок») не попадают в выжимку
+MIN_WORDS = 4
+# Для TextRank нужна матрица сходства (предложения x предложения), поэтому на больших входах
+# предложения ранжируются по близости к центроиду текста, это линейно по числу предложений
+TEXTRANK_MAX_SENTENCES = 2000
+TEXTRANK_DAMPING = 0.85
+TEXTRANK_ITERATIONS = 50
+TEXTRANK_TOLERANCE = 1e-6
+# Словарь TF-IDF ограничен самыми частыми словами: слово из одного предложения не влияет на сходство
+MAX_FEATURES = 4096
+# Предложение, почти совпадающее с уже выбранным, в выжимку не добавляется
+REDUNDANCY_THRESHOLD = 0.7
+
+FALLBACK_NOTE = "(OpenAI недоступен, показана локальная выжимка ключевых предложений.)"
+
+
+@dataclass
+class Sentence:
+    message: int
+    text: str
+    words: List[str]
+
+
+def split_sentences(texts: List[str]) -> List[Sentence]:
+    """Предложения всех сообщений с номером сообщения, из которого они взяты"""
+    sentences = []
+    for index, text in enumerate(texts):
+        for part in SENTENCE_BOUNDARY.split(text or ""):
+            part = part.strip()
+            if part:
+                sentences.append(Sentence(message=index, text=part, words=normalize(part)))
+    return sentences
+
+
+class TfidfVectors:
+    """
+    Векторы TF-IDF предложений в разреженном виде (CSR): строки нормированы, поэтому скалярное
+    произведение строк - косинусное сходство предложений. TF сублинейный (1 + log tf),
+    чтобы повторы слова внутри предложения не перевешивали
+    """
+
+    def __init__(self, sentences: List[Sentence]):
+        document_frequency: Dict[str, int] = {}
+        for sentence in sentences:
+            for word in set(sentence.words):
+                document_frequency[word] = document_frequency.get(word, 0) + 1
+        vocabulary = sorted(document_frequency, key=document_frequency.get, reverse=True)[:MAX_FEATURES]
+        columns = {word: column for column, word in enumerate(vocabulary)}
+
+        indptr, indices, counts = [0], [], []
+        for sentence in sentences:
+            row: Dict[int, int] = {}
+            for word in sentence.words:
+                column = columns.get(word)
+                if column is not None:
+                    row[column] = row.get(column, 0) + 1
+            indices.extend(row)
+            counts.extend(row.values())
+            indptr.append(len(indices))
+
+        self.shape = (len(sentences), len(vocabulary))
+        self.indptr = np.array(indptr, dtype=np.intp)
+        self.indices = np.array(indices, dtype=np.intp)
+        self.rows = np.repeat(np.arange(len(sentences)), np.diff(self.indptr))
+        df = np.array([document_frequency[word] for word in vocabulary], dtype=np.float32)
+        idf = np.log((1 + len(sentences)) / (1 + df)) + 1
+        data = (1 + np.log(np.array(counts, dtype=np.float32))) * idf[self.indices]
+        norms = np.sqrt(np.bincount(self.rows, weights=data ** 2, minlength=len(sentences)))
+        self.data = (data / norms[self.rows]).astype(np.float32)
+
+    def dense(self, rows=None) -> np.ndarray:
+        """Строки матрицы в плотном виде (все строки, если rows не задан)"""
+        rows = range(self.shape[0]) if rows is None else rows
+        matrix = np.zeros((len(rows), self.shape[1]), dtype=np.float32)
+        for position, row in enumerate(rows):
+            start, end = self.indptr[row], self.indptr[row + 1]
+            matrix[position, self.indices[start:end]] = self.data[start:end]
+        return matrix
+
+
+def textrank_scores(vectors: TfidfVectors) -> np.ndarray:
+    """Ранги предложений TextRank: PageRank на графе косинусного сходства, степенной метод"""
+    n = vectors.shape[0]
+    matrix = vectors.dense()
+    similarity = matrix @ matrix.T
+    np.fill_diagonal(similarity, 0)
+    totals = similarity.sum(axis=1, keepdims=True)
+    # Предложение без общих слов с остальными «голосует» за все предложения поровну
+    transition = np.where(totals > 0, similarity / np.where(totals > 0, totals, 1), 1 / n)
+    scores = np.full(n, 1 / n, dtype=np.float32)
+    for _ in range(TEXTRANK_ITERATIONS):
+        updated = (1 - TEXTRANK_DAMPING) / n + TEXTRANK_DAMPING * (transition.T @ scores)
+        if np.abs(updated - scores).sum() < TEXTRANK_TOLERANCE:
+            return updated
+        scores = updated
+    return scores
+
+
+def centroid_scores(vectors: TfidfVectors) -> np.ndarray:
+    """Близость предложений к центроиду текста (средней строке TF-IDF), без плотной матрицы"""
+    n, features = vectors.shape
+    centroid = np.bincount(vectors.indices, weights=vectors.data, minlength=features) / max(n, 1)
+    norm = np.linalg.norm(centroid)
+    if norm == 0:
+        return np.zeros(n)
+    return np.bincount(vectors.rows, weights=vectors.data * centroid[vectors.indices], minlength=n) / norm
+
+
+def select_sentences(sentences: List[Sentence], budget_tokens: int,
+                     max_sentences: Optional[int] = None) -> List[int]:
+    """
+    Номера лучших предложений в исходном порядке: предложения берутся по убыванию ранга,
+    пока хватает бюджета токенов, повторы уже выбранных пропускаются
+    """
+    if not sentences:
+        return []
+    vectors = TfidfVectors(sentences)
+    scores = textrank_scores(vectors) if len(sentences) <= TEXTRANK_MAX_SENTENCES else centroid_scores(vectors)
+    long_enough = np.array([len(sentence.words) >= MIN_WORDS for sentence in sentences])
+    if long_enough.any():
+        scores = np.where(long_enough, scores, -1)
+
+    selected, used = [], 0
+    # Векторы выбранных предложений; емкость удваивается по мере заполнения
+    chosen = np.zeros((16, vectors.shape[1]), dtype=np.float32)
+    for index in np.argsort(-scores, kind="stable"):
+        if scores[index] < 0 or budget_tokens - used < MIN_WORDS:
+            break
+        if max_sentences and len(selected) >= max_sentences:
+            break
+        tokens = count_tokens(sentences[index].text)
+        if used + tokens > budget_tokens:
+            continue
+        vector = vectors.dense([index])[0]
+        if selected and float((chosen[:len(selected)] @ vector).max()) > REDUNDANCY_THRESHOLD:
+            continue
+        if len(selected) == len(chosen):
+            chosen = np.concatenate([chosen, np.zeros_like(chosen)])
+        chosen[len(selected)] = vector
+        selected.append(int(index))
+        used += tokens
+    return sorted(selected)
+
+
+def compress_texts(texts: List[str], budget_tokens: int) -> List[str]:
+    """
+    Сжимает сообщения до budget_tokens токенов, оставляя ключевые предложения. Выбранные
+    предложения одного сообщения остаются вместе, порядок сообщений сохраняется.
+    Если сообщения и так помещаются в бюджет, они возвращаются без изменений
+    """
+    texts = [text for text in texts if text]
+    total = sum(count_tokens(text) for text in texts) + count_tokens(MESSAGE_SEPARATOR) * len(texts)
+    if total <= budget_tokens:
+        return texts
+
+    sentences = split_sentences(texts)
+    # Разделители между сообщениями тоже расходуют бюджет
+    selected = select_sentences(sentences, int(budget_tokens * 0.9))
+    by_message: Dict[int, List[str]] = {}
+    for index in selected:
+        by_message.setdefault(sentences[index].message, []).append(sentences[index].text)
+    compressed = [" ".join(parts) for _, parts in sorted(by_message.items())]
+
+    after = sum(count_tokens(text) for text in compressed)
+    logger.info(f"Локальное сжатие: {len(sentences)} предложений из {len(texts)} сообщений, "
+                f"оставлено {len(selected)}, примерно {total} -> {after} токенов.")
+    record_compression(total, after)
+    return compressed
+
+
+def summarize_texts(texts: List[str], max_sentences: Optional[int] = None) -> str:
+    """Локальная суммаризация: ключевые предложения сообщений списком, в порядке появления"""
+    sentences = split_sentences(texts)
+    selected = select_sentences(sentences, SUMMARY_MAX_TOKENS,
+                                max_sentences or settings.EXTRACTIVE_SUMMARY_SENTENCES)
+    if not selected:
+        return "Нет сообщений для суммаризации."
+    return "\n".join(f"• {sentences[index].text}" for index in selected)
+
+
+async def compress(texts: List[str], budget_tokens: int) -> List[str]:
+    """compress_texts в отдельном потоке: ранжирование больших входов занимает заметное время процессора"""
+    return await asyncio.to_thread(compress_texts, texts, budget_tokens)
+
+
+async def extractive_summary(texts: List[str], max_sentences: Optional[int] = None) -> str:
+    return await asyncio.to_thread(summarize_texts, texts, max_sentences)
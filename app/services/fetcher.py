@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from telethon import TelegramClient, types, utils
+
+from app.config import settings
+from app.services.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IdBoundaries:
+    """Границы периода в ID сообщений: (low, high] и сообщения на границах"""
+    low: int
+    high: int
+    before_start: Optional[object] = None
+    after_end: Optional[object] = None
+
+
+def split_id_range(low: int, high: int, size: int) -> List[Tuple[int, int]]:
+    """Разбивает диапазон ID (low, high] на поддиапазоны не больше size"""
+    return [(start, min(start + size, high)) for start in range(low, high, size)]
+
+
+def has_dense_ids(entity) -> bool:
+    """
+    ID сообщений идут подряд только в каналах и супергруппах. В личных чатах и обычных группах
+    нумерация общая для всех диалогов аккаунта, и поддиапазон ID в основном пуст
+    """
+    return isinstance(utils.get_peer(entity), types.PeerChannel)
+
+
+async def _first(user_client: TelegramClient, entity, **kwargs):
+    async for message in user_client.iter_messages(entity, limit=1, **kwargs):
+        return message
+    return None
+
+
+class RangeFetcher:
+    """
+    Параллельное получение сообщений за период: по датам определяются границы в ID сообщений,
+    в каналах и супергруппах диапазон ID разбивается на поддиапазоны, которые загружаются одновременно
+    и отдаются по порядку. В остальных диалогах диапазон читается одним проходом по страницам.
+    FloodWait обрабатывает клиент (InstrumentedTelegramClient), здесь ограничивается только параллельность.
+    """
+
+    def __init__(self, user_client: TelegramClient, entity):
+        self.user_client = user_client
+        self.entity = entity
+        self.limit = asyncio.Semaphore(settings.FETCH_CONCURRENCY)
+
+    async def boundaries(self, start: datetime, end: datetime) -> IdBoundaries:
+        """Находит последнее сообщение до начала периода, последнее сообщение периода и первое после него"""
+        before_start, last_in_period, after_end = await asyncio.gather(
+            _first(self.user_client, self.entity, offset_date=start),
+            _first(self.user_client, self.entity, offset_date=end),
+            _first(self.user_client, self.entity, offset_date=end, reverse=True),
+        )
+        low = before_start.id if before_start else 0
+        high = last_in_period.id if last_in_period else low
+        return IdBoundaries(low=low, high=max(low, high), before_start=before_start, after_end=after_end)
+
+    async def newest_id(self) -> int:
+        """ID самого нового сообщения диалога (0, если сообщений нет)"""
+        newest = await _first(self.user_client, self.entity)
+        return newest.id if newest else 0
+
+    async def _fetch_sub_range(self, min_id: int, max_id: int) -> list:
+        async with self.limit:
+            with stage("fetch_range"):
+                return [message async for message in self.user_client.iter_messages(
+                    self.entity, min_id=min_id, max_id=max_id + 1, reverse=True
+                )]
+
+    async def fetch(self, low: int, high: int):
+        """Загружает сообщения из диапазона ID (low, high] и отдает их пачками по возрастанию ID"""
+        if not has_dense_ids(self.entity):
+            async for batch in self._scan(low, high):
+                yield batch
+            return
+
+        ranges = iter(split_id_range(low, high, settings.FETCH_RANGE_SIZE))
+        # Окно ограничивает количество загруженных, но еще не отданных поддиапазонов
+        window = settings.FETCH_CONCURRENCY * 2
+        pending = deque()
+
+        def schedule():
+            while len(pending) < window:
+                sub_range = next(ranges, None)
+                if sub_range is None:
+                    return
+                pending.append(asyncio.create_task(self._fetch_sub_range(*sub_range)))
+
+        schedule()
+        try:
+            while pending:
+                batch = await pending.popleft()
+                schedule()
+                yield batch
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _scan(self, low: int, high: int):
+        """Один проход по диапазону: пачки по FETCH_RANGE_SIZE сообщений отдаются по мере загрузки"""
+        if high <= low:
+            return
+        batch = []
+        async for message in self.user_client.iter_messages(
+            self.entity, min_id=low, max_id=high + 1, reverse=True
+        ):
+            batch.append(message)
+            if len(batch) >= settings.FETCH_RANGE_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
@@ -0,0 +1,258 @@
+import asyncio
+import hashlib
+import json
+import logging
+import uuid
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Deque, List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from telethon import TelegramClient
+
+from app.client_ai import SUMMARY_FAILED
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import SummaryJob
+from app.schemas import SummarizeRequest, SummaryJobStatus
+from app.services.client_pool import client_pool
+from app.services.digest import summarize_source
+from app.services.rate_limit import set_owner
+from app.services.summarize import get_entity_by_source
+from app.services.workers import owns_session
+from app.sessions import session_store
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+async def run_summary(user_client: TelegramClient, summarize_request: SummarizeRequest) -> str:
+    """Полный цикл суммаризации: поиск источника, получение сообщений и обращение к OpenAI"""
+    entity = await get_entity_by_source(user_client, int(summarize_request.source))
+    if not entity:
+        raise ValueError("не удалось найти источник.")
+    return await summarize_source(
+        user_client, entity, summarize_request.summary_type,
+        summarize_request.period_start, summarize_request.period_end,
+    )
+
+
+async def _session_str(session_id: str) -> Optional[str]:
+    raw_session = await session_store.load(session_id)
+    return json.loads(raw_session).get("session_str") if raw_session else None
+
+
+async def client_for_session(session_id: str) -> Optional[TelegramClient]:
+    """Клиент Telegram пользователя по ID серверной сессии (для подключения заранее, без удержания)"""
+    session_str = await _session_str(session_id)
+    return await client_pool.acquire(session_str) if session_str else None
+
+
+@asynccontextmanager
+async def leased_client_for_session(session_id: str) -> AsyncIterator[Optional[TelegramClient]]:
+    """Клиент Telegram для фоновой задачи вне запроса: пул не отключит его, пока задача выполняется"""
+    session_str = await _session_str(session_id)
+    if not session_str:
+        yield None
+        return
+    async with client_pool.lease(session_str) as user_client:
+        yield user_client
+
+
+def dedup_key(session_id: str, summarize_request: SummarizeRequest) -> str:
+    """Ключ для объединения одинаковых задач пользователя (тот же источник и диапазон)"""
+    payload = json.dumps([session_id, summarize_request.model_dump()], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _to_status(job: SummaryJob) -> SummaryJobStatus:
+    return SummaryJobStatus(
+        job_id=job.id,
+        status=job.status,
+        result=job.result,
+        error=job.error,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+    )
+
+
+async def _find_in_flight(key: str) -> Optional[str]:
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(SummaryJob.id).where(
+            SummaryJob.dedup_key == key, SummaryJob.status.in_([QUEUED, RUNNING])
+        ).limit(1))
+
+
+async def _create(job_id: str, session_id: str, summarize_request: SummarizeRequest, key: str) -> bool:
+    """Создает задачу. False - незавершенная задача с тем же ключом уже есть (uq_summary_jobs_in_flight)"""
+    async with AsyncSessionLocal() as db:
+        db.add(SummaryJob(
+            id=job_id,
+            session_id=session_id,
+            source=summarize_request.source,
+            summary_type=summarize_request.summary_type,
+            period_start=summarize_request.period_start,
+            period_end=summarize_request.period_end,
+            dedup_key=key,
+            status=QUEUED,
+        ))
+        try:
+            await db.commit()
+            return True
+        except IntegrityError:
+            return False
+
+
+async def _update(job_id: str, **fields):
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(SummaryJob).where(SummaryJob.id == job_id).values(**fields, updated_at=datetime.utcnow())
+        )
+        await db.commit()
+
+
+async def _get(job_id: str) -> Optional[SummaryJob]:
+    async with AsyncSessionLocal() as db:
+        return await db.get(SummaryJob, job_id)
+
+
+async def _unfinished() -> List[SummaryJob]:
+    async with AsyncSessionLocal() as db:
+        result = await db.scalars(
+            select(SummaryJob).where(SummaryJob.status.in_([QUEUED, RUNNING])).order_by(SummaryJob.created_at)
+        )
+        return list(result)
+
+
+class JobManager:
+    """
+    Фоновая очередь задач суммаризации. Состояние задач хранится в БД и переживает перезапуск,
+    ограниченный пул воркеров выбирает задачи по очереди у разных пользователей (round-robin).
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._queues: "OrderedDict[str, Deque[str]]" = OrderedDict()
+        self._available = asyncio.Condition()
+        self._tasks: List[asyncio.Task] = []
+        self._running = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._stopping = False
+
+    async def start(self):
+        """Запускает воркеры и возвращает в очередь незавершенные задачи сессий этого процесса"""
+        for job in await _unfinished():
+            if not owns_session(job.session_id):
+                continue
+            if job.status == RUNNING:
+                await _update(job.id, status=QUEUED)
+            await self._enqueue(job.session_id, job.id)
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Запущено {self.workers} воркеров суммаризации.")
+
+    async def stop(self, timeout: float = 0):
+        """
+        Останавливает воркеры: новые задачи из очереди не берутся, выполняемые получают до timeout секунд
+        на завершение. Прерванные задачи останутся в БД и будут выполнены после перезапуска
+        """
+        self._stopping = True
+        if timeout and self._running:
+            logger.info(f"Ожидание завершения {self._running} задач суммаризации...")
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Задачи суммаризации ({self._running}) прерваны и будут выполнены после перезапуска.")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, session_id: str, summarize_request: SummarizeRequest) -> str:
+        """Ставит задачу в очередь и возвращает ее ID. Одинаковая незавершенная задача не дублируется"""
+        key = dedup_key(session_id, summarize_request)
+        while True:
+            job_id = await _find_in_flight(key)
+            if job_id:
+                return job_id
+            job_id = uuid.uuid4().hex
+            # Проверка и вставка не атомарны: одинаковую задачу могли поставить одновременно
+            if await _create(job_id, session_id, summarize_request, key):
+                break
+        await self._enqueue(session_id, job_id)
+        return job_id
+
+    async def status(self, job_id: str, session_id: str) -> Optional[SummaryJobStatus]:
+        """Статус и результат задачи (только для сессии, которая ее создала)"""
+        job = await _get(job_id)
+        if not job or job.session_id != session_id:
+            return None
+        return _to_status(job)
+
+    async def _enqueue(self, session_id: str, job_id: str):
+        async with self._available:
+            self._queues.setdefault(session_id, deque()).append(job_id)
+            self._available.notify()
+
+    async def _next(self) -> str:
+        async with self._available:
+            await self._available.wait_for(lambda: bool(self._queues))
+            # Берем задачу у первого пользователя и переносим его в конец очереди
+            session_id, queue = next(iter(self._queues.items()))
+            job_id = queue.popleft()
+            if queue:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            return job_id
+
+    async def _worker(self):
+        while True:
+            job_id = await self._next()
+            if self._stopping:
+                # Задача остается в БД в статусе queued и будет выполнена после перезапуска
+                return
+            self._running += 1
+            self._idle.clear()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка при выполнении задачи {job_id}: {e}")
+                await _update(job_id, status=FAILED, error=str(e))
+            finally:
+                self._running -= 1
+                if not self._running:
+                    self._idle.set()
+
+    async def _run(self, job_id: str):
+        job = await _get(job_id)
+        if not job or job.status not in (QUEUED, RUNNING):
+            return
+        await _update(job_id, status=RUNNING)
+        set_owner(job.session_id)
+
+        async with leased_client_for_session(job.session_id) as user_client:
+            if not user_client:
+                await _update(job_id, status=FAILED, error="Сессия пользователя недействительна.")
+                return
+
+            summary = await run_summary(user_client, SummarizeRequest(
+                source=job.source,
+                summary_type=job.summary_type,
+                period_start=job.period_start,
+                period_end=job.period_end,
+            ))
+        if summary is None or summary == SUMMARY_FAILED:
+            # OpenAI не ответил ни на одну часть: текст ошибки не должен выглядеть результатом задачи
+            await _update(job_id, status=FAILED, error=SUMMARY_FAILED)
+            return
+        await _update(job_id, status=DONE, result=summary)
+
+
+job_manager = JobManager(workers=settings.JOB_WORKERS)
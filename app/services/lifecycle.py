@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select, text
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.client_ai import get_openai_client, warm_openai_client
+from app.config import settings
+from app.database import AsyncSessionLocal, async_engine
+from app.models import UserSessionAccess
+from app.services.chunking import count_tokens
+from app.services.jobs import client_for_session
+from app.services.metrics import IN_FLIGHT_REQUESTS, STARTUP_SECONDS
+from app.services.workers import owns_session
+from app.sessions import session_store
+
+logger = logging.getLogger(__name__)
+
+STARTING, READY, DRAINING = "starting", "ready", "draining"
+
+
+class RequestTracker:
+    """
+    Счетчик обрабатываемых запросов. При остановке новые запросы отклоняются (503),
+    а остановка фоновых сервисов и отключение клиентов ждут завершения уже начатых
+    """
+
+    def __init__(self):
+        self.active = 0
+        self.draining = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def enter(self):
+        self.active += 1
+        self._idle.clear()
+        IN_FLIGHT_REQUESTS.set(self.active)
+
+    def exit(self):
+        self.active -= 1
+        if not self.active:
+            self._idle.set()
+        IN_FLIGHT_REQUESTS.set(self.active)
+
+    def start_draining(self):
+        """Новые запросы получают 503, уже начатые продолжают выполняться"""
+        self.draining = True
+
+    async def drain(self, timeout: float) -> bool:
+        """Перестает принимать запросы и ждет завершения начатых. Возвращает False по таймауту"""
+        self.start_draining()
+        if self.active:
+            logger.info(f"Ожидание завершения {self.active} запросов...")
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"Не дождались завершения {self.active} запросов за {timeout} с.")
+            return False
+
+
+class DrainMiddleware:
+    """
+    Учитывает обрабатываемые запросы в RequestTracker и отвечает 503 после начала остановки.
+    Пути из exempt (проверка готовности) обслуживаются и во время остановки
+    """
+
+    def __init__(self, app: ASGIApp, tracker: RequestTracker, exempt: Tuple[str, ...] = ("/health",)):
+        self.app = app
+        self.tracker = tracker
+        self.exempt = exempt
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.tracker.draining and scope["path"] not in self.exempt:
+            await send({"type": "http.response.start", "status": 503, "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"), (b"retry-after", b"1"), (b"connection", b"close"),
+            ]})
+            await send({"type": "http.response.body", "body": "Сервис перезапускается".encode("utf-8")})
+            return
+        self.tracker.enter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.tracker.exit()
+
+
+class SessionActivityTracker:
+    """
+    Время последнего обращения сессий (user_session_access, по нему же удаляются устаревшие сессии).
+    Запись в БД не чаще SESSION_TOUCH_INTERVAL для одной сессии, поэтому большинство запросов обходится без нее
+    """
+
+    def __init__(self, interval: float, max_size: int):
+        self.interval = interval
+        self.max_size = max_size
+        self._touched: "OrderedDict[str, float]" = OrderedDict()
+
+    async def touch(self, session_id: Optional[str]):
+        if not session_id:
+            return
+        now = time.monotonic()
+        touched = self._touched.get(session_id)
+        if touched is not None and now - touched < self.interval:
+            return
+        self._touched[session_id] = now
+        self._touched.move_to_end(session_id)
+        while len(self._touched) > self.max_size:
+            self._touched.popitem(last=False)
+        try:
+            await session_store.touch(session_id)
+        except Exception as e:
+            logger.warning(f"Не удалось записать активность сессии: {e}")
+
+    async def recent(self, window: float, limit: int):
+        """ID недавно активных сессий этого процесса, от последних к более ранним"""
+        since = datetime.utcnow() - timedelta(seconds=window)
+        async with AsyncSessionLocal() as db:
+            result = await db.scalars(
+                select(UserSessionAccess.session_id)
+                .where(UserSessionAccess.accessed_at >= since)
+                .order_by(UserSessionAccess.accessed_at.desc())
+            )
+            return [session_id for session_id in result if owns_session(session_id)][:limit]
+
+
+class Lifecycle:
+    """
+    Запуск и остановка процесса: прогрев соединений до приема запросов, фоновое подключение
+    клиентов Telegram недавно активных пользователей, замер времени запуска и плавная остановка
+    """
+
+    def __init__(self):
+        self.requests = RequestTracker()
+        self.activity = SessionActivityTracker(settings.SESSION_TOUCH_INTERVAL, settings.SESSION_CACHE_SIZE)
+        self.started_at = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self._warmup: Optional[asyncio.Task] = None
+        self._started = False
+        self.warmed_up = False
+
+    @property
+    def status(self) -> str:
+        """
+        Готовность не ждет фонового прогрева: без него запросы обслуживаются, клиенты Telegram подключаются
+        при первом обращении. Иначе недоступность Telegram или OpenAI задерживала бы готовность до WARMUP_TIMEOUT
+        """
+        if self.requests.draining:
+            return DRAINING
+        return READY if self._started else STARTING
+
+    def mark_started(self, started_at: float):
+        """Точка отсчета времени запуска: начало импорта приложения"""
+        self.started_at = started_at
+
+    def _record(self, phase: str, seconds: float):
+        self.timings[phase] = round(seconds, 3)
+        STARTUP_SECONDS.labels(phase).set(seconds)
+
+    async def _step(self, name: str, coroutine):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(coroutine, settings.WARMUP_TIMEOUT)
+            logger.info(f"Прогрев {name}: {time.perf_counter() - started:.2f} с.")
+        except Exception as e:
+            logger.warning(f"Прогрев {name} не выполнен: {e!r}")
+
+    async def startup(self):
+        """
+        Выполняется до приема запросов: пул соединений БД, токенизатор и клиент OpenAI (импорт пакета
+        openai) прогреваются параллельно. Соединение с OpenAI и клиенты Telegram прогреваются в фоне
+        """
+        self._record("import", time.perf_counter() - self.started_at)
+        started = time.perf_counter()
+        await asyncio.gather(
+            self._step("БД", self._warm_database()),
+            self._step("токенизатора", asyncio.to_thread(count_tokens, "прогрев")),
+            self._step("клиента OpenAI", asyncio.to_thread(get_openai_client)),
+        )
+        self._record("startup", time.perf_counter() - started)
+        self._record("ready", time.perf_counter() - self.started_at)
+        logger.info(f"Приложение готово к работе за {self.timings['ready']:.2f} с "
+                    f"(импорт {self.timings['import']:.2f} с, запуск {self.timings['startup']:.2f} с).")
+        self._started = True
+        self._warmup = asyncio.create_task(self._background_warmup())
+
+    async def _warm_database(self):
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    async def _background_warmup(self):
+        started = time.perf_counter()
+        steps = [self._step("сессий Telegram", self._warm_sessions())]
+        if settings.WARMUP_OPENAI:
+            steps.append(self._step("OpenAI", warm_openai_client()))
+        await asyncio.gather(*steps)
+        self._record("warmup", time.perf_counter() - started)
+        self.warmed_up = True
+        logger.info(f"Фоновый прогрев завершен за {self.timings['warmup']:.2f} с.")
+
+    async def _warm_sessions(self):
+        """Заранее подключает клиентов Telegram недавно активных сессий (не больше WARMUP_SESSIONS)"""
+        session_ids = await self.activity.recent(settings.WARMUP_SESSION_WINDOW, settings.WARMUP_SESSIONS)
+        if not session_ids:
+            return
+
+        async def connect(session_id: str) -> bool:
+            try:
+                return bool(await client_for_session(session_id))
+            except Exception as e:
+                logger.warning(f"Не удалось заранее подключить сессию: {e}")
+            return False
+
+        connected = await asyncio.gather(*(connect(session_id) for session_id in session_ids))
+        logger.info(f"Заранее подключено клиентов Telegram: {sum(connected)} из {len(session_ids)}.")
+
+    async def drain(self) -> float:
+        """
+        Начало остановки: новые запросы получают 503, начатые получают время на завершение.
+        Возвращает оставшуюся часть SHUTDOWN_DRAIN_TIMEOUT для остановки фоновых задач
+        """
+        started = time.perf_counter()
+        if self._warmup:
+            self._warmup.cancel()
+            await asyncio.gather(self._warmup, return_exceptions=True)
+        await self.requests.drain(settings.SHUTDOWN_DRAIN_TIMEOUT)
+        return max(0.0, settings.SHUTDOWN_DRAIN_TIMEOUT - (time.perf_counter() - started))
+
+
+lifecycle = Lifecycle()
@@ -0,0 +1,171 @@
+import asyncio
+import base64
+import binascii
+import logging
+import time
+import weakref
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from telethon import TelegramClient, utils
+
+from app.config import settings
+from app.schemas import MessageItem, MessagePage
+from app.services.archive import MessageArchive, StoredMessage
+from app.services.client_pool import client_pool
+from app.services.metrics import record_cache, stage
+
+logger = logging.getLogger(__name__)
+
+PageKey = Tuple[int, int, int]  # (peer_id, offset_id, limit)
+
+
+def encode_cursor(peer_id: int, offset_id: int) -> str:
+    """Непрозрачный курсор страницы: ID диалога и offset_id следующего запроса к Telegram"""
+    return base64.urlsafe_b64encode(f"{peer_id}:{offset_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, peer_id: int) -> int:
+    """Возвращает offset_id из курсора. Курсор другого диалога или поврежденный курсор - ошибка"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        cursor_peer, offset_id = (int(part) for part in raw.split(":"))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("некорректный курсор.")
+    if cursor_peer != peer_id or offset_id <= 0:
+        raise ValueError("курсор относится к другому диалогу.")
+    return offset_id
+
+
+class PageCache:
+    """
+    Страницы сообщений одного пользователя в памяти. После отдачи страницы следующая
+    загружается в фоне, поэтому прокрутка истории назад отдается без обращения к Telegram и БД.
+    """
+
+    def __init__(self, user_client: TelegramClient):
+        self.user_client = user_client
+        self._pages: "OrderedDict[PageKey, Tuple[float, List[StoredMessage]]]" = OrderedDict()
+        self._pending: Dict[PageKey, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _get(self, key: PageKey) -> Optional[List[StoredMessage]]:
+        entry = self._pages.get(key)
+        if entry is None:
+            return None
+        created, rows = entry
+        if time.monotonic() - created > settings.MESSAGE_PAGE_CACHE_TTL:
+            del self._pages[key]
+            return None
+        self._pages.move_to_end(key)
+        return rows
+
+    def _put(self, key: PageKey, rows: List[StoredMessage]):
+        self._pages[key] = (time.monotonic(), rows)
+        self._pages.move_to_end(key)
+        while len(self._pages) > settings.MESSAGE_PAGE_CACHE_SIZE:
+            self._pages.popitem(last=False)
+
+    async def _load(self, entity, key: PageKey) -> List[StoredMessage]:
+        _, offset_id, limit = key
+        archive = MessageArchive(self.user_client, entity)
+        with stage("fetch"):
+            rows = await (archive.before(offset_id, limit) if offset_id else archive.recent(limit))
+        return rows
+
+    async def get(self, entity, offset_id: int, limit: int) -> List[StoredMessage]:
+        key = (utils.get_peer_id(entity), offset_id, limit)
+        rows = self._get(key)
+        # Первая страница всегда запрашивается заново: в диалоге могли появиться новые сообщения
+        if rows is not None and offset_id:
+            record_cache("message_pages", True)
+            return rows
+        pending = self._pending.get(key)
+        if pending is not None:
+            # Страница уже загружается в фоне: ждем ее вместо повторного запроса
+            rows = await asyncio.shield(pending)
+            if rows is not None:
+                record_cache("message_pages", True)
+                return rows
+        record_cache("message_pages", False)
+        rows = await self._load(entity, key)
+        self._put(key, rows)
+        return rows
+
+    def prefetch(self, entity, offset_id: int, limit: int):
+        """Загружает страницу в фоне, если ее еще нет в кэше"""
+        key = (utils.get_peer_id(entity), offset_id, limit)
+        if key in self._pending or self._get(key) is not None:
+            return
+        task = asyncio.create_task(self._prefetch(entity, key))
+        self._pending[key] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _prefetch(self, entity, key: PageKey) -> Optional[List[StoredMessage]]:
+        try:
+            rows = await self._load(entity, key)
+            self._put(key, rows)
+            return rows
+        except Exception as e:
+            logger.warning(f"Не удалось заранее загрузить страницу сообщений {key}: {e}")
+            return None
+        finally:
+            self._pending.pop(key, None)
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._pages.clear()
+
+
+_caches: "weakref.WeakKeyDictionary[TelegramClient, PageCache]" = weakref.WeakKeyDictionary()
+
+
+def get_page_cache(user_client: TelegramClient) -> PageCache:
+    cache = _caches.get(user_client)
+    if cache is None:
+        cache = _caches[user_client] = PageCache(user_client)
+    return cache
+
+
+def drop_page_cache(user_client: TelegramClient):
+    cache = _caches.pop(user_client, None)
+    if cache is not None:
+        cache.close()
+
+
+client_pool.on_evict(drop_page_cache)
+
+
+async def get_message_page(user_client: TelegramClient, entity, cursor: Optional[str] = None,
+                           limit: Optional[int] = None) -> MessagePage:
+    """
+    Страница сообщений диалога от новых к старым. cursor - значение next_cursor предыдущей страницы.
+    После ответа следующая страница загружается в фоне.
+    """
+    limit = max(1, min(limit or settings.MESSAGE_PAGE_SIZE, settings.MESSAGE_PAGE_MAX))
+    peer_id = utils.get_peer_id(entity)
+    offset_id = decode_cursor(cursor, peer_id) if cursor else 0
+
+    cache = get_page_cache(user_client)
+    rows = await cache.get(entity, offset_id, limit)
+    next_cursor = None
+    # Неполная страница означает, что достигнуто начало истории
+    if len(rows) == limit:
+        next_offset = rows[-1].id
+        next_cursor = encode_cursor(peer_id, next_offset)
+        cache.prefetch(entity, next_offset, limit)
+
+    return MessagePage(
+        items=[MessageItem(id=row.id, date=row.date, text=row.text, sender_id=row.sender_id) for row in rows],
+        next_cursor=next_cursor,
+    )
+
+
+def iter_page_json(page: MessagePage):
+    """Сериализует страницу по одному сообщению, не собирая весь JSON в памяти"""
+    yield '{"items":['
+    for index, item in enumerate(page.items):
+        yield ("," if index else "") + item.model_dump_json(exclude_none=True)
+    yield '],"next_cursor":' + ("null" if page.next_cursor is None else f'"{page.next_cursor}"') + "}"
@@ -0,0 +1,156 @@
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = Histogram(
+    "stage_duration_seconds",
+    "Длительность этапов обработки запроса",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+TELEGRAM_REQUESTS = Counter("telegram_requests_total", "Запросы к Telegram API", ["method"])
+TELEGRAM_FLOOD_WAITS = Counter("telegram_flood_waits_total", "Ответы FloodWait от Telegram API")
+TELEGRAM_FLOOD_WAIT_SECONDS = Counter("telegram_flood_wait_seconds_total", "Время ожидания по FloodWait")
+OPENAI_REQUESTS = Counter("openai_requests_total", "Запросы к OpenAI API", ["outcome"])
+OPENAI_TOKENS = Counter("openai_tokens_total", "Токены OpenAI из response.usage", ["type"])
+CACHE_REQUESTS = Counter("cache_requests_total", "Обращения к кэшам приложения", ["cache", "result"])
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "rate_limit_wait_seconds",
+    "Ожидание в очереди планировщика исходящих вызовов",
+    ["api"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+RATE_LIMIT_CONCURRENCY = Gauge("rate_limit_concurrency", "Текущий предел параллельности планировщика", ["api"])
+RATE_LIMIT_THROTTLES = Counter("rate_limit_throttles_total", "Сигналы перегрузки (FloodWait, 429)", ["api"])
+DEDUP_MESSAGES = Counter("dedup_removed_messages_total", "Повторы сообщений, удаленные перед суммаризацией", ["kind"])
+DEDUP_TOKENS = Counter("dedup_saved_tokens_total", "Токены, сэкономленные удалением повторов сообщений")
+EXTRACTIVE_TOKENS = Counter("extractive_saved_tokens_total", "Токены, сэкономленные локальным сжатием перед OpenAI")
+LOCAL_SUMMARIES = Counter("local_summaries_total", "Локальные суммаризации без OpenAI", ["reason"])
+STARTUP_SECONDS = Gauge("startup_duration_seconds", "Длительность этапов запуска процесса", ["phase"])
+IN_FLIGHT_REQUESTS = Gauge("in_flight_requests", "Обрабатываемые HTTP-запросы")
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# Этапы текущего запроса для заголовка Server-Timing. Список общий для задач, созданных внутри запроса
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+@contextmanager
+def stage(name: str):
+    """Измеряет длительность этапа: запись в гистограмму и в заголовок Server-Timing текущего запроса"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(name).observe(elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_flood_wait(seconds: float):
+    TELEGRAM_FLOOD_WAITS.inc()
+    TELEGRAM_FLOOD_WAIT_SECONDS.inc(seconds)
+
+
+def record_dedup(exact: int, near: int, tokens_saved: int):
+    DEDUP_MESSAGES.labels("exact").inc(exact)
+    DEDUP_MESSAGES.labels("near").inc(near)
+    DEDUP_TOKENS.inc(tokens_saved)
+
+
+def record_compression(tokens_before: int, tokens_after: int):
+    EXTRACTIVE_TOKENS.inc(max(0, tokens_before - tokens_after))
+
+
+def record_local_summary(reason: str):
+    """reason: "requested" - выбрана пользователем, "fallback" - OpenAI недоступен"""
+    LOCAL_SUMMARIES.labels(reason).inc()
+
+
+def record_openai_usage(usage):
+    """Учитывает токены из usage ответа OpenAI (может отсутствовать, например у потоковых ответов)"""
+    if usage is None:
+        return
+    OPENAI_TOKENS.labels("prompt").inc(usage.prompt_tokens or 0)
+    OPENAI_TOKENS.labels("completion").inc(usage.completion_tokens or 0)
+
+
+class ClientPoolCollector:
+    """Отдает счетчики пула клиентов Telegram в момент сбора метрик"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def collect(self):
+        stats = self.pool.stats()
+        size = GaugeMetricFamily("telegram_client_pool_size", "Подключенные клиенты в пуле")
+        size.add_metric([], stats["size"])
+        yield size
+        leased = GaugeMetricFamily("telegram_client_pool_leased", "Клиенты пула, используемые запросами и задачами")
+        leased.add_metric([], stats["leased"])
+        yield leased
+        for name in ("hits", "misses", "evictions"):
+            counter = CounterMetricFamily(f"telegram_client_pool_{name}", f"Пул клиентов Telegram: {name}")
+            counter.add_metric([], stats[name])
+            yield counter
+
+
+def register_client_pool(pool):
+    REGISTRY.register(ClientPoolCollector(pool))
+
+
+def render() -> bytes:
+    return generate_latest(REGISTRY)
+
+
+def _server_timing(timings: List[Tuple[str, float]], total: float) -> str:
+    entries = [f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in timings]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class TimingHeaderMiddleware:
+    """
+    Добавляет к ответу заголовок Server-Timing с этапами, завершенными до начала ответа.
+    Для потоковых ответов (SSE) этапы, выполняющиеся во время передачи, в заголовок не попадают.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", _server_timing(timings, time.perf_counter() - started))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_timings.reset(token)
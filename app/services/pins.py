@@ -0,0 +1,297 @@
+import asyncio
+import logging
+import zlib
+from datetime import datetime, time, timedelta, timezone
+from typing import List, Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import aliased
+from telethon import utils
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import PinnedSource
+from app.services.digest import summarize_source
+from app.services.jobs import leased_client_for_session
+from app.services.metrics import record_cache, stage
+from app.services.rate_limit import set_owner
+from app.services.summarize import get_entity_by_source
+from app.services.workers import owns_session
+
+logger = logging.getLogger(__name__)
+
+# Для закрепленных источников подходят только типы без явного периода
+PIN_SUMMARY_TYPES = ("last_10", "incremental")
+
+
+def parse_schedule_time(value: str) -> time:
+    """Время расписания в формате ЧЧ:ММ"""
+    try:
+        return datetime.strptime(value.strip(), "%H:%M").time()
+    except ValueError:
+        raise ValueError("время расписания должно быть в формате ЧЧ:ММ.")
+
+
+def next_run_at(pin_id: int, schedule_time: str, after: datetime) -> datetime:
+    """
+    Ближайший запуск подготовки после after (naive UTC). Суммаризация готовится в окне
+    PIN_PRECOMPUTE_WINDOW до времени расписания, а сдвиг внутри окна зависит от ID,
+    поэтому источники с одинаковым расписанием не запрашиваются одновременно.
+    """
+    tz = ZoneInfo(settings.PIN_TIMEZONE)
+    ready_time = parse_schedule_time(schedule_time)
+    lead = timedelta(seconds=zlib.crc32(str(pin_id).encode()) % max(1, settings.PIN_PRECOMPUTE_WINDOW))
+    day = after.replace(tzinfo=timezone.utc).astimezone(tz).date()
+    while True:
+        ready_at = datetime.combine(day, ready_time, tzinfo=tz)
+        run_at = (ready_at - lead).astimezone(timezone.utc).replace(tzinfo=None)
+        if run_at > after:
+            return run_at
+        day += timedelta(days=1)
+
+
+def format_age(computed_at: datetime) -> str:
+    """Давность подготовленной суммаризации: «5 мин назад», «2 ч 10 мин назад»"""
+    minutes = int((datetime.utcnow() - computed_at).total_seconds() // 60)
+    if minutes < 1:
+        return "только что"
+    if minutes < 60:
+        return f"{minutes} мин назад"
+    if minutes < 24 * 60:
+        return f"{minutes // 60} ч {minutes % 60} мин назад"
+    return f"{minutes // (24 * 60)} дн назад"
+
+
+async def attach_pins(owner_id: int, session_id: str):
+    """
+    Переносит закрепления владельца на его текущую сессию: после входа у пользователя новый ID сессии.
+    Приостановленные закрепления готовятся на ближайшем проходе планировщика. Закрепления прежнего
+    формата из этой сессии получают владельца, дубликаты уже закрепленных им источников удаляются
+    """
+    owned = aliased(PinnedSource)
+    duplicate = select(owned.id).where(
+        owned.owner_id == owner_id,
+        owned.source == PinnedSource.source,
+        owned.summary_type == PinnedSource.summary_type,
+    ).exists()
+    legacy = (PinnedSource.owner_id.is_(None), PinnedSource.session_id == session_id)
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(PinnedSource).where(*legacy, duplicate))
+        await db.execute(update(PinnedSource).where(*legacy).values(owner_id=owner_id))
+        await db.execute(
+            update(PinnedSource)
+            .where(PinnedSource.owner_id == owner_id, PinnedSource.session_id.is_(None))
+            .values(next_run_at=datetime.utcnow())
+        )
+        await db.execute(update(PinnedSource).where(PinnedSource.owner_id == owner_id).values(session_id=session_id))
+        await db.commit()
+
+
+async def list_pins(owner_id: int) -> List[PinnedSource]:
+    async with AsyncSessionLocal() as db:
+        result = await db.scalars(
+            select(PinnedSource).where(PinnedSource.owner_id == owner_id).order_by(PinnedSource.schedule_time)
+        )
+        return list(result)
+
+
+async def create_pin(owner_id: int, session_id: str, source: str, title: str, summary_type: str,
+                     schedule_time: str) -> PinnedSource:
+    """
+    Закрепляет источник за аккаунтом owner_id, суммаризация готовится от имени сессии session_id.
+    Повторное закрепление того же источника и типа меняет расписание
+    """
+    if summary_type not in PIN_SUMMARY_TYPES:
+        raise ValueError("для закрепления доступны только последние 10 сообщений и новые с прошлой суммаризации.")
+    schedule_time = parse_schedule_time(schedule_time).strftime("%H:%M")
+    async with AsyncSessionLocal() as db:
+        pin = await db.scalar(select(PinnedSource).where(
+            PinnedSource.owner_id == owner_id,
+            PinnedSource.source == source,
+            PinnedSource.summary_type == summary_type,
+        ))
+        if pin is None:
+            count = await db.scalar(
+                select(func.count()).select_from(PinnedSource).where(PinnedSource.owner_id == owner_id)
+            )
+            if count >= settings.PIN_MAX_PER_USER:
+                raise ValueError(f"можно закрепить не больше {settings.PIN_MAX_PER_USER} источников.")
+            pin = PinnedSource(owner_id=owner_id, source=source, summary_type=summary_type,
+                               schedule_time=schedule_time, next_run_at=datetime.utcnow())
+            db.add(pin)
+            # ID нужен для расчета сдвига в окне подготовки
+            await db.flush()
+        pin.session_id = session_id
+        pin.title = title
+        pin.schedule_time = schedule_time
+        pin.next_run_at = next_run_at(pin.id, schedule_time, datetime.utcnow())
+        await db.commit()
+        return pin
+
+
+async def delete_pin(owner_id: int, pin_id: int):
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(PinnedSource).where(PinnedSource.id == pin_id, PinnedSource.owner_id == owner_id))
+        await db.commit()
+
+
+async def run_pin_now(owner_id: int, pin_id: int):
+    """Ставит подготовку суммаризации на ближайший проход планировщика"""
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(PinnedSource)
+            .where(PinnedSource.id == pin_id, PinnedSource.owner_id == owner_id)
+            .values(next_run_at=datetime.utcnow())
+        )
+        await db.commit()
+
+
+async def find_precomputed(owner_id: int, source: str, summary_type: str) -> Optional[PinnedSource]:
+    """Заранее подготовленная суммаризация, не старше PIN_MAX_AGE"""
+    if summary_type not in PIN_SUMMARY_TYPES:
+        return None
+    fresh_after = datetime.utcnow() - timedelta(seconds=settings.PIN_MAX_AGE)
+    async with AsyncSessionLocal() as db:
+        pin = await db.scalar(select(PinnedSource).where(
+            PinnedSource.owner_id == owner_id,
+            PinnedSource.source == source,
+            PinnedSource.summary_type == summary_type,
+            PinnedSource.summary.is_not(None),
+            PinnedSource.computed_at >= fresh_after,
+        ))
+    record_cache("pinned", pin is not None)
+    return pin
+
+
+async def _due(now: datetime, limit: int) -> List[PinnedSource]:
+    """Источники с наступившим временем запуска из сессий этого процесса"""
+    async with AsyncSessionLocal() as db:
+        result = await db.scalars(
+            select(PinnedSource)
+            .where(PinnedSource.next_run_at <= now, PinnedSource.session_id.is_not(None))
+            .order_by(PinnedSource.next_run_at)
+        )
+        return [pin for pin in result if owns_session(pin.session_id)][:limit]
+
+
+async def _claim(pin: PinnedSource, now: datetime) -> bool:
+    """Переносит запуск на следующий день расписания. Возвращает False, если источник уже взят в работу"""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(PinnedSource)
+            .where(PinnedSource.id == pin.id, PinnedSource.next_run_at == pin.next_run_at)
+            .values(next_run_at=next_run_at(pin.id, pin.schedule_time, now))
+        )
+        await db.commit()
+        return result.rowcount == 1
+
+
+async def _suspend(pin: PinnedSource):
+    """
+    Сессия закрепления недействительна: подготовка закреплений владельца в этой сессии приостанавливается
+    до его следующего входа. Закрепление прежнего формата без владельца восстановить нельзя, оно удаляется
+    """
+    async with AsyncSessionLocal() as db:
+        if pin.owner_id is None:
+            await db.execute(delete(PinnedSource).where(PinnedSource.id == pin.id))
+        else:
+            await db.execute(
+                update(PinnedSource)
+                .where(PinnedSource.owner_id == pin.owner_id, PinnedSource.session_id == pin.session_id)
+                .values(session_id=None)
+            )
+        await db.commit()
+
+
+async def _update(pin_id: int, **fields):
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(PinnedSource).where(PinnedSource.id == pin_id).values(**fields))
+        await db.commit()
+
+
+class PinScheduler:
+    """
+    Фоновая подготовка суммаризаций закрепленных источников к времени из расписания.
+    Источники с наступившим временем запуска обрабатываются не более PIN_CONCURRENCY одновременно,
+    вызовы Telegram и OpenAI идут через общий планировщик от имени владельца источника.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self._task: Optional[asyncio.Task] = None
+        self._busy: Optional[asyncio.Future] = None
+        self._stopping = False
+
+    async def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._loop())
+        logger.info("Запущен планировщик закрепленных источников.")
+
+    async def stop(self, timeout: float = 0):
+        """Останавливает планировщик. Уже начатая подготовка получает до timeout секунд на завершение"""
+        self._stopping = True
+        if timeout and self._busy is not None and not self._busy.done():
+            logger.info("Ожидание завершения подготовки закрепленных источников...")
+            await asyncio.wait({self._busy}, timeout=timeout)
+        if self._busy is not None:
+            self._busy.cancel()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка планировщика закрепленных источников: {e}")
+            await asyncio.sleep(settings.PIN_POLL_INTERVAL)
+
+    async def run_due(self):
+        """Подготавливает суммаризации всех источников, время запуска которых наступило"""
+        while not self._stopping:
+            now = datetime.utcnow()
+            pins = [pin for pin in await _due(now, self.concurrency) if await _claim(pin, now)]
+            if not pins:
+                return
+            # Отдельная задача, чтобы при остановке дождаться ее, не прерывая цикл планировщика
+            self._busy = asyncio.gather(*(self._precompute(pin) for pin in pins))
+            await asyncio.shield(self._busy)
+
+    async def _precompute(self, pin: PinnedSource):
+        set_owner(pin.session_id)
+        try:
+            async with leased_client_for_session(pin.session_id) as user_client:
+                if not user_client:
+                    logger.info(f"Сессия закрепленного источника {pin.id} недействительна, "
+                                f"подготовка приостановлена до следующего входа владельца.")
+                    await _suspend(pin)
+                    return
+                if pin.owner_id is None:
+                    await attach_pins(await user_client.get_peer_id("me"), pin.session_id)
+                with stage("pin"):
+                    entity = await get_entity_by_source(user_client, int(pin.source))
+                    if not entity:
+                        raise ValueError("не удалось найти источник.")
+                    summary = await summarize_source(user_client, entity, pin.summary_type)
+            await _update(pin.id, summary=summary, error=None, computed_at=datetime.utcnow(),
+                          title=utils.get_display_name(entity) or pin.title)
+            logger.info(f"Подготовлена суммаризация закрепленного источника {pin.id}.")
+        except asyncio.CancelledError:
+            # Подготовка прервана остановкой процесса: источник будет подготовлен после перезапуска
+            await _update(pin.id, next_run_at=datetime.utcnow())
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка при подготовке закрепленного источника {pin.id}: {e}")
+            # Повтор раньше следующего дня расписания, но не позже него
+            now = datetime.utcnow()
+            retry_at = min(now + timedelta(seconds=settings.PIN_RETRY_DELAY),
+                           next_run_at(pin.id, pin.schedule_time, now))
+            await _update(pin.id, error=str(e), next_run_at=retry_at)
+
+
+pin_scheduler = PinScheduler(concurrency=settings.PIN_CONCURRENCY)
@@ -0,0 +1,195 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Optional
+
+from app.config import settings
+from app.services.metrics import RATE_LIMIT_CONCURRENCY, RATE_LIMIT_THROTTLES, RATE_LIMIT_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+ANONYMOUS = "anonymous"
+
+# Пользователь, от имени которого выполняются исходящие вызовы (для справедливой очереди)
+_current_owner: contextvars.ContextVar[str] = contextvars.ContextVar("rate_limit_owner", default=ANONYMOUS)
+
+
+def set_owner(owner: Optional[str]):
+    """Задает пользователя для исходящих вызовов текущего запроса или задачи"""
+    _current_owner.set(owner or ANONYMOUS)
+
+
+def current_owner() -> str:
+    return _current_owner.get()
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity. Ожидающие обслуживаются по очереди"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens: float = 1):
+        # Запрос больше емкости корзины иначе не выполнился бы никогда
+        tokens = min(tokens, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.paused_until - now
+                if wait <= 0 and self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep(max(wait, (tokens - self.tokens) / self.rate))
+
+    def pause(self, seconds: float):
+        """Приостанавливает выдачу токенов (например, на время FloodWait или Retry-After)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """
+    Планировщик вызовов одного API: корзины токенов на запросы (и, при необходимости, на токены модели),
+    адаптивная параллельность (AIMD) и справедливая очередь между пользователями.
+    Свободные слоты выдаются по очереди пользователям (round-robin), поэтому один пользователь
+    с большим количеством вызовов не задерживает остальных. При сигнале перегрузки (FloodWait, 429)
+    параллельность уменьшается вдвое, при успешных вызовах постепенно восстанавливается.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, max_concurrency: int,
+                 token_rate: Optional[float] = None, token_burst: Optional[float] = None,
+                 report_concurrency: bool = True):
+        self.name = name
+        # Для ограничителей отдельных аккаунтов общий gauge не имеет смысла
+        self.report_concurrency = report_concurrency
+        self.requests = TokenBucket(rate, burst)
+        self.tokens = TokenBucket(token_rate, token_burst or token_rate) if token_rate else None
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.active = 0
+        self._successes = 0
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._report_limit()
+
+    def _report_limit(self):
+        if self.report_concurrency:
+            RATE_LIMIT_CONCURRENCY.labels(self.name).set(self.limit)
+
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _dispatch(self):
+        while self.active < self.limit and self._queues:
+            # Слот получает первый пользователь в очереди, затем он переносится в конец
+            owner, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(owner)
+            else:
+                del self._queues[owner]
+            if not waiter.done():
+                self.active += 1
+                waiter.set_result(None)
+
+    async def _acquire_slot(self, owner: str):
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(owner, deque()).append(waiter)
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Слот уже выдан, но вызов отменен: возвращаем слот
+                self._release_slot()
+            else:
+                queue = self._queues.get(owner)
+                if queue and waiter in queue:
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._queues[owner]
+            raise
+
+    def _release_slot(self):
+        self.active -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, owner: Optional[str] = None, tokens: float = 0):
+        """Ожидает очереди пользователя, свободного слота и токенов, после чего выполняет вызов"""
+        started = time.monotonic()
+        await self._acquire_slot(owner or current_owner())
+        try:
+            await self.requests.acquire()
+            if self.tokens and tokens:
+                await self.tokens.acquire(tokens)
+            RATE_LIMIT_WAIT_SECONDS.labels(self.name).observe(time.monotonic() - started)
+            yield
+        finally:
+            self._release_slot()
+
+    def on_success(self):
+        """Аддитивное увеличение: +1 к параллельности после limit успешных вызовов подряд"""
+        if self.limit >= self.max_concurrency:
+            return
+        self._successes += 1
+        if self._successes >= self.limit:
+            self._successes = 0
+            self.limit += 1
+            self._report_limit()
+            self._dispatch()
+
+    def on_throttle(self, retry_after: float):
+        """Мультипликативное уменьшение параллельности и пауза корзины на время retry_after"""
+        self._successes = 0
+        self.limit = max(1, self.limit // 2)
+        self.requests.pause(retry_after)
+        self._report_limit()
+        RATE_LIMIT_THROTTLES.labels(self.name).inc()
+        logger.warning(f"{self.name}: ограничение частоты, пауза {retry_after:.1f} с, параллельность {self.limit}.")
+
+
+def telegram_account_limiter() -> RateLimiter:
+    """Ограничитель запросов одного аккаунта Telegram (FloodWait выдается на аккаунт)"""
+    return RateLimiter(
+        "telegram_account",
+        rate=settings.TELEGRAM_ACCOUNT_RATE,
+        burst=settings.TELEGRAM_ACCOUNT_BURST,
+        max_concurrency=settings.TELEGRAM_ACCOUNT_CONCURRENCY,
+        report_concurrency=False,
+    )
+
+
+# Общие лимиты делятся поровну между процессами-воркерами. Лимиты аккаунта не делятся:
+# аккаунт пользователя обслуживается только одним процессом
+_share = 1 / max(1, settings.WORKER_COUNT)
+
+telegram_limiter = RateLimiter(
+    "telegram",
+    rate=settings.TELEGRAM_GLOBAL_RATE * _share,
+    burst=max(1.0, settings.TELEGRAM_GLOBAL_BURST * _share),
+    max_concurrency=max(1, int(settings.TELEGRAM_GLOBAL_CONCURRENCY * _share)),
+)
+
+# Лимиты OpenAI задаются в минуту, корзины вмещают запас на OPENAI_BURST_SECONDS секунд
+_openai_rate = settings.OPENAI_RPM / 60 * _share
+_openai_token_rate = settings.OPENAI_TPM / 60 * _share
+openai_limiter = RateLimiter(
+    "openai",
+    rate=_openai_rate,
+    burst=max(1.0, _openai_rate * settings.OPENAI_BURST_SECONDS),
+    max_concurrency=max(1, int(settings.OPENAI_CONCURRENCY * _share)),
+    token_rate=_openai_token_rate if settings.OPENAI_TPM else None,
+    token_burst=_openai_token_rate * settings.OPENAI_BURST_SECONDS if settings.OPENAI_TPM else None,
+)
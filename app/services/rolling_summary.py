@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import weakref
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from telethon import TelegramClient, utils
+
+from app.client_ai import MERGE_PROMPT
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import SourceSummaryState
+from app.services.archive import MessageArchive
+from app.services.summarize import map_reduce, result_text, summarize_locally, summarize_with_retry
+
+logger = logging.getLogger(__name__)
+
+MERGE_FAILED_NOTE = ("(Новые сообщения не удалось объединить с накопленной суммаризацией, "
+                     "это будет сделано в следующий раз.)")
+
+# Одновременные инкрементальные суммаризации одного источника выполняются по очереди,
+# иначе обе объединили бы одни и те же новые сообщения с накопленной суммаризацией
+_source_locks: "weakref.WeakValueDictionary[Tuple[int, int], asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _source_lock(owner_id: int, peer_id: int) -> asyncio.Lock:
+    lock = _source_locks.get((owner_id, peer_id))
+    if lock is None:
+        lock = _source_locks[(owner_id, peer_id)] = asyncio.Lock()
+    return lock
+
+
+async def merge_summary(rolling_summary: str, delta: str) -> Optional[str]:
+    """Объединяет накопительную суммаризацию с суммаризацией новых сообщений. None - OpenAI не ответил"""
+    semaphore = asyncio.Semaphore(1)
+    return await summarize_with_retry(f"{rolling_summary}\n\n{delta}", semaphore, MERGE_PROMPT)
+
+
+async def _load_state(owner_id: int, peer_id: int) -> Optional[Tuple[int, str]]:
+    async with AsyncSessionLocal() as db:
+        state = await db.get(SourceSummaryState, (owner_id, peer_id))
+        return (state.last_message_id, state.summary) if state else None
+
+
+async def _save_state(owner_id: int, peer_id: int, previous: Optional[Tuple[int, str]],
+                      last_message_id: int, summary: str) -> bool:
+    """
+    Сохраняет состояние, только если оно не изменилось с момента загрузки (previous).
+    Защищает от двойного объединения, если источник суммаризирует другой процесс
+    """
+    async with AsyncSessionLocal() as db:
+        values = dict(last_message_id=last_message_id, summary=summary, updated_at=datetime.utcnow())
+        if previous is None:
+            db.add(SourceSummaryState(owner_id=owner_id, entity_id=peer_id, **values))
+            try:
+                await db.commit()
+                return True
+            except IntegrityError:
+                return False
+        result = await db.execute(
+            update(SourceSummaryState)
+            .where(SourceSummaryState.owner_id == owner_id, SourceSummaryState.entity_id == peer_id,
+                   SourceSummaryState.last_message_id == previous[0])
+            .values(**values)
+        )
+        await db.commit()
+        return result.rowcount == 1
+
+
+async def fetch_new_messages(user_client: TelegramClient, entity, last_message_id: int):
+    """Получает сообщения новее отметки last_message_id. При первом запуске — последние сообщения источника"""
+    archive = MessageArchive(user_client, entity)
+    if last_message_id:
+        return await archive.since(last_message_id)
+    messages = await archive.recent(settings.ROLLING_SUMMARY_INITIAL_LIMIT)
+    return messages[::-1]
+
+
+async def summarize_incrementally(user_client: TelegramClient, entity, engine: str = "openai") -> str:
+    """
+    Инкрементальная суммаризация источника: суммаризируются только сообщения, появившиеся
+    после прошлой суммаризации, и результат объединяется с сохраненной накопительной суммаризацией.
+    Локальная суммаризация (engine="local") показывает выжимку новых сообщений, не меняя накопленную
+    суммаризацию и отметку: эти сообщения попадут в следующую суммаризацию через OpenAI.
+    """
+    owner_id = await user_client.get_peer_id("me")
+    # Полный ID диалога: «сырые» ID пользователя и канала могут совпадать
+    peer_id = utils.get_peer_id(entity)
+    async with _source_lock(owner_id, peer_id):
+        return await _summarize_incrementally(user_client, entity, engine, owner_id, peer_id)
+
+
+async def _summarize_incrementally(user_client: TelegramClient, entity, engine: str, owner_id: int, peer_id: int):
+    state = await _load_state(owner_id, peer_id)
+    last_message_id, rolling_summary = state or (0, "")
+
+    new_messages = await fetch_new_messages(user_client, entity, last_message_id)
+    texts = [message.text for message in new_messages if message.text]
+    logger.info(f"Новых сообщений для инкрементальной суммаризации: {len(texts)} (после ID {last_message_id}).")
+
+    if not texts:
+        if new_messages:
+            await _save_state(owner_id, peer_id, state, new_messages[-1].id, rolling_summary)
+        return rolling_summary or "Нет сообщений для суммаризации."
+    if engine == "local":
+        return await summarize_locally(texts)
+
+    result = await map_reduce(texts)
+    if not result.complete or result.offline:
+        # Отметку не сдвигаем, чтобы необработанные сообщения попали в следующую суммаризацию
+        logger.warning(f"Инкрементальная суммаризация не завершена: {result.failed} из {result.parts} частей.")
+        return result_text(result)
+
+    if rolling_summary:
+        summary = await merge_summary(rolling_summary, result.summary)
+        if summary is None:
+            # Склейку не сохраняем: при повторных ошибках накопленная суммаризация росла бы без ограничений.
+            # Отметка не сдвигается, новые сообщения будут объединены при следующей суммаризации
+            logger.warning("Не удалось объединить новые сообщения с накопительной суммаризацией.")
+            return f"{rolling_summary}\n\n{result.summary}\n\n{MERGE_FAILED_NOTE}"
+    else:
+        summary = result.summary
+    if not await _save_state(owner_id, peer_id, state, max(message.id for message in new_messages), summary):
+        logger.warning("Накопительная суммаризация источника изменена другим процессом, результат не сохранен.")
+    return summary
@@ -1,62 +1,422 @@
+import asyncio
 import logging
-from datetime import datetime
-from typing import List
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 
 from telethon import TelegramClient
 from telethon.tl.types import PeerUser, PeerChannel
 
-from app.client_ai import summarize_text
+from app.client_ai import (
+    MERGE_PROMPT, SUMMARIZE_PROMPT, SUMMARY_FAILED, is_rate_limited, request_summary, stream_summary,
+)
+from app.config import settings
+from app.services.archive import MessageArchive
+from app.services.chunking import MessageChunker, chunk_messages, chunk_token_budget, count_tokens
+from app.services.dedup import NearDuplicateFilter
+from app.services.extractive import FALLBACK_NOTE, compress, extractive_summary
+from app.services.metrics import record_local_summary, stage
+from app.services.summary_cache import cache_summary, chunk_key, get_cached_summary, range_key
 
 logger = logging.getLogger(__name__)
 
+# "openai" - суммаризация через OpenAI, "local" - локальная выжимка ключевых предложений без обращения к API
+SUMMARY_ENGINES = ("openai", "local")
+
 
 async def get_entity_by_source(user_client: TelegramClient, source_id: int):
     """Получает сущности (пользователя или канал) по заданному ID"""
     try:
-        if source_id < 0:
-            return await user_client.get_entity(PeerUser(source_id))
-        elif source_id > 0:
-            return await user_client.get_entity(PeerChannel(source_id))
-        else:
-            raise ValueError("Некорректный ID источника")
+        with stage("entity"):
+            if source_id < 0:
+                return await user_client.get_entity(PeerUser(source_id))
+            elif source_id > 0:
+                return await user_client.get_entity(PeerChannel(source_id))
+            else:
+                raise ValueError("Некорректный ID источника")
     except Exception as e:
         logger.error(f"Ошибка при получении сущности для {source_id}: {e}")
         return None
 
 
+def parse_period(period_start: str, period_end: str):
+    """Преобразует даты формы в интервал [start, end) в UTC. Конечная дата включается в период"""
+    start_date = datetime.strptime(period_start, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    end_date = datetime.strptime(period_end, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+    return start_date, end_date
+
+
 async def get_messages_to_summarize(user_client, entity, summary_type, period_start, period_end):
-    """Получение сообщений для суммаризации"""
+    """Получение сообщений для суммаризации (возвращаются сообщения с текстом, от старых к новым).
+    Сообщения читаются из локального архива, в Telegram запрашиваются только недостающие"""
     messages_to_summarize = []
+    archive = MessageArchive(user_client, entity)
     try:
-        if summary_type == "last_10":
-            async for message in user_client.iter_messages(entity, limit=10):
-                if message.text:
-                    messages_to_summarize.append(message.text)
-
-        elif summary_type == "period" and period_start and period_end:
-            start_date = datetime.strptime(period_start, "%Y-%m-%d")
-            end_date = datetime.strptime(period_end, "%Y-%m-%d")
-            async for message in user_client.iter_messages(entity, offset_date=end_date, reverse=True):
-                if message.date < start_date:
-                    break
-                if message.text:
-                    messages_to_summarize.append(message.text)
+        with stage("fetch"):
+            if summary_type == "last_10":
+                messages_to_summarize = [message for message in await archive.recent(10) if message.text][::-1]
+
+            elif summary_type == "period" and period_start and period_end:
+                start_date, end_date = parse_period(period_start, period_end)
+                messages_to_summarize = [
+                    message for message in await archive.period(start_date, end_date) if message.text
+                ]
 
     except Exception as e:
         logger.error(f"Ошибка при получении сообщений: {e}")
     return messages_to_summarize
 
 
-def split_text_for_summary(text: str, max_chars: int = 3000):
-    """Разбивает текст на части для передачи в OpenAI"""
-    return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+async def summarize_with_retry(text: str, semaphore: asyncio.Semaphore, prompt: str = SUMMARIZE_PROMPT) -> Optional[str]:
+    """Суммаризирует часть текста с повторными попытками и экспоненциальной задержкой.
+    Ответы 429 повторяет планировщик в create_completion, здесь повторяются только остальные ошибки.
+    Возвращает None, если все попытки завершились ошибкой"""
+    key = chunk_key(text, prompt)
+    cached = await get_cached_summary(key)
+    if cached is not None:
+        return cached
+    for attempt in range(settings.SUMMARY_MAX_RETRIES + 1):
+        try:
+            async with semaphore:
+                summary = await request_summary(text, prompt)
+            await cache_summary(key, summary)
+            return summary
+        except Exception as e:
+            if attempt == settings.SUMMARY_MAX_RETRIES or is_rate_limited(e):
+                logger.error(f"Ошибка при суммаризации части текста после {attempt + 1} попыток: {e}")
+                return None
+            delay = settings.SUMMARY_RETRY_BACKOFF * 2 ** attempt * (1 + random.random())
+            logger.warning(f"Ошибка при суммаризации части текста, повтор через {delay:.1f} с: {e}")
+            await asyncio.sleep(delay)
 
 
-async def summarize_messages(messages_to_summarize: List[str]) -> str:
-    """Объединяет и суммаризирует список сообщений"""
-    combined_messages = "\n\n".join(messages_to_summarize)
-    if not combined_messages:
-        return "Нет сообщений для суммаризации."
-    parts = split_text_for_summary(combined_messages)
-    summaries = [await summarize_text(part) for part in parts]
+async def map_summaries(parts: List[str], semaphore: asyncio.Semaphore) -> List[Optional[str]]:
+    """Map-этап: параллельная суммаризация частей текста"""
+    return await asyncio.gather(*(summarize_with_retry(part, semaphore) for part in parts))
+
+
+def group_for_reduce(summaries: List[str], max_tokens: int) -> List[List[str]]:
+    """Группирует частичные суммаризации так, чтобы каждая группа помещалась в один запрос.
+    В каждой группе не меньше двух элементов, иначе свертка не продвигалась бы"""
+    groups, current, current_tokens = [], [], 0
+    for summary in summaries:
+        tokens = count_tokens(summary)
+        if len(current) >= 2 and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(summary)
+        current_tokens += tokens
+    if len(current) == 1 and groups:
+        groups[-1].extend(current)
+    elif current:
+        groups.append(current)
+    return groups
+
+
+async def reduce_round(summaries: List[str], semaphore: asyncio.Semaphore) -> Optional[List[str]]:
+    """Один уровень свертки: группы суммаризаций объединяются параллельно.
+    Возвращает None, если не удалось объединить ни одну группу"""
+    groups = group_for_reduce(summaries, chunk_token_budget())
+    merged = await asyncio.gather(
+        *(summarize_with_retry("\n\n".join(group), semaphore, MERGE_PROMPT) for group in groups)
+    )
+    if all(result is None for result in merged):
+        return None
+    # Если свертку группы выполнить не удалось, сохраняем ее части без объединения
+    return [result if result else "\n\n".join(group) for result, group in zip(merged, groups)]
+
+
+async def reduce_summaries(summaries: List[str], semaphore: asyncio.Semaphore) -> str:
+    """Reduce-этап: иерархическая свертка частичных суммаризаций в одну итоговую"""
+    while len(summaries) > 1:
+        reduced = await reduce_round(summaries, semaphore)
+        if reduced is None:
+            break
+        summaries = reduced
     return "\n\n".join(summaries)
+
+
+@dataclass
+class SummaryResult:
+    """Результат map-reduce суммаризации: итоговый текст и количество необработанных частей.
+    offline - OpenAI не ответил ни на одну часть и итог получен локальной выжимкой"""
+    summary: Optional[str]
+    parts: int
+    failed: int
+    offline: bool = False
+
+    @property
+    def complete(self) -> bool:
+        return self.summary is not None and not self.failed
+
+
+def result_text(result: SummaryResult) -> str:
+    """Текст результата для пользователя с пометкой о необработанных частях или локальной выжимке"""
+    if not result.parts:
+        return "Нет сообщений для суммаризации."
+    if result.summary is None:
+        return SUMMARY_FAILED
+    if result.offline:
+        return f"{result.summary}\n\n{FALLBACK_NOTE}"
+    if result.failed:
+        return (f"{result.summary}\n\n(Часть сообщений не удалось обработать: "
+                f"{result.failed} из {result.parts} частей.)")
+    return result.summary
+
+
+async def offline_fallback(texts: List[str]) -> Optional[str]:
+    """Локальная выжимка вместо суммаризации OpenAI, если запасной вариант включен"""
+    if not settings.SUMMARY_OFFLINE_FALLBACK or not texts:
+        return None
+    logger.warning("OpenAI недоступен, суммаризация заменена локальной выжимкой.")
+    record_local_summary("fallback")
+    return await extractive_summary(texts)
+
+
+async def map_reduce_batches(batches) -> SummaryResult:
+    """Суммаризирует тексты, поступающие пачками (асинхронный итератор списков строк).
+    Части отправляются на map-этап по мере заполнения, не дожидаясь загрузки всех сообщений.
+    Если включено локальное сжатие (EXTRACTIVE_BUDGET_TOKENS), сообщения сначала собираются
+    полностью и сокращаются до бюджета, а затем отправляются в OpenAI"""
+    chunker = MessageChunker()
+    duplicate_filter = NearDuplicateFilter() if settings.DEDUP_ENABLED else None
+    budget = settings.EXTRACTIVE_BUDGET_TOKENS
+    semaphore = asyncio.Semaphore(settings.SUMMARY_CONCURRENCY)
+    texts, tasks = [], []
+
+    def submit(batch: List[str]):
+        for text in batch:
+            for part in chunker.add(text):
+                tasks.append(asyncio.create_task(summarize_with_retry(part, semaphore)))
+
+    try:
+        async for batch in batches:
+            if duplicate_filter:
+                batch = duplicate_filter.filter(batch)
+            batch = [text for text in batch if text]
+            # Тексты нужны для сжатия и для локальной выжимки, если OpenAI недоступен
+            if budget or settings.SUMMARY_OFFLINE_FALLBACK:
+                texts.extend(batch)
+            if not budget:
+                submit(batch)
+        if budget:
+            submit(await compress(texts, budget))
+        for part in chunker.flush():
+            tasks.append(asyncio.create_task(summarize_with_retry(part, semaphore)))
+        partial_summaries = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if duplicate_filter:
+        duplicate_filter.report()
+    stats = chunker.stats
+    logger.info(f"Сообщения разбиты на {stats.chunks} частей, заполненность {stats.fill_ratio:.0%}.")
+    summaries = [summary for summary in partial_summaries if summary]
+    if not summaries:
+        fallback = await offline_fallback(texts) if tasks else None
+        return SummaryResult(summary=fallback, parts=len(tasks), failed=len(tasks), offline=fallback is not None)
+
+    final_summary = await reduce_summaries(summaries, semaphore)
+    return SummaryResult(summary=final_summary, parts=len(tasks), failed=len(tasks) - len(summaries))
+
+
+async def map_reduce(texts: List[str]) -> SummaryResult:
+    """Суммаризирует тексты: разбиение на части, параллельный map-этап и иерархический reduce-этап"""
+    async def single_batch():
+        yield texts
+
+    return await map_reduce_batches(single_batch())
+
+
+async def summarize_locally(texts: List[str]) -> str:
+    """Локальная суммаризация без OpenAI: повторы удаляются, из сообщений выбираются ключевые предложения"""
+    texts = [text for text in texts if text]
+    if settings.DEDUP_ENABLED:
+        duplicate_filter = NearDuplicateFilter()
+        texts = duplicate_filter.filter(texts)
+        duplicate_filter.report()
+    if not texts:
+        return "Нет сообщений для суммаризации."
+    record_local_summary("requested")
+    with stage("summarize"):
+        return await extractive_summary(texts)
+
+
+async def summarize_message_batches(batches, cache_key: Optional[str] = None, engine: str = "openai") -> str:
+    """Суммаризирует сообщения, поступающие пачками по мере загрузки.
+    Если передан cache_key, готовая суммаризация всего запроса берется из кэша и сохраняется в него.
+    Локальная суммаризация (engine="local") кэш не использует: она быстрая и не расходует токены"""
+    if engine == "local":
+        texts = []
+        async for batch in batches:
+            texts.extend(batch)
+        return await summarize_locally(texts)
+
+    cached = await get_cached_summary(cache_key)
+    if cached is not None:
+        return cached
+
+    with stage("summarize"):
+        result = await map_reduce_batches(batches)
+    if result.complete:
+        await cache_summary(cache_key, result.summary)
+    elif result.failed and not result.offline:
+        logger.warning(f"Не удалось суммаризировать {result.failed} из {result.parts} частей.")
+    return result_text(result)
+
+
+async def summarize_messages(messages_to_summarize: List[str], cache_key: Optional[str] = None,
+                             engine: str = "openai") -> str:
+    """Объединяет и суммаризирует список сообщений по схеме map-reduce.
+    Если передан cache_key, готовая суммаризация всего запроса берется из кэша и сохраняется в него"""
+    if not any(messages_to_summarize):
+        return "Нет сообщений для суммаризации."
+
+    async def single_batch():
+        yield messages_to_summarize
+
+    return await summarize_message_batches(single_batch(), cache_key, engine)
+
+
+async def summarize_period(user_client, entity, period_start: str, period_end: str, engine: str = "openai") -> str:
+    """Суммаризация за период: сообщения загружаются параллельно по диапазонам ID
+    и передаются на суммаризацию по мере поступления"""
+    start_date, end_date = parse_period(period_start, period_end)
+    archive = MessageArchive(user_client, entity)
+    plan = await archive.plan_period(start_date, end_date)
+
+    async def texts():
+        async for batch in archive.period_batches(plan):
+            yield [message.text for message in batch if message.text]
+
+    cache_key = await range_key(user_client, entity, plan.low, plan.high)
+    return await summarize_message_batches(texts(), cache_key=cache_key, engine=engine)
+
+
+async def stream_text_summary(text: str, semaphore: asyncio.Semaphore, prompt: str = SUMMARIZE_PROMPT):
+    """Потоковая суммаризация одной части текста с использованием кэша.
+    Если поток не удалось начать, выполняется обычный запрос с повторными попытками"""
+    key = chunk_key(text, prompt)
+    cached = await get_cached_summary(key)
+    if cached is not None:
+        yield cached
+        return
+    tokens = []
+    try:
+        async with semaphore:
+            async for token in stream_summary(text, prompt):
+                tokens.append(token)
+                yield token
+    except Exception as e:
+        if tokens or is_rate_limited(e):
+            raise
+        logger.warning(f"Не удалось начать потоковую суммаризацию, выполняется обычный запрос: {e}")
+        summary = await summarize_with_retry(text, semaphore, prompt)
+        if summary is None:
+            raise
+        yield summary
+        return
+    await cache_summary(key, "".join(tokens).strip())
+
+
+async def stream_summarize_messages(messages_to_summarize: List[str], cache_key: Optional[str] = None,
+                                    engine: str = "openai"):
+    """
+    Потоковая map-reduce суммаризация. Возвращает события (тип, данные):
+    "progress" — обработана очередная часть, "token" — фрагмент итогового текста,
+    "done" — суммаризация завершена (со статистикой удаленных повторов), "error" — суммаризацию получить не удалось.
+    Если OpenAI недоступен, вместо ошибки отдается локальная выжимка (в "done" — offline: true).
+    """
+    if not any(messages_to_summarize):
+        yield "token", "Нет сообщений для суммаризации."
+        yield "done", {"parts": 0, "failed": 0}
+        return
+    if engine == "local":
+        yield "token", await summarize_locally(messages_to_summarize)
+        yield "done", {"parts": 0, "failed": 0, "engine": "local"}
+        return
+    cached = await get_cached_summary(cache_key)
+    if cached is not None:
+        yield "token", cached
+        yield "done", {"parts": 0, "failed": 0}
+        return
+
+    messages_to_summarize = [message for message in messages_to_summarize if message]
+    removed = tokens_saved = 0
+    if settings.DEDUP_ENABLED:
+        duplicate_filter = NearDuplicateFilter()
+        messages_to_summarize = duplicate_filter.filter(messages_to_summarize)
+        duplicate_filter.report()
+        removed, tokens_saved = duplicate_filter.stats.removed, duplicate_filter.stats.tokens_saved
+    texts = messages_to_summarize
+    if settings.EXTRACTIVE_BUDGET_TOKENS:
+        messages_to_summarize = await compress(messages_to_summarize, settings.EXTRACTIVE_BUDGET_TOKENS)
+    parts, _ = chunk_messages(messages_to_summarize)
+    semaphore = asyncio.Semaphore(settings.SUMMARY_CONCURRENCY)
+    failed = 0
+
+    if len(parts) == 1:
+        final_text, final_prompt = parts[0], SUMMARIZE_PROMPT
+    else:
+        async def indexed(index, part):
+            return index, await summarize_with_retry(part, semaphore)
+
+        partial_summaries = [None] * len(parts)
+        tasks = [asyncio.create_task(indexed(index, part)) for index, part in enumerate(parts)]
+        try:
+            for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+                index, summary = await task
+                partial_summaries[index] = summary
+                yield "progress", {"done": done, "total": len(parts)}
+        finally:
+            for task in tasks:
+                task.cancel()
+        summaries = [summary for summary in partial_summaries if summary]
+        failed = len(parts) - len(summaries)
+        if not summaries:
+            fallback = await offline_fallback(texts)
+            if fallback is None:
+                yield "error", SUMMARY_FAILED
+                return
+            yield "token", f"{fallback}\n\n{FALLBACK_NOTE}"
+            yield "done", {"parts": len(parts), "failed": failed, "offline": True}
+            return
+
+        # Промежуточные уровни свертки выполняются обычными запросами, последний — потоково
+        while len(group_for_reduce(summaries, chunk_token_budget())) > 1:
+            reduced = await reduce_round(summaries, semaphore)
+            if reduced is None:
+                break
+            summaries = reduced
+        final_text, final_prompt = "\n\n".join(summaries), MERGE_PROMPT
+        if len(summaries) == 1:
+            final_text, final_prompt = summaries[0], None
+
+    if final_prompt is None:
+        final_summary = final_text
+        yield "token", final_summary
+    else:
+        tokens = []
+        try:
+            async for token in stream_text_summary(final_text, semaphore, final_prompt):
+                tokens.append(token)
+                yield "token", token
+        except Exception as e:
+            logger.error(f"Ошибка при потоковой суммаризации: {e}")
+            # Локальная выжимка заменяет итог, только если пользователь еще не получил его начало
+            fallback = None if tokens else await offline_fallback(texts)
+            if fallback is None:
+                yield "error", SUMMARY_FAILED
+                return
+            yield "token", f"{fallback}\n\n{FALLBACK_NOTE}"
+            yield "done", {"parts": len(parts), "failed": len(parts), "offline": True}
+            return
+        final_summary = "".join(tokens).strip()
+
+    if failed:
+        yield "token", f"\n\n(Часть сообщений не удалось обработать: {failed} из {len(parts)} частей.)"
+    else:
+        await cache_summary(cache_key, final_summary)
+    yield "done", {"parts": len(parts), "failed": failed, "duplicates": removed, "tokens_saved": tokens_saved}
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func, select
+from telethon import TelegramClient, utils
+
+from app.client_ai import SUMMARY_MAX_TOKENS, SUMMARY_MODEL, SUMMARY_TEMPERATURE, SYSTEM_PROMPT
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import SummaryCacheEntry
+from app.services.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Время последнего обращения обновляется не чаще раза в ACCESS_RESOLUTION: для вытеснения давно
+# не использованных записей такой точности достаточно, а чтение из кэша обычно обходится без записи
+ACCESS_RESOLUTION = timedelta(hours=1)
+# Вытеснение запускается раз в EVICT_EVERY записей, поэтому кэш может ненадолго превысить лимит
+EVICT_EVERY = 100
+
+_puts_since_evict = 0
+
+
+def make_key(**parts) -> str:
+    """
+    Ключ кэша: хэш от модели, промпта, параметров запроса, настроек подготовки текста
+    (удаление повторов и локальное сжатие) и переданных частей
+    """
+    payload = {
+        "model": SUMMARY_MODEL,
+        "system": SYSTEM_PROMPT,
+        "max_tokens": SUMMARY_MAX_TOKENS,
+        "temperature": SUMMARY_TEMPERATURE,
+        "dedup": settings.DEDUP_THRESHOLD if settings.DEDUP_ENABLED else None,
+        "extractive_budget": settings.EXTRACTIVE_BUDGET_TOKENS,
+        **parts,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def chunk_key(text: str, prompt: str) -> str:
+    """Ключ для суммаризации одной части текста"""
+    return make_key(kind="chunk", prompt=prompt, text=text)
+
+
+async def _source(user_client: TelegramClient, entity) -> dict:
+    """
+    Источник в ключе: аккаунт и полный ID диалога. В личных чатах и обычных группах ID сообщений
+    свои у каждого аккаунта, поэтому без аккаунта ключи разных пользователей могли бы совпасть
+    """
+    return {"owner_id": await user_client.get_peer_id("me"), "peer_id": utils.get_peer_id(entity)}
+
+
+async def request_key(user_client: TelegramClient, entity, messages) -> Optional[str]:
+    """Ключ для суммаризации всего запроса: аккаунт, источник и диапазон ID сообщений"""
+    if not messages:
+        return None
+    ids = [message.id for message in messages]
+    return make_key(kind="request", **await _source(user_client, entity),
+                    min_id=min(ids), max_id=max(ids), count=len(ids))
+
+
+async def range_key(user_client: TelegramClient, entity, low: int, high: int) -> Optional[str]:
+    """Ключ для суммаризации диапазона ID сообщений (low, high] источника"""
+    if high <= low:
+        return None
+    return make_key(kind="range", **await _source(user_client, entity), low=low, high=high)
+
+
+async def _get(key: str) -> Optional[str]:
+    async with AsyncSessionLocal() as db:
+        entry = await db.get(SummaryCacheEntry, key)
+        if not entry:
+            return None
+        now = datetime.utcnow()
+        # Устаревшие записи удаляются при вытеснении
+        if now - entry.created_at > timedelta(seconds=settings.SUMMARY_CACHE_TTL):
+            return None
+        if now - entry.accessed_at > ACCESS_RESOLUTION:
+            entry.accessed_at = now
+            await db.commit()
+        return entry.summary
+
+
+async def _put(key: str, summary: str):
+    global _puts_since_evict
+    async with AsyncSessionLocal() as db:
+        now = datetime.utcnow()
+        await db.merge(SummaryCacheEntry(key=key, summary=summary, size=len(summary), created_at=now, accessed_at=now))
+        await db.commit()
+        _puts_since_evict += 1
+        if _puts_since_evict >= EVICT_EVERY:
+            _puts_since_evict = 0
+            await _evict(db)
+
+
+async def _evict(db):
+    """Удаляет устаревшие записи и самые давно использованные записи сверх лимита"""
+    expired_before = datetime.utcnow() - timedelta(seconds=settings.SUMMARY_CACHE_TTL)
+    await db.execute(delete(SummaryCacheEntry).where(SummaryCacheEntry.created_at < expired_before))
+    overflow = await db.scalar(select(func.count()).select_from(SummaryCacheEntry)) - settings.SUMMARY_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        oldest = (
+            select(SummaryCacheEntry.key)
+            .order_by(SummaryCacheEntry.accessed_at)
+            .limit(overflow)
+            .scalar_subquery()
+        )
+        await db.execute(
+            delete(SummaryCacheEntry).where(SummaryCacheEntry.key.in_(oldest)).execution_options(synchronize_session=False)
+        )
+    await db.commit()
+
+
+async def get_cached_summary(key: Optional[str]) -> Optional[str]:
+    """Возвращает суммаризацию из кэша или None"""
+    if not key:
+        return None
+    try:
+        summary = await _get(key)
+        record_cache("summary", summary is not None)
+        return summary
+    except Exception as e:
+        logger.error(f"Ошибка при чтении кэша суммаризаций: {e}")
+        return None
+
+
+async def cache_summary(key: Optional[str], summary: str):
+    """Сохраняет суммаризацию в кэш"""
+    if not key:
+        return
+    try:
+        await _put(key, summary)
+    except Exception as e:
+        logger.error(f"Ошибка при записи в кэш суммаризаций: {e}")
@@ -0,0 +1,18 @@
+import zlib
+from typing import Optional
+
+from app.config import settings
+
+
+def session_owner(session_id: str, worker_count: Optional[int] = None) -> int:
+    """
+    Номер процесса-воркера, которому принадлежит сессия. Все запросы и фоновые задачи
+    пользователя выполняются в этом процессе, поэтому его клиент Telegram подключен только один раз.
+    """
+    worker_count = worker_count or settings.WORKER_COUNT
+    return zlib.crc32(session_id.encode("utf-8")) % max(1, worker_count)
+
+
+def owns_session(session_id: str) -> bool:
+    """Принадлежит ли сессия текущему процессу (в однопроцессном режиме - всегда)"""
+    return settings.WORKER_COUNT <= 1 or session_owner(session_id) == settings.WORKER_ID
@@ -0,0 +1,301 @@
+import asyncio
+import json
+import logging
+import secrets
+import time
+import typing
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+import itsdangerous
+from itsdangerous.exc import BadSignature
+from sqlalchemy import DateTime, delete, insert, literal, select
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import UserSession, UserSessionAccess
+from app.services.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """Интерфейс хранилища серверных сессий. Данные хранятся в виде JSON-строки"""
+
+    async def load(self, session_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def save(self, session_id: str, data: str):
+        raise NotImplementedError
+
+    async def delete(self, session_id: str):
+        raise NotImplementedError
+
+    async def touch(self, session_id: str):
+        """Отмечает обращение к сессии, чтобы она не была удалена как устаревшая"""
+        raise NotImplementedError
+
+    async def cleanup(self, max_age: float) -> List[str]:
+        """Удаляет сессии без обращений дольше max_age секунд и возвращает их ID"""
+        raise NotImplementedError
+
+
+class DatabaseSessionStore(SessionStore):
+    """Хранилище сессий в таблице user_sessions, время последнего обращения - в user_session_access"""
+
+    async def load(self, session_id: str) -> Optional[str]:
+        async with AsyncSessionLocal() as db:
+            row = await db.get(UserSession, session_id)
+            return row.session_data if row else None
+
+    async def save(self, session_id: str, data: str):
+        async with AsyncSessionLocal() as db:
+            await db.merge(UserSession(session_id=session_id, session_data=data))
+            await db.merge(UserSessionAccess(session_id=session_id, accessed_at=datetime.utcnow()))
+            await db.commit()
+
+    async def delete(self, session_id: str):
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(UserSession).where(UserSession.session_id == session_id))
+            await db.execute(delete(UserSessionAccess).where(UserSessionAccess.session_id == session_id))
+            await db.commit()
+
+    async def touch(self, session_id: str):
+        async with AsyncSessionLocal() as db:
+            await db.merge(UserSessionAccess(session_id=session_id, accessed_at=datetime.utcnow()))
+            await db.commit()
+
+    async def cleanup(self, max_age: float) -> List[str]:
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            # Сессии, созданные до появления user_session_access, отсчитывают срок с первой очистки
+            untracked = select(UserSession.session_id, literal(now, DateTime)).where(
+                UserSession.session_id.not_in(select(UserSessionAccess.session_id))
+            )
+            await db.execute(insert(UserSessionAccess).from_select(["session_id", "accessed_at"], untracked))
+            expired = list(await db.scalars(
+                select(UserSessionAccess.session_id)
+                .where(UserSessionAccess.accessed_at < now - timedelta(seconds=max_age))
+            ))
+            for start in range(0, len(expired), 500):
+                batch = expired[start:start + 500]
+                await db.execute(delete(UserSession).where(UserSession.session_id.in_(batch)))
+                await db.execute(delete(UserSessionAccess).where(UserSessionAccess.session_id.in_(batch)))
+            await db.commit()
+        return expired
+
+
+class LRUSessionStore(SessionStore):
+    """Кэш последних использованных сессий в памяти процесса перед основным хранилищем"""
+
+    def __init__(self, backend: SessionStore, max_size: int):
+        self.backend = backend
+        self.max_size = max_size
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+
+    async def load(self, session_id: str) -> Optional[str]:
+        if session_id in self._cache:
+            record_cache("sessions", True)
+            self._cache.move_to_end(session_id)
+            return self._cache[session_id]
+        record_cache("sessions", False)
+        data = await self.backend.load(session_id)
+        if data is not None:
+            self._remember(session_id, data)
+        return data
+
+    async def save(self, session_id: str, data: str):
+        await self.backend.save(session_id, data)
+        self._remember(session_id, data)
+
+    async def delete(self, session_id: str):
+        self._cache.pop(session_id, None)
+        await self.backend.delete(session_id)
+
+    async def touch(self, session_id: str):
+        await self.backend.touch(session_id)
+
+    async def cleanup(self, max_age: float) -> List[str]:
+        expired = await self.backend.cleanup(max_age)
+        for session_id in expired:
+            self._cache.pop(session_id, None)
+        return expired
+
+    def _remember(self, session_id: str, data: str):
+        self._cache[session_id] = data
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+
+class ServerSession(MutableMapping):
+    """
+    Данные сессии запроса. JSON разбирается только при первом обращении,
+    изменения отслеживаются, чтобы записывать сессию в хранилище лишь при необходимости.
+    """
+
+    def __init__(self, raw: Optional[str] = None):
+        self._raw = raw
+        self._data: Optional[dict] = None
+        self.modified = False
+        # Новый ID сессии после regenerate()
+        self.regenerated: Optional[str] = None
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            try:
+                self._data = json.loads(self._raw) if self._raw else {}
+            except json.JSONDecodeError:
+                logger.warning("Повреждены данные сессии, сессия будет сброшена.")
+                self._data = {}
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        if key in self.data and self.data[key] == value:
+            return
+        self.data[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def clear(self):
+        if self.data:
+            self.data.clear()
+            self.modified = True
+
+    def regenerate(self) -> str:
+        """
+        Выдает сессии новый ID с теми же данными (при входе пользователя), старый ID удаляется.
+        Так заранее подставленный пользователю ID сессии не получит доступ к его аккаунту.
+        Возвращает новый ID: под ним сессия сохраняется в конце запроса
+        """
+        self.regenerated = secrets.token_urlsafe(32)
+        self.modified = True
+        return self.regenerated
+
+    def dumps(self) -> str:
+        return json.dumps(self.data)
+
+
+class ServerSessionMiddleware:
+    """
+    Замена SessionMiddleware из Starlette: в cookie хранится только подписанный
+    идентификатор сессии, а сами данные — в хранилище на сервере.
+    Cookie выдается заново не реже раза в refresh_interval, поэтому срок max_age отсчитывается
+    от последнего обращения, а не от входа.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        store: SessionStore,
+        secret_key: str,
+        session_cookie: str = "session",
+        max_age: Optional[int] = 14 * 24 * 60 * 60,
+        refresh_interval: int = 24 * 60 * 60,
+        path: str = "/",
+        same_site: typing.Literal["lax", "strict", "none"] = "lax",
+    ):
+        self.app = app
+        self.store = store
+        self.signer = itsdangerous.TimestampSigner(str(secret_key))
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval
+        self.path = path
+        self.security_flags = "httponly; samesite=" + same_site
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        session_id, signed_at = self._session_id_from_cookie(HTTPConnection(scope))
+        raw = await self.store.load(session_id) if session_id else None
+        if raw is None:
+            session_id = None
+        session = ServerSession(raw)
+        scope["session"] = session
+        scope["session_id"] = session_id
+
+        async def send_wrapper(message: Message):
+            nonlocal session_id
+            if message["type"] != "http.response.start":
+                await send(message)
+                return
+            if session.modified:
+                headers = MutableHeaders(scope=message)
+                if session.regenerated:
+                    if session_id:
+                        await self.store.delete(session_id)
+                    session_id = session.regenerated if session else None
+                if session:
+                    if not session_id:
+                        session_id = secrets.token_urlsafe(32)
+                    await self.store.save(session_id, session.dumps())
+                    headers.append("Set-Cookie", self._cookie(self.signer.sign(session_id).decode("utf-8")))
+                elif session_id:
+                    await self.store.delete(session_id)
+                    headers.append("Set-Cookie", self._cookie("null", expired=True))
+                scope["session_id"] = session_id
+            elif session_id and time.time() - signed_at > self.refresh_interval:
+                # Срок cookie и сессии продлевается при использовании
+                await self.store.touch(session_id)
+                MutableHeaders(scope=message).append(
+                    "Set-Cookie", self._cookie(self.signer.sign(session_id).decode("utf-8"))
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _session_id_from_cookie(self, connection: HTTPConnection) -> Tuple[Optional[str], float]:
+        """ID сессии из cookie и время подписи cookie"""
+        cookie = connection.cookies.get(self.session_cookie)
+        if not cookie:
+            return None, 0.0
+        try:
+            session_id, signed_at = self.signer.unsign(
+                cookie.encode("utf-8"), max_age=self.max_age, return_timestamp=True
+            )
+            return session_id.decode("utf-8"), signed_at.timestamp()
+        except BadSignature:
+            return None, 0.0
+
+    def _cookie(self, value: str, expired: bool = False) -> str:
+        if expired:
+            lifetime = "expires=Thu, 01 Jan 1970 00:00:00 GMT; "
+        else:
+            lifetime = f"Max-Age={self.max_age}; " if self.max_age else ""
+        return f"{self.session_cookie}={value}; path={self.path}; {lifetime}{self.security_flags}"
+
+
+async def run_session_cleanup(store: SessionStore):
+    """Периодически удаляет сессии без обращений дольше SESSION_MAX_AGE"""
+    while True:
+        try:
+            expired = await store.cleanup(settings.SESSION_MAX_AGE)
+            if expired:
+                logger.info(f"Удалено устаревших сессий: {len(expired)}.")
+        except Exception as e:
+            logger.error(f"Ошибка при удалении устаревших сессий: {e}")
+        await asyncio.sleep(settings.SESSION_CLEANUP_INTERVAL)
+
+
+session_store = LRUSessionStore(DatabaseSessionStore(), max_size=settings.SESSION_CACHE_SIZE)
@@ -1,6 +1,61 @@
-from telethon import TelegramClient
+import contextvars
+
+from telethon import TelegramClient, errors
 from telethon.sessions import StringSession
 from app.config import settings
+from app.services.metrics import TELEGRAM_REQUESTS, record_flood_wait
+from app.services.rate_limit import telegram_account_limiter, telegram_limiter
+
+# Telethon может выполнять вложенные запросы внутри _call (например, получение сущности при resolve).
+# Вложенный запрос выполняется в слоте внешнего, иначе при занятых слотах возможна взаимная блокировка
+_inside_call: contextvars.ContextVar[bool] = contextvars.ContextVar("telegram_inside_call", default=False)
+
+
+class InstrumentedTelegramClient(TelegramClient):
+    """
+    TelegramClient, все запросы которого проходят через общий планировщик и учитываются в метриках.
+    Запрос ожидает очереди в ограничителе аккаунта (FloodWait выдается на аккаунт) и в общем
+    ограничителе Telegram, где аккаунты обслуживаются по очереди.
+    Автоматическое ожидание FloodWait в Telethon отключено (flood_sleep_threshold=0): FloodWait
+    приостанавливает ограничитель аккаунта и снижает его параллельность, после чего запрос повторяется.
+    Переопределяется _call: через него проходят все запросы клиента, включая iter_messages и get_entity.
+    """
+
+    def __init__(self, *args, flood_sleep_threshold: int = 60, **kwargs):
+        super().__init__(*args, flood_sleep_threshold=0, **kwargs)
+        self.wait_threshold = flood_sleep_threshold
+        self.account_limiter = telegram_account_limiter()
+        self.account_key = f"account-{id(self)}"
+
+    async def _call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+        threshold = self.wait_threshold if flood_sleep_threshold is None else flood_sleep_threshold
+        if _inside_call.get():
+            # FloodWait вложенного запроса обработает внешний
+            self._count(request)
+            return await super()._call(sender, request, ordered=ordered, flood_sleep_threshold=0)
+        while True:
+            self._count(request)
+            try:
+                async with self.account_limiter.slot(self.account_key), telegram_limiter.slot(self.account_key):
+                    token = _inside_call.set(True)
+                    try:
+                        result = await super()._call(sender, request, ordered=ordered, flood_sleep_threshold=0)
+                    finally:
+                        _inside_call.reset(token)
+            except errors.FloodWaitError as e:
+                record_flood_wait(e.seconds)
+                self.account_limiter.on_throttle(e.seconds)
+                if e.seconds > threshold:
+                    raise
+                continue
+            self.account_limiter.on_success()
+            telegram_limiter.on_success()
+            return result
+
+    @staticmethod
+    def _count(request):
+        for item in (request if isinstance(request, (list, tuple)) else (request,)):
+            TELEGRAM_REQUESTS.labels(type(item).__name__).inc()
 
 
 async def get_telegram_client(session_str: str = None) -> TelegramClient:
@@ -9,6 +64,6 @@ async def get_telegram_client(session_str: str = None) -> TelegramClient:
     если нет - создается новая.
     """
     if session_str:
-        return TelegramClient(StringSession(session_str), settings.API_ID, settings.API_HASH)
+        return InstrumentedTelegramClient(StringSession(session_str), settings.API_ID, settings.API_HASH)
     else:
-        return TelegramClient(StringSession(), settings.API_ID, settings.API_HASH)
+        return InstrumentedTelegramClient(StringSession(), settings.API_ID, settings.API_HASH)
@@ -0,0 +1,193 @@
+"""
+Бенчмарк диспетчера многопроцессного режима: одни и те же запросы отправляются напрямую в один
+процесс uvicorn и через диспетчер app.cluster. Приложение работает с фейковым TelegramClient
+(benchmarks.fake_app), сессии общие для обоих режимов. Разница задержек и пропускной способности -
+стоимость проксирования через диспетчер.
+
+Запуск: python -m benchmarks.dispatcher --workers 1 --dispatchers 1 --concurrency 1,16,64 --requests 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.run import ROOT, BenchResult, _free_port, format_row, percentile, run_level
+
+ENDPOINTS = ("health", "dashboard", "last-messages")
+MODES = ("direct", "dispatcher")
+
+
+def configure_environment(args, database_dir: str):
+    """Окружение наследуют процессы приложения: общая БД, фейковый аккаунт и отключенный прогрев OpenAI"""
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(database_dir, 'bench.db')}",
+        "WARMUP_OPENAI": "false",
+        "BENCH_PROFILE": json.dumps({
+            "channels": args.channels, "groups": args.groups, "users": args.private_chats,
+            "folders": args.folders, "rpc_latency": args.telegram_latency,
+        }),
+    })
+    for name, value in {
+        "API_ID": "1", "API_HASH": "bench", "SESSION_SECRET_KEY": "bench", "OPENAI_API_KEY": "sk-bench",
+        "SECRET_KEY": "bench", "SESSION_NAME": "bench",
+    }.items():
+        os.environ.setdefault(name, value)
+
+
+async def create_sessions(users: int) -> List[str]:
+    """Создает схему БД и сессии пользователей, возвращает cookie для запросов"""
+    import itsdangerous
+
+    from app.cluster import create_tables
+    from app.database import async_engine
+    from app.main import app
+    from app.sessions import DatabaseSessionStore, ServerSessionMiddleware
+
+    await create_tables()
+    store = DatabaseSessionStore()
+    secret_key = next(
+        middleware.kwargs["secret_key"] for middleware in app.user_middleware
+        if middleware.cls is ServerSessionMiddleware
+    )
+    signer = itsdangerous.TimestampSigner(str(secret_key))
+    cookies = []
+    for index in range(users):
+        session_id = f"bench-session-{index}"
+        await store.save(session_id, json.dumps({"session_str": f"bench-user-{index}"}))
+        cookies.append(f"session={signer.sign(session_id).decode('utf-8')}")
+    await async_engine.dispose()
+    return cookies
+
+
+def start_server(mode: str, port: int, workers: int, dispatchers: int) -> subprocess.Popen:
+    if mode == "direct":
+        command = ["-m", "uvicorn", "benchmarks.fake_app:app", "--port", str(port), "--log-level", "warning"]
+    else:
+        command = ["-m", "app.cluster", "--app", "benchmarks.fake_app:app", "--workers", str(workers),
+                   "--dispatchers", str(dispatchers), "--host", "127.0.0.1", "--port", str(port),
+                   "--base-port", str(_free_port())]
+    process = subprocess.Popen([sys.executable, *command], cwd=ROOT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=0.5).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Приложение в режиме {mode} не запустилось")
+
+
+def stop_server(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def benchmark_mode(args, mode: str, cookies: List[str]) -> List[BenchResult]:
+    port = _free_port()
+    process = start_server(mode, port, args.workers, args.dispatchers)
+    channels = [f"bench_channel_{index}" for index in range(args.channels)]
+
+    def headers(index: int) -> dict:
+        return {"cookie": cookies[index % len(cookies)]}
+
+    requests = {
+        "health": lambda client, i: client.get("/health"),
+        "dashboard": lambda client, i: client.get("/dashboard", headers=headers(i)),
+        "last-messages": lambda client, i: client.get(
+            f"/last-messages/{channels[i % len(channels)]}", headers=headers(i)
+        ),
+    }
+    results = []
+    try:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None, limits=limits) as client:
+            for endpoint in args.endpoints:
+                for concurrency in args.concurrency:
+                    if args.warmup:
+                        await run_level(client, requests[endpoint], min(concurrency, args.warmup), args.warmup)
+                    latencies, errors, elapsed = await run_level(
+                        client, requests[endpoint], concurrency, args.requests
+                    )
+                    results.append(BenchResult(
+                        endpoint=endpoint,
+                        concurrency=concurrency,
+                        requests=len(latencies),
+                        errors=errors,
+                        p50_ms=percentile(latencies, 50) * 1000,
+                        p99_ms=percentile(latencies, 99) * 1000,
+                        mean_ms=sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+                        throughput_rps=len(latencies) / elapsed if elapsed else 0.0,
+                    ))
+                    print(f"{mode:<11} {format_row(results[-1])}", flush=True)
+    finally:
+        stop_server(process)
+    return results
+
+
+async def benchmark(args) -> Dict[str, List[BenchResult]]:
+    cookies = await create_sessions(args.users)
+    return {mode: await benchmark_mode(args, mode, cookies) for mode in MODES}
+
+
+def print_comparison(results: Dict[str, List[BenchResult]]):
+    print(f"\n{'endpoint':<14} {'conc':>5} {'p50 x':>7} {'p99 x':>7} {'rps x':>7}")
+    for direct, proxied in zip(results["direct"], results["dispatcher"]):
+        print(f"{direct.endpoint:<14} {direct.concurrency:>5} "
+              f"{proxied.p50_ms / direct.p50_ms:>7.2f} {proxied.p99_ms / direct.p99_ms:>7.2f} "
+              f"{proxied.throughput_rps / direct.throughput_rps:>7.2f}")
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Сравнение одного процесса приложения и диспетчера app.cluster")
+    parser.add_argument("--endpoints", type=lambda value: value.split(","), default=list(ENDPOINTS),
+                        help=f"эндпоинты через запятую: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", type=lambda value: [int(level) for level in value.split(",")],
+                        default=[1, 16, 64], help="уровни параллельности через запятую")
+    parser.add_argument("--requests", type=int, default=500, help="запросов на каждый уровень")
+    parser.add_argument("--warmup", type=int, default=20, help="прогревочных запросов перед замером")
+    parser.add_argument("--workers", type=int, default=1, help="воркеров за диспетчером")
+    parser.add_argument("--dispatchers", type=int, default=1, help="процессов диспетчера на общем порту")
+    parser.add_argument("--users", type=int, default=4, help="количество пользовательских сессий")
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--groups", type=int, default=30)
+    parser.add_argument("--private-chats", type=int, default=100)
+    parser.add_argument("--folders", type=int, default=5)
+    parser.add_argument("--telegram-latency", type=float, default=0.02, help="задержка запроса к Telegram, с")
+    parser.add_argument("--json", dest="json_path", help="сохранить результаты в JSON")
+    args = parser.parse_args(argv)
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"неизвестные эндпоинты: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory() as database_dir:
+        configure_environment(args, database_dir)
+        print(f"{'mode':<11} {'endpoint':<14} {'conc':>5} {'reqs':>7} {'errors':>6} "
+              f"{'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'rps':>9}")
+        results = asyncio.run(benchmark(args))
+    print_comparison(results)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({mode: [asdict(result) for result in rows] for mode, rows in results.items()}, f,
+                      ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""
+Приложение app.main с фейковым TelegramClient для запуска в отдельных процессах
+(uvicorn или python -m app.cluster --app benchmarks.fake_app:app). Параметры синтетического аккаунта
+передаются в переменной окружения BENCH_PROFILE (JSON с полями SyntheticProfile).
+"""
+import json
+import os
+
+from app.services import client_pool
+from benchmarks.fake_telegram import FakeTelegramClient, SyntheticProfile
+
+profile = SyntheticProfile(**json.loads(os.environ.get("BENCH_PROFILE", "{}")))
+
+
+async def fake_telegram_client(session_str: str = None):
+    # Номер пользователя берется из строки сессии, чтобы в каждом процессе аккаунт был одним и тем же
+    index = int(session_str.rsplit("-", 1)[-1]) if session_str else 0
+    return FakeTelegramClient(profile, seed=index, user_id=index + 1)
+
+
+client_pool.get_telegram_client = fake_telegram_client
+
+from app.main import app  # noqa: E402,F401 - приложение импортируется после подмены клиента
@@ -0,0 +1,241 @@
+import asyncio
+import math
+import random
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from telethon import functions, types, utils
+
+# Размер страницы messages.getHistory / messages.getDialogs в Telegram
+PAGE_SIZE = 100
+
+WORDS = (
+    "новости обновление релиз канал сообщение встреча проект задача отчет команда сервер база данные "
+    "пользователь график итоги планы вопрос ответ ссылка обсуждение исправление ошибка тест запуск "
+    "release update meeting report deploy build latency metrics review draft roadmap budget"
+).split()
+
+
+@dataclass
+class SyntheticProfile:
+    """Размер синтетического аккаунта: количество диалогов, папок, сообщений и задержка ответов Telegram"""
+    channels: int = 50
+    groups: int = 30
+    users: int = 100
+    folders: int = 5
+    peers_per_folder: int = 20
+    messages_per_dialog: int = 2000
+    words_per_message: int = 30
+    message_interval: float = 600.0
+    rpc_latency: float = 0.02
+
+
+class FakeDialog:
+    """Диалог с теми же атрибутами, что и telethon.tl.custom.Dialog, которые использует приложение"""
+
+    def __init__(self, entity, unread_count: int, message):
+        self.entity = entity
+        self.id = utils.get_peer_id(entity)
+        self.unread_count = unread_count
+        self.message = message
+        self.date = message.date if message else None
+        self.is_user = isinstance(entity, types.User)
+        self.is_channel = isinstance(entity, types.Channel)
+        self.is_group = isinstance(entity, types.Chat) or (self.is_channel and bool(entity.megagroup))
+        self.name = utils.get_display_name(entity)
+
+
+class FakeTelegramClient:
+    """
+    Замена TelegramClient для бенчмарков: синтетические диалоги, папки и история сообщений
+    без обращения к сети. Каждый запрос к Telegram выполняется с задержкой profile.rpc_latency
+    и учитывается в счетчике requests.
+    """
+
+    def __init__(self, profile: SyntheticProfile, seed: int = 0, user_id: int = 1):
+        self.profile = profile
+        self.seed = seed
+        self.user_id = user_id
+        self.requests: Counter = Counter()
+        self._connected = False
+        self._handlers = []
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        self._history_start = now - timedelta(seconds=profile.message_interval * profile.messages_per_dialog)
+
+        rng = random.Random(seed)
+        self.channels = [
+            types.Channel(
+                id=1_000_000 + i, title=f"Канал {i}", photo=types.ChatPhotoEmpty(), date=self._history_start,
+                broadcast=True, access_hash=rng.getrandbits(63), username=f"bench_channel_{i}",
+                participants_count=rng.randint(10, 100_000),
+            )
+            for i in range(profile.channels)
+        ]
+        self.groups = [
+            types.Chat(
+                id=2_000_000 + i, title=f"Группа {i}", photo=types.ChatPhotoEmpty(),
+                participants_count=rng.randint(2, 500), date=self._history_start, version=1,
+            )
+            for i in range(profile.groups)
+        ]
+        self.users = [
+            types.User(
+                id=3_000_000 + i, access_hash=rng.getrandbits(63), first_name=f"Пользователь {i}",
+                last_name=rng.choice(WORDS),
+            )
+            for i in range(profile.users)
+        ]
+        self.entities: Dict[int, object] = {
+            utils.get_peer_id(entity): entity for entity in (*self.channels, *self.groups, *self.users)
+        }
+        self._unread = {peer_id: rng.randint(0, 50) for peer_id in self.entities}
+
+        peers = list(self.entities.values())
+        self.filters = [
+            types.DialogFilter(
+                id=i + 2, title=f"Папка {i}", pinned_peers=[], exclude_peers=[],
+                include_peers=[
+                    utils.get_input_peer(entity)
+                    for entity in rng.sample(peers, min(profile.peers_per_folder, len(peers)))
+                ],
+            )
+            for i in range(profile.folders)
+        ]
+
+    # Подключение и события
+
+    async def connect(self):
+        self._connected = True
+
+    async def disconnect(self):
+        self._connected = False
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def is_user_authorized(self) -> bool:
+        return True
+
+    def add_event_handler(self, callback, event=None):
+        self._handlers.append((callback, event))
+
+    def remove_event_handler(self, callback, event=None):
+        self._handlers = [handler for handler in self._handlers if handler != (callback, event)]
+
+    # Запросы
+
+    async def _rpc(self, name: str, pages: int = 1):
+        self.requests[name] += pages
+        await asyncio.sleep(self.profile.rpc_latency * pages)
+
+    def _message(self, peer_id: int, message_id: int):
+        rng = random.Random(hash((self.seed, peer_id, message_id)))
+        count = max(1, int(rng.gauss(self.profile.words_per_message, self.profile.words_per_message / 3)))
+        return SimpleNamespace(
+            id=message_id,
+            peer_id=peer_id,
+            chat_id=peer_id,
+            date=self._history_start + timedelta(seconds=self.profile.message_interval * message_id),
+            text=" ".join(rng.choice(WORDS) for _ in range(count)),
+            sender_id=rng.choice(self.users).id if self.users else self.user_id,
+            out=False,
+        )
+
+    def _id_for_date(self, date: datetime) -> float:
+        """ID сообщения (дробный), отправленного в момент date"""
+        return (date - self._history_start).total_seconds() / self.profile.message_interval
+
+    async def get_peer_id(self, peer) -> int:
+        if peer == "me":
+            return self.user_id
+        return utils.get_peer_id(await self.get_entity(peer))
+
+    async def get_me(self):
+        return types.User(id=self.user_id, is_self=True, first_name="Бенчмарк")
+
+    async def get_entity(self, peer):
+        await self._rpc("GetEntity")
+        if isinstance(peer, (types.Channel, types.Chat, types.User)):
+            return peer
+        if isinstance(peer, str):
+            username = peer.lstrip("@").lower()
+            for channel in self.channels:
+                if channel.username == username:
+                    return channel
+            raise ValueError(f'No user has "{peer}" as username')
+        if isinstance(peer, int):
+            entity = self.entities.get(peer)
+            if entity is None:
+                # ID без префикса типа: ищем среди всех сущностей
+                entity = next((entity for entity in self.entities.values() if entity.id == peer), None)
+        else:
+            entity = self.entities.get(utils.get_peer_id(peer))
+        if entity is None:
+            raise ValueError(f"Could not find the input entity for {peer!r}")
+        return entity
+
+    def _dialogs(self, limit: Optional[int] = None) -> List[FakeDialog]:
+        dialogs = [
+            FakeDialog(entity, self._unread[peer_id], self._message(peer_id, self.profile.messages_per_dialog))
+            for peer_id, entity in self.entities.items()
+        ]
+        dialogs.sort(key=lambda dialog: dialog.id % 97)
+        if limit is not None:
+            dialogs = dialogs[:limit]
+        return dialogs
+
+    async def get_dialogs(self, limit: Optional[int] = None) -> List[FakeDialog]:
+        dialogs = self._dialogs(limit)
+        await self._rpc("GetDialogs", max(1, math.ceil(len(dialogs) / PAGE_SIZE)))
+        return dialogs
+
+    async def iter_dialogs(self, limit: Optional[int] = None):
+        """Как в Telethon: диалоги выдаются по мере получения страниц по PAGE_SIZE"""
+        dialogs = self._dialogs(limit)
+        for start in range(0, max(len(dialogs), 1), PAGE_SIZE):
+            await self._rpc("GetDialogs")
+            for dialog in dialogs[start:start + PAGE_SIZE]:
+                yield dialog
+
+    async def iter_messages(self, entity, limit: Optional[int] = None, min_id: int = 0, max_id: int = 0,
+                            offset_id: int = 0, offset_date: Optional[datetime] = None, reverse: bool = False,
+                            **kwargs):
+        peer_id = utils.get_peer_id(entity)
+        low, high = min_id + 1, self.profile.messages_per_dialog
+        if max_id:
+            high = min(high, max_id - 1)
+        if reverse:
+            if offset_id:
+                low = max(low, offset_id + 1)
+            if offset_date:
+                low = max(low, math.floor(self._id_for_date(offset_date)) + 1)
+            ids = range(low, high + 1)
+        else:
+            if offset_id:
+                high = min(high, offset_id - 1)
+            if offset_date:
+                high = min(high, math.ceil(self._id_for_date(offset_date)) - 1)
+            ids = range(high, low - 1, -1)
+        if limit is not None:
+            ids = ids[:limit]
+
+        for index, message_id in enumerate(ids):
+            if index % PAGE_SIZE == 0:
+                await self._rpc("GetHistory")
+            yield self._message(peer_id, message_id)
+
+    async def __call__(self, request):
+        name = type(request).__name__.replace("Request", "")
+        await self._rpc(name)
+        if isinstance(request, functions.messages.GetDialogFiltersRequest):
+            return SimpleNamespace(filters=list(self.filters))
+        if isinstance(request, functions.channels.GetChannelsRequest):
+            return SimpleNamespace(chats=[self.entities[utils.get_peer_id(peer)] for peer in request.id])
+        if isinstance(request, functions.users.GetUsersRequest):
+            return [self.entities[peer.user_id] for peer in request.id]
+        if isinstance(request, functions.messages.GetChatsRequest):
+            return SimpleNamespace(chats=[self.entities[-chat_id] for chat_id in request.id])
+        raise NotImplementedError(f"Запрос {name} не поддерживается фейковым клиентом")
@@ -0,0 +1,133 @@
+"""
+Локальная заглушка OpenAI-совместимого API (POST /v1/chat/completions) с настраиваемой
+задержкой до первого токена, скоростью генерации и долей ответов 429.
+
+Запуск: python -m benchmarks.openai_stub --port 8900 --latency 0.3 --tokens-per-second 200
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+WORDS = "итог обсуждение канал новости команда релиз задачи планы вопросы решения".split()
+
+
+class StubConfig:
+    latency: float = 0.3
+    tokens_per_second: float = 200.0
+    completion_tokens: int = 150
+    error_rate: float = 0.0
+
+
+config = StubConfig()
+stats = {"requests": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+
+def _prompt_tokens(messages) -> int:
+    return sum(len(message.get("content") or "") for message in messages) // 4 + 1
+
+
+def _completion(max_tokens: int) -> list:
+    return [random.choice(WORDS) for _ in range(min(max_tokens, config.completion_tokens))]
+
+
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    if random.random() < config.error_rate:
+        stats["errors"] += 1
+        return JSONResponse(
+            {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+            status_code=429, headers={"retry-after": "1"},
+        )
+
+    prompt_tokens = _prompt_tokens(body.get("messages", []))
+    tokens = _completion(body.get("max_tokens") or config.completion_tokens)
+    stats["prompt_tokens"] += prompt_tokens
+    stats["completion_tokens"] += len(tokens)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    model = body.get("model", "stub")
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+             "total_tokens": prompt_tokens + len(tokens)}
+
+    if not body.get("stream"):
+        await asyncio.sleep(config.latency + len(tokens) / config.tokens_per_second)
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    def chunk(delta: dict, finish_reason=None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    async def events():
+        await asyncio.sleep(config.latency)
+        yield chunk({"role": "assistant", "content": ""})
+        for token in tokens:
+            await asyncio.sleep(1 / config.tokens_per_second)
+            yield chunk({"content": token + " "})
+        yield chunk({}, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+async def get_model(request: Request):
+    """Запрос модели используется приложением для прогрева соединения при запуске"""
+    return JSONResponse({"id": request.path_params["model"], "object": "model", "created": 0, "owned_by": "stub"})
+
+
+async def get_stats(request: Request):
+    return JSONResponse(stats)
+
+
+app = Starlette(routes=[
+    Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+    Route("/v1/models/{model}", get_model),
+    Route("/stats", get_stats),
+])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушка OpenAI API для бенчмарков")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=config.latency, help="задержка до первого токена, с")
+    parser.add_argument("--tokens-per-second", type=float, default=config.tokens_per_second)
+    parser.add_argument("--completion-tokens", type=int, default=config.completion_tokens)
+    parser.add_argument("--error-rate", type=float, default=config.error_rate, help="доля ответов 429")
+    args = parser.parse_args()
+
+    config.latency = args.latency
+    config.tokens_per_second = args.tokens_per_second
+    config.completion_tokens = args.completion_tokens
+    config.error_rate = args.error_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
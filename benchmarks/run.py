@@ -0,0 +1,259 @@
+"""
+Бенчмарк приложения без реальных Telegram и OpenAI.
+
+Приложение из app/main.py запускается в этом же процессе (через ASGI-транспорт httpx) с фейковым
+TelegramClient и локальной заглушкой OpenAI API. Для каждого эндпоинта и уровня параллельности
+выводятся p50/p99 задержки и пропускная способность.
+
+Запуск: python -m benchmarks.run --concurrency 1,8,32 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.fake_telegram import FakeTelegramClient, SyntheticProfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ("dashboard", "last-messages", "summarize")
+
+
+@dataclass
+class BenchResult:
+    endpoint: str
+    concurrency: int
+    requests: int
+    errors: int
+    p50_ms: float
+    p99_ms: float
+    mean_ms: float
+    throughput_rps: float
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_openai_stub(args) -> subprocess.Popen:
+    """Запускает заглушку OpenAI в отдельном процессе и ждет, пока она начнет отвечать"""
+    process = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.openai_stub",
+        "--port", str(args.openai_port),
+        "--latency", str(args.openai_latency),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--completion-tokens", str(args.completion_tokens),
+        "--error-rate", str(args.openai_error_rate),
+    ], cwd=ROOT)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{args.openai_port}/stats", timeout=0.5)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Заглушка OpenAI не запустилась")
+
+
+def configure_environment(args, database_dir: str):
+    """Переменные окружения нужно задать до импорта приложения: настройки читаются при импорте"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(database_dir, 'bench.db')}"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.openai_port}/v1"
+    for name, value in {
+        "API_ID": "1", "API_HASH": "bench", "SESSION_SECRET_KEY": "bench", "OPENAI_API_KEY": "sk-bench",
+        "SECRET_KEY": "bench", "SESSION_NAME": "bench",
+    }.items():
+        os.environ.setdefault(name, value)
+
+
+async def run_level(client: httpx.AsyncClient, make_request: Callable, concurrency: int,
+                    total: int) -> Tuple[List[float], int, float]:
+    """Выполняет total запросов с заданной параллельностью, возвращает задержки, ошибки и общее время"""
+    latencies, errors = [], 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for index in counter:
+            started = time.perf_counter()
+            try:
+                response = await make_request(client, index)
+                if response.status_code != 200:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def benchmark(args) -> List[BenchResult]:
+    from app.main import app
+    from app.database import AsyncSessionLocal
+    from app.models import SummaryCacheEntry
+    from app.services import client_pool as client_pool_module
+    from app.sessions import ServerSessionMiddleware, session_store
+    from sqlalchemy import delete
+    import itsdangerous
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    profile = SyntheticProfile(
+        channels=args.channels, groups=args.groups, users=args.private_chats, folders=args.folders,
+        messages_per_dialog=args.messages, rpc_latency=args.telegram_latency,
+    )
+    fake_clients: Dict[str, FakeTelegramClient] = {}
+
+    async def fake_telegram_client(session_str: str = None):
+        client = FakeTelegramClient(profile, seed=len(fake_clients), user_id=len(fake_clients) + 1)
+        fake_clients[session_str] = client
+        return client
+
+    client_pool_module.get_telegram_client = fake_telegram_client
+
+    # Схема БД создается при запуске приложения (lifespan), поэтому сессии сохраняются внутри него
+    async with app.router.lifespan_context(app):
+        secret_key = next(
+            middleware.kwargs["secret_key"] for middleware in app.user_middleware
+            if middleware.cls is ServerSessionMiddleware
+        )
+        signer = itsdangerous.TimestampSigner(str(secret_key))
+        cookies = []
+        for index in range(args.users):
+            session_id = f"bench-session-{index}"
+            await session_store.save(session_id, json.dumps({"session_str": f"bench-user-{index}"}))
+            cookies.append(f"session={signer.sign(session_id).decode('utf-8')}")
+
+        channel_template = FakeTelegramClient(profile)
+        channels = channel_template.channels
+
+        def headers(index: int) -> dict:
+            return {"cookie": cookies[index % len(cookies)]}
+
+        requests = {
+            "dashboard": lambda client, i: client.get("/dashboard", headers=headers(i)),
+            "last-messages": lambda client, i: client.get(
+                f"/last-messages/{channels[i % len(channels)].username}", headers=headers(i)
+            ),
+            "summarize": lambda client, i: client.post(
+                "/summarize", headers=headers(i),
+                data={"source": str(channels[i % len(channels)].id), "summary_type": "last_10"},
+            ),
+        }
+
+        results = []
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for endpoint in args.endpoints:
+                for concurrency in args.concurrency:
+                    if args.warmup:
+                        await run_level(client, requests[endpoint], min(concurrency, args.warmup), args.warmup)
+                    if endpoint == "summarize" and not args.keep_cache:
+                        async with AsyncSessionLocal() as db:
+                            await db.execute(delete(SummaryCacheEntry))
+                            await db.commit()
+                    latencies, errors, elapsed = await run_level(
+                        client, requests[endpoint], concurrency, args.requests
+                    )
+                    results.append(BenchResult(
+                        endpoint=endpoint,
+                        concurrency=concurrency,
+                        requests=len(latencies),
+                        errors=errors,
+                        p50_ms=percentile(latencies, 50) * 1000,
+                        p99_ms=percentile(latencies, 99) * 1000,
+                        mean_ms=sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+                        throughput_rps=len(latencies) / elapsed if elapsed else 0.0,
+                    ))
+                    print(format_row(results[-1]), flush=True)
+
+    telegram_requests = sum((client.requests for client in fake_clients.values()), Counter())
+    print(f"\nЗапросы к Telegram: {dict(telegram_requests)}")
+    return results
+
+
+def format_row(result: BenchResult) -> str:
+    return (f"{result.endpoint:<14} {result.concurrency:>5} {result.requests:>7} {result.errors:>6} "
+            f"{result.p50_ms:>9.1f} {result.p99_ms:>9.1f} {result.mean_ms:>9.1f} {result.throughput_rps:>9.1f}")
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Бенчмарк приложения с фейковыми Telegram и OpenAI")
+    parser.add_argument("--endpoints", type=lambda value: value.split(","), default=list(ENDPOINTS),
+                        help=f"эндпоинты через запятую: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", type=lambda value: [int(level) for level in value.split(",")],
+                        default=[1, 8, 32], help="уровни параллельности через запятую")
+    parser.add_argument("--requests", type=int, default=200, help="запросов на каждый уровень")
+    parser.add_argument("--warmup", type=int, default=10, help="прогревочных запросов перед замером")
+    parser.add_argument("--users", type=int, default=4, help="количество пользовательских сессий")
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--groups", type=int, default=30)
+    parser.add_argument("--private-chats", type=int, default=100)
+    parser.add_argument("--folders", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=2000, help="сообщений в каждом диалоге")
+    parser.add_argument("--telegram-latency", type=float, default=0.02, help="задержка запроса к Telegram, с")
+    parser.add_argument("--openai-port", type=int, default=None)
+    parser.add_argument("--openai-latency", type=float, default=0.3, help="задержка до первого токена, с")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--completion-tokens", type=int, default=150)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0, help="доля ответов 429 от заглушки")
+    parser.add_argument("--keep-cache", action="store_true", help="не очищать кэш суммаризаций между замерами")
+    parser.add_argument("--json", dest="json_path", help="сохранить результаты в JSON")
+    parser.add_argument("--verbose", action="store_true", help="не отключать INFO-логи приложения")
+    args = parser.parse_args(argv)
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"неизвестные эндпоинты: {', '.join(sorted(unknown))}")
+    if args.openai_port is None:
+        args.openai_port = _free_port()
+    return args
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    stub = start_openai_stub(args)
+    try:
+        with tempfile.TemporaryDirectory() as database_dir:
+            configure_environment(args, database_dir)
+            print(f"{'endpoint':<14} {'conc':>5} {'reqs':>7} {'errors':>6} "
+                  f"{'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'rps':>9}")
+            results = asyncio.run(benchmark(args))
+        openai_stats = httpx.get(f"http://127.0.0.1:{args.openai_port}/stats").json()
+        print(f"Запросы к OpenAI: {openai_stats}")
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"results": [asdict(result) for result in results], "openai": openai_stats}, f,
+                      ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import os
+import tempfile
+
+# Настройки читаются при импорте app.config, поэтому окружение задается до импорта приложения
+_database_dir = tempfile.mkdtemp(prefix="telegram-summary-tests-")
+os.environ.update(
+    API_ID="1",
+    API_HASH="test",
+    SESSION_SECRET_KEY="test",
+    OPENAI_API_KEY="sk-test",
+    SECRET_KEY="test",
+    SESSION_NAME="test",
+    DATABASE_URL=f"sqlite:///{os.path.join(_database_dir, 'test.db')}",
+    WARMUP_OPENAI="false",
+)
+
+import pytest  # noqa: E402
+
+from benchmarks.fake_telegram import FakeTelegramClient, SyntheticProfile  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def database():
+    """Чистая схема БД на время теста"""
+    from app import models  # noqa: F401 - регистрация моделей в метаданных
+    from app.database import Base, async_engine
+
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.exec_driver_sql("DROP TABLE IF EXISTS archived_messages_fts")
+        await conn.run_sync(Base.metadata.create_all)
+    yield
+    # Соединения пула привязаны к циклу событий теста
+    await async_engine.dispose()
+
+
+@pytest.fixture
+def profile():
+    return SyntheticProfile(channels=5, groups=3, users=4, folders=2, peers_per_folder=3,
+                            messages_per_dialog=300, rpc_latency=0.0)
+
+
+@pytest.fixture
+def fake_client(profile):
+    return FakeTelegramClient(profile)
@@ -0,0 +1,70 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.database import Base, async_engine
+from app.services.archive import StoredMessage, _ingest, _search
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("database")]
+
+OWNER, OTHER_OWNER, PEER = 1, 2, -1001
+
+
+def message(message_id: int, text: str) -> StoredMessage:
+    return StoredMessage(id=message_id, peer_id=PEER, date=datetime(2024, 1, 1, tzinfo=timezone.utc), text=text)
+
+
+async def test_reingest_replaces_index_entries():
+    await _ingest(OWNER, PEER, [message(1, "релиз перенесен"), message(2, "встреча завтра")], span=(0, 2))
+    await _ingest(OWNER, PEER, [message(1, "релиз состоялся")], span=None)
+
+    assert await _search(OWNER, "перенесен", 10) == []
+    found = await _search(OWNER, "релиз", 10)
+    assert [(result.message_id, result.snippet) for result in found] == [(1, "[релиз] состоялся")]
+    assert [result.message_id for result in await _search(OWNER, "встреча", 10)] == [2]
+
+
+async def test_search_is_limited_to_owner():
+    await _ingest(OWNER, PEER, [message(1, "общий отчет")], span=None)
+    await _ingest(OTHER_OWNER, PEER, [message(1, "общий отчет")], span=None)
+    assert len(await _search(OWNER, "отчет", 10)) == 1
+
+
+async def test_legacy_index_is_rebuilt():
+    await _ingest(OWNER, PEER, [message(1, "старый индекс")], span=None)
+    async with async_engine.begin() as conn:
+        await conn.exec_driver_sql("DROP TABLE archived_messages_fts")
+        await conn.exec_driver_sql(
+            "CREATE VIRTUAL TABLE archived_messages_fts USING fts5("
+            "text, owner_id UNINDEXED, peer_id UNINDEXED, message_id UNINDEXED, tokenize='unicode61')"
+        )
+        await conn.run_sync(Base.metadata.create_all)
+        sql = (await conn.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE name = 'archived_messages_fts'"
+        )).scalar()
+    assert "content=" in sql
+    assert [result.message_id for result in await _search(OWNER, "индекс", 10)] == [1]
+
+
+async def test_legacy_table_gets_surrogate_key():
+    """Архив без столбца id (rowid не стабилен при VACUUM) переносится в новую таблицу"""
+    async with async_engine.begin() as conn:
+        await conn.exec_driver_sql("DROP TABLE archived_messages_fts")
+        await conn.exec_driver_sql("DROP TABLE archived_messages")
+        await conn.exec_driver_sql(
+            "CREATE TABLE archived_messages (owner_id BIGINT, peer_id BIGINT, message_id INTEGER, "
+            "date DATETIME NOT NULL, text TEXT NOT NULL, sender_id BIGINT, PRIMARY KEY (owner_id, peer_id, message_id))"
+        )
+        await conn.exec_driver_sql(
+            f"INSERT INTO archived_messages VALUES ({OWNER}, {PEER}, 7, '2024-01-01 00:00:00', 'перенесенный архив', NULL)"
+        )
+        await conn.run_sync(Base.metadata.create_all)
+        columns = [row[1] for row in await conn.exec_driver_sql("PRAGMA table_info(archived_messages)")]
+        sql = (await conn.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE name = 'archived_messages_fts'"
+        )).scalar()
+    assert "id" in columns
+    assert "content_rowid='id'" in sql
+    assert [result.message_id for result in await _search(OWNER, "архив", 10)] == [7]
+    await _ingest(OWNER, PEER, [message(7, "обновленный архив")], span=None)
+    assert [result.snippet for result in await _search(OWNER, "архив", 10)] == ["обновленный [архив]"]
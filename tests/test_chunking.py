@@ -0,0 +1,49 @@
+from app.services.chunking import MESSAGE_SEPARATOR, MessageChunker, chunk_messages, count_tokens
+
+BUDGET = 60
+
+
+def message(index: int, words: int = 10) -> str:
+    return f"сообщение {index} " + "слово " * words
+
+
+def test_whole_messages_fill_chunks_up_to_budget():
+    messages = [message(index) for index in range(30)]
+    chunks, stats = chunk_messages(messages, BUDGET)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= BUDGET for chunk in chunks)
+    # Сообщения не разрезаются и не повторяются в соседних частях, порядок сохраняется
+    assert MESSAGE_SEPARATOR.join(chunks) == MESSAGE_SEPARATOR.join(messages)
+    assert stats.chunks == len(chunks)
+    assert 0.5 < stats.fill_ratio <= 1
+
+
+def test_chunk_ends_exactly_at_budget():
+    first, second = message(1), message(2)
+    budget = count_tokens(first) + count_tokens(MESSAGE_SEPARATOR) + count_tokens(second)
+    assert chunk_messages([first, second], budget)[0] == [first + MESSAGE_SEPARATOR + second]
+    assert chunk_messages([first, second], budget - 1)[0] == [first, second]
+
+
+def test_oversized_message_is_split_by_sentences_and_words():
+    sentences = [f"Предложение номер {index} " + "слово " * 5 + "конец." for index in range(12)]
+    long_word_sentence = "длинное " * 200
+    chunks, _ = chunk_messages([message(0, 3), " ".join(sentences) + " " + long_word_sentence], BUDGET)
+    assert len(chunks) > 2
+    assert all(count_tokens(chunk) <= BUDGET for chunk in chunks)
+    assert chunks[0].startswith("сообщение 0")
+    assert all(sentence in MESSAGE_SEPARATOR.join(chunks) for sentence in sentences)
+
+
+def test_streaming_chunker_returns_chunks_as_they_complete():
+    chunker = MessageChunker(BUDGET)
+    completed = []
+    for index in range(10):
+        ready = chunker.add(message(index))
+        # Часть отдается, как только следующее сообщение в нее не помещается
+        assert len(ready) <= 1
+        completed.extend(ready)
+    assert completed
+    completed.extend(chunker.flush())
+    assert completed == chunk_messages([message(index) for index in range(10)], BUDGET)[0]
+    assert chunker.flush() == []
@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from app import client_ai
+from app.config import settings
+from app.services import metrics, summarize
+from app.services.rate_limit import RateLimiter
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeStream:
+    def __init__(self, tokens, delay: float = 0.0):
+        self.tokens = tokens
+        self.delay = delay
+        self.closed = False
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for token in self.tokens:
+            await asyncio.sleep(self.delay)
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeOpenAI:
+    def __init__(self, create):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = RateLimiter("openai_test", rate=100, burst=100, max_concurrency=2)
+    monkeypatch.setattr(client_ai, "openai_limiter", limiter)
+    return limiter
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    stream = FakeStream(["итог ", "дня"], delay=0.05)
+
+    async def create(**kwargs):
+        return stream
+
+    monkeypatch.setattr(client_ai, "get_openai_client", lambda: FakeOpenAI(create))
+    return stream
+
+
+async def test_stream_holds_slot_until_consumed(limiter, stream):
+    active = [limiter.active async for _ in client_ai.stream_summary("текст")]
+    assert active == [1, 1]
+    assert limiter.active == 0
+    assert stream.closed
+
+
+async def test_abandoned_stream_releases_slot(limiter, stream):
+    tokens = client_ai.stream_summary("текст")
+    assert await tokens.__anext__() == "итог "
+    assert limiter.active == 1
+    await tokens.aclose()
+    assert limiter.active == 0
+    assert stream.closed
+
+
+async def test_openai_stage_covers_whole_stream(limiter, stream):
+    timings = []
+    token = metrics._request_timings.set(timings)
+    try:
+        async for _ in client_ai.stream_summary("текст"):
+            pass
+    finally:
+        metrics._request_timings.reset(token)
+    assert [name for name, _ in timings] == ["openai"]
+    assert timings[0][1] >= 2 * stream.delay
+
+
+@pytest.mark.usefixtures("database")
+async def test_rate_limit_is_retried_once_per_layer(limiter, monkeypatch):
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+        response = httpx.Response(429, headers={"retry-after": "0"}, request=request)
+        raise openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+    monkeypatch.setattr(client_ai, "get_openai_client", lambda: FakeOpenAI(create))
+    monkeypatch.setattr(settings, "SUMMARY_RETRY_BACKOFF", 0.0)
+    assert await summarize.summarize_with_retry("текст", asyncio.Semaphore(1)) is None
+    assert len(calls) == settings.OPENAI_MAX_RETRIES + 1
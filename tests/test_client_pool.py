@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+from app.services import client_pool as client_pool_module
+from app.services.client_pool import TelegramClientPool
+from benchmarks.fake_telegram import FakeTelegramClient
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def pool(monkeypatch, profile):
+    async def fake_telegram_client(session_str=None):
+        return FakeTelegramClient(profile)
+
+    monkeypatch.setattr(client_pool_module, "get_telegram_client", fake_telegram_client)
+    return TelegramClientPool(max_size=1, idle_ttl=60, max_concurrent_connects=2)
+
+
+async def test_acquire_reuses_connected_client(pool):
+    first = await pool.acquire("a")
+    assert await pool.acquire("a") is first
+    assert pool.stats()["hits"] == 1 and pool.stats()["misses"] == 1
+
+
+async def test_leased_client_survives_idle_ttl(pool):
+    async with pool.lease("a") as client:
+        pool._clients["a"].last_used = time.monotonic() - 3600
+        await pool.acquire("b")
+        assert client.is_connected()
+        assert "a" in pool._clients
+    # После окончания использования время простоя отсчитывается заново
+    assert time.monotonic() - pool._clients["a"].last_used < 60
+
+
+async def test_leased_client_not_evicted_on_overflow(pool):
+    async with pool.lease("a") as client:
+        other = await pool.acquire("b")
+        assert client.is_connected() and other.is_connected()
+        assert len(pool) == 2
+    # Освободившийся клиент вытесняется при следующем переполнении
+    await pool.acquire("c")
+    assert not client.is_connected()
+    assert set(pool._clients) == {"c"}
+
+
+async def test_request_hold_released_with_response(pool):
+    scope = {"client_leases": []}
+    await pool.acquire("a")
+    pool.hold_for_request(scope, "a")
+    assert pool.stats()["leased"] == 1
+    for pooled in scope["client_leases"]:
+        pool.unhold(pooled)
+    assert pool.stats()["leased"] == 0
@@ -0,0 +1,97 @@
+import itertools
+
+import pytest
+from starlette.requests import Request
+
+from app import routers, sessions
+from app.cluster import Dispatcher, WorkerProcess
+from app.config import settings
+from app.services.workers import owns_session, session_owner
+from app.sessions import ServerSession
+from benchmarks.fake_telegram import FakeTelegramClient
+
+WORKERS = 3
+
+
+def dispatcher() -> Dispatcher:
+    return Dispatcher([WorkerProcess(index, WORKERS, 8100 + index, "app.main:app") for index in range(WORKERS)])
+
+
+def scope(cookie: str = None) -> dict:
+    headers = [(b"cookie", f"theme=dark; session={cookie}".encode())] if cookie else []
+    return {"type": "http", "headers": headers}
+
+
+def session_of_worker(worker: int, worker_count: int = WORKERS) -> str:
+    return next(f"session-{n}" for n in itertools.count() if session_owner(f"session-{n}", worker_count) == worker)
+
+
+def test_session_requests_go_to_owner():
+    router = dispatcher()
+    for n in range(20):
+        session_id = f"session-{n}"
+        # Подпись cookie (".<время>.<подпись>") не влияет на выбор воркера
+        expected = session_owner(session_id, WORKERS)
+        assert router.worker_for(scope(f"{session_id}.abc.def")).index == expected
+        assert router.worker_for(scope(f"{session_id}.xyz.uvw")).index == expected
+
+
+def test_requests_without_session_are_spread():
+    router = dispatcher()
+    indexes = [router.worker_for(scope(cookie)).index for cookie in (None, "null", None, None, "null", None)]
+    assert indexes == [0, 1, 2, 0, 1, 2]
+
+
+def test_worker_and_dispatcher_agree_on_owner(monkeypatch):
+    monkeypatch.setattr(settings, "WORKER_COUNT", WORKERS)
+    router = dispatcher()
+    for worker in range(WORKERS):
+        monkeypatch.setattr(settings, "WORKER_ID", worker)
+        for n in range(10):
+            session_id = f"session-{n}"
+            assert owns_session(session_id) == (router.worker_for(scope(f"{session_id}.a.b")).index == worker)
+
+
+class LoginClient(FakeTelegramClient):
+    """Фейковый клиент с входом по коду"""
+
+    class session:
+        @staticmethod
+        def save():
+            return "user-session"
+
+    async def sign_in(self, phone_number, code, phone_code_hash=None):
+        return await self.get_me()
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("database")
+@pytest.mark.parametrize("owner", [True, False])
+async def test_login_keeps_client_only_in_owner_worker(monkeypatch, profile, owner):
+    monkeypatch.setattr(settings, "WORKER_COUNT", 2)
+    monkeypatch.setattr(settings, "WORKER_ID", 0)
+    new_id = session_of_worker(0 if owner else 1, 2)
+    monkeypatch.setattr(sessions.secrets, "token_urlsafe", lambda size: new_id)
+
+    client = LoginClient(profile)
+    adopted = []
+
+    async def get_telegram_client(session_str=None):
+        return client
+
+    async def adopt(session_str, user_client):
+        adopted.append((session_str, user_client))
+
+    monkeypatch.setattr(routers, "get_telegram_client", get_telegram_client)
+    monkeypatch.setattr(routers.client_pool, "adopt", adopt)
+
+    session = ServerSession()
+    session.update(temp_session="temp", phone_number="+10000000000", phone_code_hash="hash")
+    request = Request({"type": "http", "method": "POST", "headers": [], "session": session,
+                       "session_id": "pre-login"})
+    response = await routers.complete_login_submit(request, code="12345")
+
+    assert response.status_code == 303
+    assert session.regenerated == new_id
+    assert adopted == ([("user-session", client)] if owner else [])
+    assert client.is_connected() == owner
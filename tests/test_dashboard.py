@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from app.routers import render_dashboard
+from app.services.dashboard import stream_dashboard
+
+pytestmark = pytest.mark.anyio
+
+FIRST_SCREEN = 20
+
+
+@pytest.fixture
+def slow_dialogs(fake_client):
+    """Список диалогов приходит позже папок, одной страницей меньше первого экрана"""
+    iter_dialogs = fake_client.iter_dialogs
+
+    async def slow_iter_dialogs(*args, **kwargs):
+        await asyncio.sleep(0.05)
+        async for dialog in iter_dialogs(*args, **kwargs):
+            yield dialog
+
+    fake_client.iter_dialogs = slow_iter_dialogs
+    return fake_client
+
+
+async def test_dialogs_come_before_folders(slow_dialogs):
+    events = [event async for event, _ in stream_dashboard(slow_dialogs, "participants", FIRST_SCREEN)]
+    assert events == ["dialogs", "folders"]
+
+
+async def test_page_shell_is_sent_before_fragments(slow_dialogs, monkeypatch):
+    from app.main import app
+
+    monkeypatch.setattr("app.routers.settings.DASHBOARD_FIRST_SCREEN", FIRST_SCREEN)
+    request = Request({
+        "type": "http", "method": "GET", "scheme": "http", "server": ("test", 80), "root_path": "",
+        "path": "/dashboard", "headers": [], "query_string": b"", "session": {}, "app": app, "router": app.router,
+    })
+    chunks = [chunk async for chunk in render_dashboard(request, slow_dialogs, "participants")]
+    page = "".join(chunks)
+    assert chunks[0].lstrip().startswith("<!DOCTYPE html>")
+    assert page.index("function fillSlot") < page.index('<template id="folders-fragment">')
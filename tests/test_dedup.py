@@ -0,0 +1,54 @@
+import numpy as np
+
+from app.services import dedup
+from app.services.dedup import NearDuplicateFilter, minhash_signatures, normalize, shingle_hashes
+
+WORDS = ("в пятницу вечером на сервере с основной базой данных пройдут плановые работы по обновлению ядра "
+         "и драйверов дисков поэтому доступ к отчетам и панели мониторинга будет закрыт примерно на два часа").split()
+ANNOUNCEMENT = " ".join(WORDS)
+# Одно слово заменено: сходство Жаккара шинглов около 0.8
+VARIANT = " ".join(WORDS[:10] + ["операционной"] + WORDS[11:])
+OTHER = "Отчет за квартал опубликован в общем канале, вопросы по нему можно задать до конца недели."
+
+
+def test_exact_repeats_ignore_case_punctuation_and_links():
+    texts = ["Встреча в 10:00!", "встреча в 10 00", "Встреча в 10:00 https://t.me/joinchat/abc", "Встреча в 11:00"]
+    result = NearDuplicateFilter(threshold=1.0).filter(texts)
+    assert result == ["Встреча в 10:00!", "Встреча в 11:00"]
+
+
+def test_near_duplicate_depends_on_threshold():
+    assert NearDuplicateFilter(threshold=0.5).filter([ANNOUNCEMENT, VARIANT, OTHER]) == [ANNOUNCEMENT, OTHER]
+    assert NearDuplicateFilter(threshold=0.95).filter([ANNOUNCEMENT, VARIANT, OTHER]) == [ANNOUNCEMENT, VARIANT, OTHER]
+
+
+def test_first_of_similar_messages_is_kept():
+    assert NearDuplicateFilter(threshold=0.5).filter([VARIANT, ANNOUNCEMENT]) == [VARIANT]
+
+
+def test_repeats_are_found_across_batches():
+    duplicates = NearDuplicateFilter(threshold=0.5)
+    assert duplicates.filter([OTHER, ANNOUNCEMENT]) == [OTHER, ANNOUNCEMENT]
+    assert duplicates.filter(["", VARIANT, "Новое сообщение", OTHER.upper()]) == ["Новое сообщение"]
+    stats = duplicates.stats
+    assert (stats.messages, stats.exact, stats.near) == (5, 1, 1)
+    assert stats.tokens_saved > 0
+
+
+def test_messages_without_words_are_kept():
+    assert NearDuplicateFilter(threshold=0.5).filter(["👍", "!!!", "👍"]) == ["👍", "!!!"]
+
+
+def test_signatures_do_not_depend_on_block_size(monkeypatch):
+    shingle_sets = [shingle_hashes(normalize(text)) for text in (ANNOUNCEMENT, VARIANT, OTHER, "да")]
+    whole = minhash_signatures(shingle_sets)
+    monkeypatch.setattr(dedup, "MAX_SHINGLES_PER_BLOCK", 5)
+    assert np.array_equal(minhash_signatures(shingle_sets), whole)
+
+
+def test_signature_similarity_estimates_jaccard():
+    announcement, variant, other = minhash_signatures(
+        [shingle_hashes(normalize(text)) for text in (ANNOUNCEMENT, VARIANT, OTHER)]
+    )
+    assert np.count_nonzero(announcement == variant) / dedup.NUM_PERM > 0.6
+    assert np.count_nonzero(announcement == other) / dedup.NUM_PERM < 0.2
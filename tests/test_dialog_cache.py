@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+import pytest
+from telethon import events, types, utils
+
+from app.config import settings
+from app.services import dialog_cache
+from app.services.dashboard import get_dialog_filters
+
+pytestmark = pytest.mark.anyio
+
+
+def dispatch(client, builder, event):
+    """Вызывает обработчики клиента, подписанные на события типа builder"""
+    return [callback(event) for callback, handler_event in client._handlers if isinstance(handler_event, builder)]
+
+
+async def emit(client, builder, event):
+    for handled in dispatch(client, builder, event):
+        await handled
+
+
+def find(dialogs, dialog_id):
+    return next(dialog for dialog in dialogs if dialog["id"] == dialog_id)
+
+
+async def test_snapshot_is_loaded_once_and_updated_by_events(fake_client):
+    channels, groups, _ = await dialog_cache.get_cached_dialogs(fake_client)
+    pages = fake_client.requests["GetDialogs"]
+    channel, group = fake_client.channels[0], fake_client.groups[0]
+    unread = find(channels, channel.id)["unread_count"]
+    participants = find(groups, group.id)["participants_count"]
+
+    message = SimpleNamespace(id=10_000, out=False)
+    await emit(fake_client, events.NewMessage, SimpleNamespace(chat_id=utils.get_peer_id(channel), message=message))
+    await emit(fake_client, events.ChatAction, SimpleNamespace(
+        chat_id=utils.get_peer_id(group), user_ids=[1, 2],
+        user_joined=True, user_added=False, user_left=False, user_kicked=False,
+    ))
+    channels, groups, _ = await dialog_cache.get_cached_dialogs(fake_client)
+    assert fake_client.requests["GetDialogs"] == pages
+    assert channels[0]["id"] == channel.id
+    assert channels[0]["unread_count"] == unread + 1
+    assert find(groups, group.id)["participants_count"] == participants + 2
+
+    await emit(fake_client, events.MessageRead, SimpleNamespace(
+        chat_id=utils.get_peer_id(channel), inbox=True, max_id=10_000,
+    ))
+    channels, _, _ = await dialog_cache.get_cached_dialogs(fake_client)
+    assert find(channels, channel.id)["unread_count"] == 0
+
+
+async def test_new_dialog_and_ttl_reload_snapshot(fake_client, monkeypatch):
+    await dialog_cache.get_cached_dialogs(fake_client)
+    pages = fake_client.requests["GetDialogs"]
+
+    await emit(fake_client, events.NewMessage, SimpleNamespace(chat_id=42, message=SimpleNamespace(id=1, out=False)))
+    await dialog_cache.get_cached_dialogs(fake_client)
+    assert fake_client.requests["GetDialogs"] == 2 * pages
+
+    monkeypatch.setattr(settings, "DIALOG_CACHE_TTL", 0)
+    await dialog_cache.get_cached_dialogs(fake_client)
+    assert fake_client.requests["GetDialogs"] == 3 * pages
+
+
+async def test_filters_are_cached_until_folders_change(fake_client):
+    groups_with_channels, _ = await get_dialog_filters(fake_client)
+    assert len(groups_with_channels) == len(fake_client.filters)
+    await get_dialog_filters(fake_client)
+    assert fake_client.requests["GetDialogFilters"] == 1
+
+    fake_client.filters = fake_client.filters[:1]
+    await emit(fake_client, events.Raw, types.UpdateDialogFilter(id=fake_client.filters[0].id))
+    groups_with_channels, _ = await get_dialog_filters(fake_client)
+    assert fake_client.requests["GetDialogFilters"] == 2
+    assert [group["filter_name"] for group in groups_with_channels] == [fake_client.filters[0].title]
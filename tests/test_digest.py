@@ -0,0 +1,33 @@
+import pytest
+from starlette.requests import Request
+from telethon import utils
+
+from app.routers import render_digest_form
+from app.schemas import DigestRequest
+from app.services.digest import resolve_digest_sources
+
+pytestmark = pytest.mark.anyio
+
+
+def sources(client):
+    return [client.channels[0], client.groups[0], client.users[0]]
+
+
+async def test_sources_of_every_dialog_type_are_resolved(fake_client):
+    entities = sources(fake_client)
+    request = DigestRequest(sources=[str(utils.get_peer_id(entity)) for entity in entities] + ["12345"])
+    assert await resolve_digest_sources(fake_client, request) == entities
+
+
+async def test_form_offers_full_peer_ids_after_error(fake_client):
+    from app.main import app
+
+    request = Request({
+        "type": "http", "method": "POST", "scheme": "http", "server": ("test", 80), "root_path": "",
+        "path": "/digest", "headers": [], "query_string": b"", "session": {}, "app": app, "router": app.router,
+    })
+    response = await render_digest_form(request, fake_client, "Ошибка: папка 1 не найдена.")
+    page = response.body.decode("utf-8")
+    assert "Ошибка: папка 1 не найдена." in page
+    for entity in sources(fake_client):
+        assert f'<option value="{utils.get_peer_id(entity)}">' in page
@@ -0,0 +1,58 @@
+import pytest
+from telethon import types, utils
+
+from app.config import settings
+from app.services.client_pool import client_pool
+from app.services.entity_resolver import _resolvers, get_entity_resolver
+
+pytestmark = pytest.mark.anyio
+
+
+def batch_requests(client) -> int:
+    return sum(client.requests[name] for name in ("GetChannels", "GetUsers", "GetChats"))
+
+
+async def test_peers_are_resolved_in_batches_and_cached(fake_client):
+    entities = [fake_client.channels[0], fake_client.channels[1], fake_client.groups[0], fake_client.users[0]]
+    peers = [utils.get_input_peer(entity) for entity in entities]
+    resolver = get_entity_resolver(fake_client)
+
+    resolved = await resolver.resolve(peers + peers[:1])
+    assert resolved == {utils.get_peer_id(entity): entity for entity in entities}
+    # Один запрос на тип пира, повтор пира не запрашивается
+    assert batch_requests(fake_client) == 3
+
+    assert await resolver.resolve(peers) == resolved
+    assert batch_requests(fake_client) == 3
+
+
+async def test_miss_requests_only_unknown_peers(fake_client):
+    resolver = get_entity_resolver(fake_client)
+    await resolver.resolve([utils.get_input_peer(fake_client.channels[0])])
+    await resolver.resolve([utils.get_input_peer(entity) for entity in fake_client.channels[:2]])
+    assert fake_client.requests["GetChannels"] == 2
+    assert batch_requests(fake_client) == 2
+
+
+async def test_self_peer_and_unknown_types(fake_client):
+    fake_client.user_id = fake_client.users[0].id
+    resolved = await get_entity_resolver(fake_client).resolve([types.InputPeerSelf(), types.InputPeerEmpty()])
+    assert resolved == {fake_client.user_id: fake_client.users[0]}
+
+
+async def test_cache_expires_after_ttl(fake_client, monkeypatch):
+    peers = [utils.get_input_peer(fake_client.channels[0])]
+    resolver = get_entity_resolver(fake_client)
+    await resolver.resolve(peers)
+    monkeypatch.setattr(settings, "DIALOG_CACHE_TTL", 0)
+    await resolver.resolve(peers)
+    assert fake_client.requests["GetChannels"] == 2
+
+
+async def test_resolver_is_dropped_with_client(fake_client):
+    resolver = get_entity_resolver(fake_client)
+    assert get_entity_resolver(fake_client) is resolver
+    for listener in client_pool._evict_listeners:
+        listener(fake_client)
+    assert fake_client not in _resolvers
+    assert get_entity_resolver(fake_client) is not resolver
@@ -0,0 +1,50 @@
+from app.services.chunking import count_tokens
+from app.services.extractive import compress_texts, split_sentences, summarize_texts
+
+TOPICS = ["релиз", "сервер", "оплата", "дизайн", "отпуск", "бюджет"]
+
+
+def topic_messages():
+    return [
+        f"Команда обсуждает {topic} в этом месяце очень подробно. "
+        f"Решение про {topic} примут на встрече в пятницу вечером. Ок!"
+        for topic in TOPICS
+    ]
+
+
+def test_split_sentences_keeps_message_numbers():
+    sentences = split_sentences(["Первое предложение. Второе!", "", "Третье\nчетвертое"])
+    assert [(sentence.message, sentence.text) for sentence in sentences] == [
+        (0, "Первое предложение."), (0, "Второе!"), (2, "Третье"), (2, "четвертое"),
+    ]
+
+
+def test_compress_returns_input_within_budget():
+    texts = topic_messages()
+    assert compress_texts(texts + [""], 10_000) == texts
+
+
+def test_compress_fits_budget_and_keeps_order():
+    texts = topic_messages()
+    budget = sum(count_tokens(text) for text in texts) // 3
+    compressed = compress_texts(texts, budget)
+    assert 0 < len(compressed) < len(texts)
+    assert sum(count_tokens(text) for text in compressed) <= budget
+    # Предложения берутся из исходных сообщений, сообщения идут в исходном порядке
+    positions = [next(i for i, text in enumerate(texts) if part.split(". ")[0] in text) for part in compressed]
+    assert positions == sorted(positions)
+
+
+def test_summary_skips_repeats_and_short_sentences():
+    repeated = "Сервер обновят в субботу ночью без простоя для пользователей."
+    texts = [repeated, repeated.replace("ночью", "ночью,"), "Спасибо!", *topic_messages()]
+    lines = summarize_texts(texts, max_sentences=5).splitlines()
+    assert 0 < len(lines) <= 5
+    assert all(line.startswith("• ") for line in lines)
+    assert sum("Сервер обновят" in line for line in lines) == 1
+    assert "• Спасибо!" not in lines
+    assert "• Ок!" not in lines
+
+
+def test_summary_of_nothing():
+    assert summarize_texts([]) == "Нет сообщений для суммаризации."
@@ -0,0 +1,58 @@
+import pytest
+
+from app.config import settings
+from app.services.archive import MessageArchive, _spans
+from app.services.fetcher import RangeFetcher
+
+pytestmark = pytest.mark.anyio
+
+
+def count_scans(client) -> list:
+    """Подменяет iter_messages клиента и записывает запрошенные диапазоны (min_id, max_id)"""
+    scans = []
+    iter_messages = client.iter_messages
+
+    def recording(entity, **kwargs):
+        scans.append((kwargs.get("min_id", 0), kwargs.get("max_id", 0)))
+        return iter_messages(entity, **kwargs)
+
+    client.iter_messages = recording
+    return scans
+
+
+async def collect(fetcher: RangeFetcher, low: int, high: int) -> list:
+    return [message.id async for batch in fetcher.fetch(low, high) for message in batch]
+
+
+async def test_sparse_ids_are_scanned_once(fake_client, monkeypatch):
+    # В личных чатах ID общие для всех диалогов аккаунта: диапазон большой, сообщений в нем мало
+    monkeypatch.setattr(settings, "FETCH_RANGE_SIZE", 50)
+    scans = count_scans(fake_client)
+    user = fake_client.users[0]
+    ids = await collect(RangeFetcher(fake_client, user), 0, 100_000)
+    assert ids == list(range(1, 301))
+    assert scans == [(0, 100_001)]
+    assert fake_client.requests["GetHistory"] == 3
+
+
+async def test_channel_range_is_split(fake_client, monkeypatch):
+    monkeypatch.setattr(settings, "FETCH_RANGE_SIZE", 50)
+    scans = count_scans(fake_client)
+    channel = fake_client.channels[0]
+    ids = await collect(RangeFetcher(fake_client, channel), 100, 300)
+    assert ids == list(range(101, 301))
+    assert sorted(scans) == [(100, 151), (150, 201), (200, 251), (250, 301)]
+
+
+@pytest.mark.usefixtures("database")
+async def test_refresh_head_uses_range_fetcher(fake_client, monkeypatch):
+    monkeypatch.setattr(settings, "FETCH_RANGE_SIZE", 50)
+    channel = fake_client.channels[0]
+    archive = MessageArchive(fake_client, channel)
+    await archive.ingest([], span=(0, 100))
+
+    scans = count_scans(fake_client)
+    assert await archive.refresh_head() == (0, 300)
+    # Первый запрос определяет самое новое сообщение, остальные загружают поддиапазоны
+    assert len(scans) == 1 + 4
+    assert await _spans(await archive._owner(), archive.peer_id) == [(0, 300)]
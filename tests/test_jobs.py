@@ -0,0 +1,53 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+from sqlalchemy import func, select
+
+from app.client_ai import SUMMARY_FAILED
+from app.database import AsyncSessionLocal
+from app.models import SummaryJob
+from app.schemas import SummarizeRequest
+from app.services import jobs
+from app.services.jobs import JobManager
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("database")]
+
+
+async def test_concurrent_identical_submits_create_one_job():
+    manager = JobManager(workers=1)
+    request = SummarizeRequest(source="1", summary_type="last_10")
+    job_ids = await asyncio.gather(*(manager.submit("session", request) for _ in range(5)))
+    assert len(set(job_ids)) == 1
+    async with AsyncSessionLocal() as db:
+        assert await db.scalar(select(func.count()).select_from(SummaryJob)) == 1
+
+
+async def test_finished_job_does_not_block_new_submit():
+    manager = JobManager(workers=1)
+    request = SummarizeRequest(source="1", summary_type="last_10")
+    first = await manager.submit("session", request)
+    async with AsyncSessionLocal() as db:
+        (await db.get(SummaryJob, first)).status = "done"
+        await db.commit()
+    assert await manager.submit("session", request) != first
+
+
+@pytest.mark.parametrize("summary, status", [(SUMMARY_FAILED, "failed"), ("итог", "done")])
+async def test_failed_summary_fails_job(monkeypatch, fake_client, summary, status):
+    @asynccontextmanager
+    async def leased_client(session_id):
+        yield fake_client
+
+    async def run_summary(user_client, summarize_request):
+        return summary
+
+    monkeypatch.setattr(jobs, "leased_client_for_session", leased_client)
+    monkeypatch.setattr(jobs, "run_summary", run_summary)
+    manager = JobManager(workers=1)
+    job_id = await manager.submit("session", SummarizeRequest(source="1", summary_type="last_10"))
+    await manager._run(job_id)
+    async with AsyncSessionLocal() as db:
+        job = await db.get(SummaryJob, job_id)
+    assert job.status == status
+    assert (job.result, job.error) == ((None, SUMMARY_FAILED) if status == "failed" else ("итог", None))
@@ -0,0 +1,48 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app.database import AsyncSessionLocal
+from app.models import UserSessionAccess
+from app.services.lifecycle import READY, Lifecycle, SessionActivityTracker
+from app.sessions import session_store
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("database")]
+
+
+async def test_recent_sessions_are_read_from_session_access():
+    for session_id in ("old", "recent", "latest"):
+        await session_store.save(session_id, "{}")
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(UserSessionAccess).where(UserSessionAccess.session_id == "old")
+                         .values(accessed_at=datetime.utcnow() - timedelta(days=2)))
+        await db.execute(update(UserSessionAccess).where(UserSessionAccess.session_id == "recent")
+                         .values(accessed_at=datetime.utcnow() - timedelta(hours=1)))
+        await db.commit()
+    tracker = SessionActivityTracker(interval=60, max_size=10)
+    assert await tracker.recent(24 * 60 * 60, 10) == ["latest", "recent"]
+
+    await tracker.touch("old")
+    assert await tracker.recent(24 * 60 * 60, 1) == ["old"]
+    # Удаленная сессия больше не подключается заранее
+    await session_store.delete("old")
+    assert "old" not in await tracker.recent(24 * 60 * 60, 10)
+
+
+async def test_ready_before_background_warmup(monkeypatch):
+    lifecycle = Lifecycle()
+    release = asyncio.Event()
+
+    async def slow_warmup():
+        await release.wait()
+
+    monkeypatch.setattr(lifecycle, "_warm_sessions", slow_warmup)
+    await lifecycle.startup()
+    assert lifecycle.status == READY
+    assert not lifecycle.warmed_up
+
+    release.set()
+    await lifecycle._warmup
+    assert lifecycle.warmed_up
@@ -0,0 +1,52 @@
+import base64
+
+import pytest
+from telethon import utils
+
+from app.services.message_pages import decode_cursor, encode_cursor, get_message_page
+
+PEER = -1001234567890
+
+
+@pytest.mark.parametrize("offset_id", [1, 7, 2 ** 31 - 1])
+def test_cursor_round_trip(offset_id):
+    cursor = encode_cursor(PEER, offset_id)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, PEER) == offset_id
+
+
+@pytest.mark.parametrize("cursor", [
+    "не base64",
+    "@@@@",
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+    base64.urlsafe_b64encode(b"abc:def").decode(),
+    base64.urlsafe_b64encode(f"{PEER}:5:6".encode()).decode(),
+    base64.urlsafe_b64encode(f"{PEER}".encode()).decode(),
+])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError, match="некорректный курсор"):
+        decode_cursor(cursor, PEER)
+
+
+@pytest.mark.parametrize("cursor", [
+    encode_cursor(PEER + 1, 5),
+    encode_cursor(-PEER, 5),
+    encode_cursor(PEER, 0),
+    encode_cursor(PEER, -5),
+])
+def test_cursor_of_other_dialog_is_rejected(cursor):
+    with pytest.raises(ValueError, match="другому диалогу"):
+        decode_cursor(cursor, PEER)
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("database")
+async def test_pages_follow_next_cursor(fake_client):
+    channel = fake_client.channels[0]
+    first = await get_message_page(fake_client, channel, limit=5)
+    second = await get_message_page(fake_client, channel, first.next_cursor, limit=5)
+
+    assert decode_cursor(first.next_cursor, utils.get_peer_id(channel)) == first.items[-1].id
+    assert second.items[0].id < first.items[-1].id
+    with pytest.raises(ValueError):
+        await get_message_page(fake_client, fake_client.channels[1], first.next_cursor, limit=5)
@@ -0,0 +1,110 @@
+import zlib
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.config import settings
+from app.database import Base, async_engine
+from app.services import pins
+from app.services.pins import PinScheduler, attach_pins, create_pin, find_precomputed, list_pins, next_run_at
+
+OWNER, OTHER_OWNER = 1, 2
+
+
+@pytest.fixture
+def moscow(monkeypatch):
+    monkeypatch.setattr(settings, "PIN_TIMEZONE", "Europe/Moscow")
+    monkeypatch.setattr(settings, "PIN_PRECOMPUTE_WINDOW", 3600)
+
+
+def lead(pin_id: int) -> timedelta:
+    return timedelta(seconds=zlib.crc32(str(pin_id).encode()) % 3600)
+
+
+def test_next_run_is_in_window_before_schedule(moscow):
+    # 09:00 по Москве - 06:00 UTC
+    assert next_run_at(7, "09:00", datetime(2024, 1, 1, 5, 0)) == datetime(2024, 1, 1, 6, 0) - lead(7)
+
+
+def test_passed_schedule_moves_to_next_day(moscow):
+    assert next_run_at(7, "09:00", datetime(2024, 1, 1, 7, 0)) == datetime(2024, 1, 2, 6, 0) - lead(7)
+    run_at = next_run_at(7, "09:00", datetime(2024, 1, 1, 6, 0) - lead(7))
+    assert run_at == datetime(2024, 1, 2, 6, 0) - lead(7)
+
+
+def test_same_schedule_is_spread_over_window(moscow):
+    after = datetime(2024, 1, 1)
+    runs = {next_run_at(pin_id, "09:00", after) for pin_id in range(1, 11)}
+    assert len(runs) > 1
+    assert all(datetime(2024, 1, 1, 5, 0) < run_at <= datetime(2024, 1, 1, 6, 0) for run_at in runs)
+
+
+@pytest.mark.parametrize("value", ["9", "25:00", "09:60", "утро"])
+def test_invalid_schedule_time(value):
+    with pytest.raises(ValueError):
+        next_run_at(1, value, datetime(2024, 1, 1))
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("database")
+async def test_pins_survive_relogin():
+    pin = await create_pin(OWNER, "old-session", "-1001", "Канал", "last_10", "09:00")
+    await pins._update(pin.id, summary="готово", computed_at=datetime.utcnow())
+    await create_pin(OTHER_OWNER, "other-session", "-1001", "Канал", "last_10", "09:00")
+
+    await attach_pins(OWNER, "new-session")
+
+    assert [(found.id, found.session_id) for found in await list_pins(OWNER)] == [(pin.id, "new-session")]
+    assert (await find_precomputed(OWNER, "-1001", "last_10")).summary == "готово"
+    assert [found.session_id for found in await list_pins(OTHER_OWNER)] == ["other-session"]
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("database")
+async def test_dead_session_suspends_pins_until_login(monkeypatch):
+    @asynccontextmanager
+    async def leased_client(session_id):
+        yield None
+
+    monkeypatch.setattr(pins, "leased_client_for_session", leased_client)
+    pin = await create_pin(OWNER, "expired-session", "-1001", "Канал", "last_10", "09:00")
+    await pins.run_pin_now(OWNER, pin.id)
+    await PinScheduler(concurrency=1).run_due()
+
+    [suspended] = await list_pins(OWNER)
+    assert suspended.session_id is None
+    assert await pins._due(datetime.utcnow() + timedelta(days=2), 10) == []
+
+    await attach_pins(OWNER, "new-session")
+    [resumed] = await list_pins(OWNER)
+    assert resumed.session_id == "new-session"
+    assert resumed.next_run_at <= datetime.utcnow()
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("database")
+async def test_legacy_pins_get_owner_from_session():
+    """Закрепления прежнего формата (по ID сессии) получают владельца при обращении из своей сессии"""
+    async with async_engine.begin() as conn:
+        await conn.exec_driver_sql("DROP TABLE pinned_sources")
+        await conn.exec_driver_sql(
+            "CREATE TABLE pinned_sources (id INTEGER PRIMARY KEY, session_id VARCHAR NOT NULL, "
+            "source VARCHAR NOT NULL, title VARCHAR NOT NULL, summary_type VARCHAR NOT NULL, "
+            "schedule_time VARCHAR(5) NOT NULL, next_run_at DATETIME NOT NULL, summary TEXT, error TEXT, "
+            "computed_at DATETIME, created_at DATETIME NOT NULL, UNIQUE (session_id, source, summary_type))"
+        )
+        await conn.exec_driver_sql("CREATE INDEX ix_pinned_sources_session_id ON pinned_sources (session_id)")
+        for pin_id, session_id, source in [(1, "legacy", "-1001"), (2, "legacy", "-1002"), (3, "other", "-1001")]:
+            await conn.exec_driver_sql(
+                f"INSERT INTO pinned_sources VALUES ({pin_id}, '{session_id}', '{source}', '', 'last_10', "
+                f"'09:00', '2024-01-01 00:00:00', NULL, NULL, NULL, '2024-01-01 00:00:00')"
+            )
+        await conn.run_sync(Base.metadata.create_all)
+    # Источник уже закреплен владельцем в другой сессии: закрепление прежнего формата - дубликат
+    await attach_pins(OWNER, "other")
+    await attach_pins(OWNER, "legacy")
+
+    assert sorted((pin.id, pin.session_id) for pin in await list_pins(OWNER)) == [(2, "legacy"), (3, "legacy")]
+    await create_pin(OWNER, "legacy", "-1001", "Канал", "last_10", "10:00")
+    assert len(await list_pins(OWNER)) == 2
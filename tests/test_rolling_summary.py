@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+from telethon import utils
+
+from app.services import rolling_summary
+from app.services.summarize import SummaryResult
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("database")]
+
+
+@pytest.fixture
+def summarized(monkeypatch):
+    """Тексты, переданные на map-этап, вместо обращения к OpenAI"""
+    calls = []
+
+    async def fake_map_reduce(texts):
+        calls.append(texts)
+        await asyncio.sleep(0.01)
+        return SummaryResult(summary=f"{len(texts)} сообщений", parts=1, failed=0)
+
+    async def fake_merge(rolling, delta):
+        return f"{rolling} + {delta}"
+
+    monkeypatch.setattr(rolling_summary, "map_reduce", fake_map_reduce)
+    monkeypatch.setattr(rolling_summary, "merge_summary", fake_merge)
+    return calls
+
+
+async def test_concurrent_runs_do_not_merge_messages_twice(fake_client, summarized):
+    channel = fake_client.channels[0]
+    first, second = await asyncio.gather(
+        rolling_summary.summarize_incrementally(fake_client, channel),
+        rolling_summary.summarize_incrementally(fake_client, channel),
+    )
+    # Вторая суммаризация ждет первую и уже не находит новых сообщений
+    assert len(summarized) == 1
+    assert first == second == f"{len(summarized[0])} сообщений"
+
+
+async def test_state_keyed_by_full_peer_id(fake_client, summarized):
+    channel = fake_client.channels[0]
+    await rolling_summary.summarize_incrementally(fake_client, channel)
+    owner_id = await fake_client.get_peer_id("me")
+    assert await rolling_summary._load_state(owner_id, utils.get_peer_id(channel))
+    assert await rolling_summary._load_state(owner_id, channel.id) is None
+
+
+async def test_failed_merge_keeps_state_and_retries_delta(fake_client, summarized, monkeypatch):
+    channel = fake_client.channels[0]
+    owner_id, peer_id = await fake_client.get_peer_id("me"), utils.get_peer_id(channel)
+    await rolling_summary._save_state(owner_id, peer_id, None, 200, "старое")
+    state = await rolling_summary._load_state(owner_id, peer_id)
+
+    async def failed_merge(rolling, delta):
+        return None
+
+    monkeypatch.setattr(rolling_summary, "merge_summary", failed_merge)
+    for _ in range(2):
+        shown = await rolling_summary.summarize_incrementally(fake_client, channel)
+        assert rolling_summary.MERGE_FAILED_NOTE in shown
+        assert await rolling_summary._load_state(owner_id, peer_id) == state
+    assert summarized[0] == summarized[1]
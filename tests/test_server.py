@@ -0,0 +1,53 @@
+import asyncio
+import signal
+import socket
+import time
+
+import httpx
+import pytest
+import uvicorn
+
+from app.config import settings
+from app.server import DrainingServer
+from app.services.lifecycle import lifecycle
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("database")]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_ready(client: httpx.AsyncClient):
+    for _ in range(100):
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise AssertionError("Приложение не запустилось")
+
+
+async def test_draining_is_visible_before_port_closes(monkeypatch):
+    from app.main import app
+
+    monkeypatch.setattr(settings, "SHUTDOWN_DRAIN_DELAY", 1.0)
+    monkeypatch.setattr(lifecycle.requests, "draining", False)
+    port = free_port()
+    server = DrainingServer(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+        await wait_ready(client)
+        signalled = time.monotonic()
+        server.handle_exit(signal.SIGTERM, None)
+
+        health = await client.get("/health")
+        assert health.status_code == 503
+        assert health.json()["status"] == "draining"
+        assert (await client.get("/")).status_code == 503
+
+        await asyncio.wait_for(serving, 30)
+    assert time.monotonic() - signalled >= settings.SHUTDOWN_DRAIN_DELAY
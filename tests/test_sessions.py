@@ -0,0 +1,78 @@
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from sqlalchemy import select, update
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app.database import AsyncSessionLocal
+from app.models import UserSession, UserSessionAccess
+from app.sessions import DatabaseSessionStore, ServerSessionMiddleware
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("database")]
+
+
+def make_app(store, refresh_interval=3600):
+    async def login(request):
+        request.session.regenerate()
+        request.session["session_str"] = "user"
+        return PlainTextResponse("ok")
+
+    async def start(request):
+        request.session["temp_session"] = "temp"
+        return PlainTextResponse("ok")
+
+    async def page(request):
+        return PlainTextResponse(request.session.get("session_str", ""))
+
+    app = Starlette(routes=[Route("/login", login), Route("/start", start), Route("/page", page)])
+    app.add_middleware(ServerSessionMiddleware, store=store, secret_key="test", refresh_interval=refresh_interval)
+    return app
+
+
+def client_for(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+async def test_login_rotates_session_id():
+    store = DatabaseSessionStore()
+    async with client_for(make_app(store)) as client:
+        await client.get("/start")
+        before = client.cookies["session"]
+        await client.get("/login")
+        after = client.cookies["session"]
+    assert before != after
+    old_id = before.rsplit(".", 2)[0]
+    assert await store.load(old_id) is None
+    assert "session_str" in await store.load(after.rsplit(".", 2)[0])
+
+
+async def test_cookie_refreshed_on_use(monkeypatch):
+    store = DatabaseSessionStore()
+    async with client_for(make_app(store, refresh_interval=60)) as client:
+        await client.get("/login")
+        response = await client.get("/page")
+        assert "set-cookie" not in response.headers
+        issued = time.time()
+        monkeypatch.setattr(time, "time", lambda: issued + 120)
+        response = await client.get("/page")
+        assert response.text == "user"
+        assert "set-cookie" in response.headers
+
+
+async def test_cleanup_removes_only_expired_sessions():
+    store = DatabaseSessionStore()
+    await store.save("fresh", "{}")
+    await store.save("old", "{}")
+    async with AsyncSessionLocal() as db:
+        # Сессия, сохраненная до появления учета обращений
+        db.add(UserSession(session_id="legacy", session_data="{}"))
+        await db.execute(update(UserSessionAccess).where(UserSessionAccess.session_id == "old")
+                         .values(accessed_at=datetime.utcnow() - timedelta(days=30)))
+        await db.commit()
+    assert await store.cleanup(14 * 24 * 3600) == ["old"]
+    async with AsyncSessionLocal() as db:
+        assert set(await db.scalars(select(UserSession.session_id))) == {"fresh", "legacy"}
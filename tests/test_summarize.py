@@ -0,0 +1,46 @@
+import pytest
+
+from app.client_ai import MERGE_PROMPT
+from app.config import settings
+from app.services import summarize
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("database")]
+
+TEXTS = [f"сообщение {i} " + "слово " * 40 for i in range(20)]
+
+
+@pytest.fixture
+def requests(monkeypatch):
+    """Запросы к OpenAI (текст, промпт) вместо обращения к API"""
+    calls = []
+
+    async def fake_request_summary(text, prompt=summarize.SUMMARIZE_PROMPT):
+        calls.append((text, prompt))
+        if "сообщение 7 " in text:
+            raise RuntimeError("ошибка OpenAI")
+        return "свод" if prompt == MERGE_PROMPT else f"часть {len(calls)}"
+
+    monkeypatch.setattr(summarize, "request_summary", fake_request_summary)
+    monkeypatch.setattr(settings, "SUMMARY_CHUNK_TOKENS", 200)
+    monkeypatch.setattr(settings, "SUMMARY_MAX_RETRIES", 1)
+    monkeypatch.setattr(settings, "SUMMARY_RETRY_BACKOFF", 0.0)
+    monkeypatch.setattr(settings, "SUMMARY_OFFLINE_FALLBACK", False)
+    return calls
+
+
+async def test_long_input_is_split_and_merged(requests):
+    result = await summarize.map_reduce(TEXTS)
+    assert result.parts > 1
+    # Часть с сообщением 7 не удалась после повторов, остальные объединены
+    assert result.failed == 1
+    assert result.summary == "свод"
+    map_calls = [text for text, prompt in requests if prompt != MERGE_PROMPT]
+    assert len(map_calls) == result.parts + settings.SUMMARY_MAX_RETRIES
+    assert any(prompt == MERGE_PROMPT for _, prompt in requests)
+
+
+async def test_default_budget_keeps_chunking(requests):
+    # Локальное сжатие по умолчанию выключено и не сводит вход к одной части
+    assert not settings.EXTRACTIVE_BUDGET_TOKENS
+    result = await summarize.map_reduce(TEXTS)
+    assert result.parts > 1
@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import func, select
+from telethon import types
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import SummaryCacheEntry
+from app.services import summary_cache
+from app.services.summary_cache import cache_summary, get_cached_summary, range_key, request_key
+from benchmarks.fake_telegram import FakeTelegramClient
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("database")]
+
+
+def messages(*ids):
+    return [SimpleNamespace(id=message_id) for message_id in ids]
+
+
+async def test_request_key_differs_between_accounts(profile):
+    alice, bob = FakeTelegramClient(profile, user_id=1), FakeTelegramClient(profile, user_id=2)
+    # Личный чат с тем же ID и те же ID сообщений у двух разных аккаунтов
+    chat = alice.users[0]
+    alice_key = await request_key(alice, chat, messages(10, 11, 12))
+    bob_key = await request_key(bob, chat, messages(10, 11, 12))
+    assert alice_key != bob_key
+    assert alice_key == await request_key(alice, chat, messages(12, 11, 10))
+
+    await cache_summary(alice_key, "сводка Алисы")
+    assert await get_cached_summary(alice_key) == "сводка Алисы"
+    assert await get_cached_summary(bob_key) is None
+
+
+async def test_key_uses_full_peer_id(fake_client):
+    # Пользователь и канал могут иметь одинаковый «сырой» ID
+    user = fake_client.users[0]
+    channel = types.Channel(id=user.id, title="Канал", photo=types.ChatPhotoEmpty(), date=None)
+    assert await range_key(fake_client, user, 0, 10) != await range_key(fake_client, channel, 0, 10)
+
+
+async def test_key_depends_on_text_preparation(fake_client, monkeypatch):
+    channel = fake_client.channels[0]
+    key = await range_key(fake_client, channel, 0, 10)
+    monkeypatch.setattr(settings, "DEDUP_ENABLED", False)
+    without_dedup = await range_key(fake_client, channel, 0, 10)
+    monkeypatch.setattr(settings, "EXTRACTIVE_BUDGET_TOKENS", 4000)
+    compressed = await range_key(fake_client, channel, 0, 10)
+    assert len({key, without_dedup, compressed}) == 3
+
+
+async def test_recent_hit_does_not_write():
+    await cache_summary("key", "сводка")
+    async with AsyncSessionLocal() as db:
+        accessed_at = (await db.get(SummaryCacheEntry, "key")).accessed_at
+    assert await get_cached_summary("key") == "сводка"
+    async with AsyncSessionLocal() as db:
+        assert (await db.get(SummaryCacheEntry, "key")).accessed_at == accessed_at
+
+
+async def test_eviction_runs_in_batches(monkeypatch):
+    monkeypatch.setattr(settings, "SUMMARY_CACHE_MAX_ENTRIES", 3)
+    monkeypatch.setattr(summary_cache, "EVICT_EVERY", 5)
+    monkeypatch.setattr(summary_cache, "_puts_since_evict", 0)
+
+    async def count():
+        async with AsyncSessionLocal() as db:
+            return await db.scalar(select(func.count()).select_from(SummaryCacheEntry))
+
+    for index in range(4):
+        await cache_summary(f"key-{index}", "сводка")
+    assert await count() == 4
+    await cache_summary("key-4", "сводка")
+    assert await count() == 3
+    # Вытесняются самые давно использованные записи
+    assert await get_cached_summary("key-0") is None
+    assert await get_cached_summary("key-4") == "сводка"